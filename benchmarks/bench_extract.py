@@ -0,0 +1,299 @@
+"""
+Benchmark: single-pass scan (scan_tweet_json) vs. the previous regex scans
+over the raw response text in extract_mp4s / get_associated_media_id / repost_check.
+
+Runs offline on synthetic TweetDetail-like thread responses (every reply has a
+video, every fifth reposts one) and reports the time and the peak memory
+allocated (tracemalloc) for the regex version, the scan of the raw text (what
+download_video passes) and the walk over an already-parsed response.
+
+Usage:
+    python benchmarks/bench_extract.py [--replies 50 200 1000] [--repeat 20]
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from src.twitter_video_dl.tweet_scan import scan_tweet_json  # noqa: E402
+from src.twitter_video_dl.twitter_video_dl import (  # noqa: E402
+    extract_mp4s,
+    get_tweet_status_id,
+    repost_check,
+)
+
+TWEET_ID = "1700000000000000000"
+TWEET_URL = f"https://x.com/user/status/{TWEET_ID}"
+
+
+# --- previous regex implementation, kept here for comparison ---------------
+
+
+def legacy_get_associated_media_id(j, tweet_url):
+    sid = get_tweet_status_id(tweet_url)
+    pattern = (
+        r'"expanded_url"\s*:\s*"https://(?:x\.com|twitter\.com)/[^/]+/status/'
+        + sid
+        + r'/[^"]+",\s*"id_str"\s*:\s*"\d+",'
+    )
+    matches = re.findall(pattern, j)
+    if len(matches) > 0:
+        target = matches[0]
+        target = target[0 : len(target) - 1]
+        return json.loads("{" + target + "}")["id_str"]
+    return None
+
+
+def legacy_extract_mp4s(j, tweet_url, target_all_mp4s=False):
+    amplitude_pattern = re.compile(
+        r"(https://video.twimg.com/amplify_video/(\d+)/vid/(\d+x\d+)/[^.]+.mp4\?tag=\d+)"
+    )
+    ext_tw_pattern = re.compile(
+        r"(https://video.twimg.com/ext_tw_video/(\d+)/pu/vid/(avc1/)?(\d+x\d+)/[^.]+.mp4\?tag=\d+)"
+    )
+    tweet_video_pattern = re.compile(r'https://video.twimg.com/tweet_video/[^"]+')
+    container_pattern = re.compile(r'https://video.twimg.com/[^"]*container=fmp4')
+    media_id = legacy_get_associated_media_id(j, tweet_url)
+    matches = amplitude_pattern.findall(j)
+    matches += ext_tw_pattern.findall(j)
+    container_matches = container_pattern.findall(j)
+    tweet_video_matches = tweet_video_pattern.findall(j)
+
+    if len(matches) == 0 and len(tweet_video_matches) > 0:
+        return tweet_video_matches
+
+    results = {}
+    for match in matches:
+        url, tweet_id, _, resolution = match
+        if tweet_id not in results:
+            results[tweet_id] = {"resolution": resolution, "url": url}
+        else:
+            my_dims = [int(x) for x in resolution.split("x")]
+            their_dims = [int(x) for x in results[tweet_id]["resolution"].split("x")]
+            if my_dims[0] * my_dims[1] > their_dims[0] * their_dims[1]:
+                results[tweet_id] = {"resolution": resolution, "url": url}
+
+    if media_id:
+        all_urls = []
+        for twid in results:
+            all_urls.append(results[twid]["url"])
+        all_urls += container_matches
+        url_with_media_id = []
+        for url in all_urls:
+            if url.__contains__(media_id):
+                url_with_media_id.append(url)
+        if len(url_with_media_id) > 0:
+            return url_with_media_id
+
+    if len(container_matches) > 0 and not target_all_mp4s:
+        return container_matches
+    if target_all_mp4s:
+        urls = [x["url"] for x in results.values()]
+        urls += container_matches
+        return urls
+    return [x["url"] for x in results.values()]
+
+
+def legacy_repost_check(j, exclude_replies=True):
+    try:
+        reply_index = j.index('"conversationthread-')
+    except ValueError:
+        reply_index = len(j)
+    if exclude_replies:
+        j = j[0:reply_index]
+
+    source_status_pattern = r'"source_status_id_str"\s*:\s*"\d+"'
+    matches = re.findall(source_status_pattern, j)
+
+    if len(matches) > 0 and exclude_replies:
+        ssid = json.loads("{" + matches[0] + "}")["source_status_id_str"]
+        expanded_url_pattern = (
+            r'"expanded_url"\s*:\s*"https://(?:x\.com|twitter\.com)/[^/]+/status/'
+            + ssid
+            + '[^"]+"'
+        )
+        matches2 = re.findall(expanded_url_pattern, j)
+        if len(matches2) > 0:
+            return json.loads("{" + matches2[0] + "}")["expanded_url"]
+
+    if not exclude_replies:
+        ssids = []
+        for match in matches:
+            ssids.append(json.loads("{" + match + "}")["source_status_id_str"])
+        ssids = list(set(ssids))
+        for ssid in ssids:
+            expanded_url_pattern = (
+                r'"expanded_url"\s*:\s*"https://(?:x\.com|twitter\.com)/[^/]+/status/'
+                + ssid
+                + '[^"]+"'
+            )
+            matches2 = re.findall(expanded_url_pattern, j)
+            if len(matches2) > 0:
+                status_urls = []
+                for match in matches2:
+                    status_urls.append(json.loads("{" + match + "}")["expanded_url"])
+                return list(set(status_urls))
+    return None
+
+
+# --- synthetic responses ------------------------------------------------------
+
+
+def make_media(tweet_id, media_id, source_status_id=None):
+    media = {
+        "display_url": "pic.x.com/abcdefgh",
+        "expanded_url": f"https://x.com/user/status/{source_status_id or tweet_id}/video/1",
+        "id_str": media_id,
+        "indices": [0, 23],
+        "media_key": f"7_{media_id}",
+        "media_url_https": f"https://pbs.twimg.com/ext_tw_video_thumb/{media_id}/pu/img/thumb.jpg",
+        "type": "video",
+        "video_info": {
+            "aspect_ratio": [16, 9],
+            "variants": [
+                {
+                    "content_type": "application/x-mpegURL",
+                    "url": f"https://video.twimg.com/ext_tw_video/{media_id}/pu/pl/playlist.m3u8?tag=12&container=fmp4",
+                },
+                {
+                    "bitrate": 256000,
+                    "content_type": "video/mp4",
+                    "url": f"https://video.twimg.com/ext_tw_video/{media_id}/pu/vid/480x270/low.mp4?tag=12",
+                },
+                {
+                    "bitrate": 2176000,
+                    "content_type": "video/mp4",
+                    "url": f"https://video.twimg.com/ext_tw_video/{media_id}/pu/vid/1280x720/high.mp4?tag=12",
+                },
+            ],
+        },
+    }
+    if source_status_id:
+        media["source_status_id_str"] = source_status_id
+    return media
+
+
+def make_entry(entry_id, tweet_id, media_id, source_status_id=None):
+    media = make_media(tweet_id, media_id, source_status_id)
+    return {
+        "entryId": entry_id,
+        "sortIndex": tweet_id,
+        "content": {
+            "itemContent": {
+                "tweet_results": {
+                    "result": {
+                        "rest_id": tweet_id,
+                        "legacy": {
+                            "full_text": "lorem ipsum dolor sit amet " * 8,
+                            "entities": {"media": [media]},
+                            "extended_entities": {"media": [media]},
+                            "favorite_count": 123,
+                            "retweet_count": 45,
+                        },
+                    }
+                }
+            }
+        },
+    }
+
+
+def make_thread_response(replies):
+    entries = [make_entry(f"tweet-{TWEET_ID}", TWEET_ID, "1700000000000000001")]
+    for i in range(replies):
+        tweet_id = str(1710000000000000000 + i)
+        media_id = str(1720000000000000000 + i)
+        # Every fifth reply reposts a video from another tweet
+        source = str(1730000000000000000 + i) if i % 5 == 0 else None
+        entries.append(
+            make_entry(f"conversationthread-{tweet_id}", tweet_id, media_id, source)
+        )
+    return json.dumps(
+        {
+            "data": {
+                "threaded_conversation_with_injections_v2": {
+                    "instructions": [{"type": "TimelineAddEntries", "entries": entries}]
+                }
+            }
+        }
+    )
+
+
+# --- measurement --------------------------------------------------------------
+
+
+def run_legacy(text):
+    return (
+        legacy_extract_mp4s(text, TWEET_URL),
+        legacy_extract_mp4s(text, TWEET_URL, True),
+        legacy_repost_check(text),
+        legacy_repost_check(text, exclude_replies=False),
+    )
+
+
+def run_scan(j):
+    # j is the raw text or the already-parsed response
+    scan = scan_tweet_json(j)
+    return (
+        extract_mp4s(scan, TWEET_URL),
+        extract_mp4s(scan, TWEET_URL, True),
+        repost_check(scan),
+        repost_check(scan, exclude_replies=False),
+    )
+
+
+def measure(func, j, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(j)
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    func(j)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(timings), peak
+
+
+def normalize(result):
+    # repost_check(exclude_replies=False) returns a set-ordered list
+    return tuple(sorted(r) if isinstance(r, list) else r for r in result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--replies", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print("time: best of --repeat runs, peak: tracemalloc peak of one run")
+    print(
+        f"{'replies':>7} {'size':>8} | {'regex (text)':>20} | "
+        f"{'scan (text)':>20} | {'walk (parsed)':>20}"
+    )
+    for replies in args.replies:
+        text = make_thread_response(replies)
+        parsed = json.loads(text)
+        expected = normalize(run_legacy(text))
+        assert normalize(run_scan(text)) == expected, (
+            f"Results differ for {replies} replies"
+        )
+        assert normalize(run_scan(parsed)) == expected, (
+            f"Results differ for {replies} replies"
+        )
+
+        columns = []
+        for func, j in ((run_legacy, text), (run_scan, text), (run_scan, parsed)):
+            elapsed, peak = measure(func, j, args.repeat)
+            columns.append(f"{elapsed * 1000:>8.2f}ms {peak / 1024:>7.0f}KiB")
+        print(f"{replies:>7} {len(text) / 1024:>5.0f}KiB | " + " | ".join(columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Benchmark: streaming write throughput (MB/s) against a local HTTP server.
+
+Compares the previous write loops with transfer.copy_body, for requests and
+for curl_cffi:
+
+- iter_content() per chunk (previous download_videos / get_img; 1-byte
+  chunks under requests)
+- iter_content(chunk_size=1024) with a flush per chunk (previous
+  download_video / download_parts)
+- copy_body (readinto a reusable buffer with requests, coalesced chunks with
+  curl_cffi, preallocated file, no per-chunk flush)
+
+Usage:
+    python benchmarks/bench_stream.py [--size-mb 256] [--small-size-mb 1] [--repeat 3]
+
+The 1-byte requests loop is far too slow for large files, so it runs on
+--small-size-mb and is reported per MB like the others.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+import warnings
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import requests  # noqa: E402
+
+from src.twitter_video_dl.transfer import copy_body, preallocate  # noqa: E402
+
+try:
+    from curl_cffi import requests as curl_requests
+except ImportError:
+    curl_requests = None
+
+PAYLOADS = {}
+
+
+class PayloadHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        payload = PAYLOADS[self.path]
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        view = memoryview(payload)
+        for start in range(0, len(payload), 1024 * 1024):
+            self.wfile.write(view[start : start + 1024 * 1024])
+
+    def log_message(self, format, *args):
+        pass
+
+
+def write_iter_content(response, path):
+    with open(path, "wb") as f:
+        for chunk in response.iter_content():
+            if chunk:
+                f.write(chunk)
+
+
+def write_1k_flush(response, path):
+    with open(path, "wb") as f:
+        for chunk in response.iter_content(chunk_size=1024):
+            if chunk:
+                f.write(chunk)
+                f.flush()
+
+
+def write_copy_body(response, path):
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        preallocate(fd, int(response.headers["Content-Length"]))
+        copy_body(response, fd)
+    finally:
+        os.close(fd)
+
+
+def measure(session, url, size, writer, repeat):
+    best = None
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "out.bin")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            response = session.get(url, stream=True)
+            try:
+                writer(response, path)
+            finally:
+                response.close()
+            elapsed = time.perf_counter() - start
+            assert os.path.getsize(path) == size, "Incomplete download"
+            best = elapsed if best is None else min(best, elapsed)
+    return size / best / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=256)
+    parser.add_argument("--small-size-mb", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    PAYLOADS["/large"] = os.urandom(args.size_mb * 1024 * 1024)
+    PAYLOADS["/small"] = os.urandom(args.small_size_mb * 1024 * 1024)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PayloadHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    sessions = [("requests", requests.Session())]
+    if curl_requests is not None:
+        sessions.append(("curl_cffi", curl_requests.Session()))
+
+    cases = [
+        ("iter_content()", write_iter_content),
+        ("chunk_size=1024 + flush", write_1k_flush),
+        ("copy_body", write_copy_body),
+    ]
+
+    # curl_cffi warns that chunk_size is ignored
+    warnings.simplefilter("ignore")
+    print(f"{'client':<10} {'write loop':<24} {'size':>7} {'MB/s':>9}")
+    try:
+        for client_name, session in sessions:
+            for case_name, writer in cases:
+                path = "/large"
+                if client_name == "requests" and writer is write_iter_content:
+                    path = "/small"
+                size = len(PAYLOADS[path])
+                mbps = measure(session, base + path, size, writer, args.repeat)
+                print(
+                    f"{client_name:<10} {case_name:<24} {size >> 20:>5}MB {mbps:>9.1f}"
+                )
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,452 @@
+"""
+asyncio API built on curl_cffi's AsyncSession.
+
+It mirrors the synchronous pipeline in twitter_video_dl (same settings, token
+cache, main.js cache and learned GraphQL schema), so a single event loop can
+drive many tweet downloads concurrently:
+
+    asyncio.run(download_video_for_sc_async(tweet_url, "name"))
+    asyncio.run(download_videos_for_sc_async([(tweet_url, "name"), ...]))
+
+Unlike the synchronous functions, existing files are overwritten without
+asking, since there is no terminal to prompt on.
+"""
+
+import asyncio
+import functools
+import json
+import os
+import re
+
+from . import twitter_video_dl as tvdl
+from .hedging import run_hedged_async
+from .metadata_cache import NEGATIVE
+
+
+async def fetch_syndication_endpoint_async(api_url, session):
+    """Async version of fetch_syndication_endpoint."""
+    tvdl.debug_write_log(f"Trying API: {api_url}", tvdl.debug_option)
+
+    response = await session.get(api_url, headers=tvdl.SYNDICATION_HEADERS)
+
+    tvdl.debug_write_log(f"API status: {response.status_code}", tvdl.debug_option)
+
+    if response.status_code == 200:
+        try:
+            data = response.json()
+        except json.JSONDecodeError:
+            tvdl.debug_write_log(
+                f"Failed to parse JSON from {api_url}", tvdl.debug_option
+            )
+            return None
+        if data and (isinstance(data, dict) and len(data) > 0):
+            return data
+
+    return None
+
+
+async def get_tweet_details_syndication_async(tweet_url, session):
+    """Async version of get_tweet_details_syndication."""
+    tweet_url = tweet_url.replace("https://twitter.com", "https://x.com")
+
+    tweet_id = re.findall(r"(?<=status/)\d+", tweet_url)
+
+    assert tweet_id is not None and len(tweet_id) == 1, (
+        f"Could not parse tweet id from your url. Tweet url: {tweet_url}"
+    )
+
+    for api_url in tvdl.get_syndication_api_urls(tweet_id[0]):
+        data = await fetch_syndication_endpoint_async(api_url, session)
+        if data is not None:
+            return data
+
+    assert False, (
+        f"Failed to get tweet details from any Syndication API endpoint. Tweet url: {tweet_url}"
+    )
+
+
+async def get_tokens_async(tweet_url):
+    """Async version of get_tokens."""
+    tweet_url = tweet_url.replace("https://twitter.com", "https://x.com")
+
+    # Own session (cookie jar) for the token flow
+    async with tvdl.http_client.new_async_session() as session:
+        session.headers.update(tvdl.TOKEN_HEADERS)
+
+        response = await session.get(tweet_url)
+
+        assert response.status_code == 200, (
+            f"Failed to get tweet page. Status code: {response.status_code}. Tweet url: {tweet_url}"
+        )
+
+        redirect_url, tok = tvdl.find_redirect_url(response.text, tweet_url)
+
+        response = await session.get(redirect_url, allow_redirects=False)
+
+        assert response.status_code == 200, (
+            f"Failed to get redirect page. Status code: {response.status_code}. Redirect URL: {redirect_url}"
+        )
+
+        auth_params = tvdl.get_migrate_params(response.text, tok)
+        if auth_params:
+            response = await session.post(
+                tvdl.MIGRATE_URL, data=auth_params, allow_redirects=True
+            )
+
+            assert response.status_code == 200, (
+                f"Failed to authenticate. Status code: {response.status_code}. Auth URL: {tvdl.MIGRATE_URL}"
+            )
+        else:
+            response = await session.get(redirect_url)
+
+        mainjs_url = tvdl.find_mainjs_url(response.text)
+
+        assert mainjs_url is not None, (
+            f"Failed to find main.js file. Tweet url: {tweet_url}"
+        )
+
+        cached = await asyncio.to_thread(tvdl.mainjs_cache.get, mainjs_url)
+        if cached is None:
+            mainjs = await session.get(mainjs_url)
+
+            assert mainjs.status_code == 200, (
+                f"Failed to get main.js file. Status code: {mainjs.status_code}. Tweet url: {tweet_url}"
+            )
+
+            bearer_token, query_ids = tvdl.parse_mainjs(mainjs.text)
+
+            assert bearer_token is not None and len(bearer_token) > 0, (
+                f"Failed to find bearer token. Tweet url: {tweet_url}, main.js url: {mainjs_url}"
+            )
+
+            await asyncio.to_thread(
+                tvdl.mainjs_cache.put, mainjs_url, bearer_token, query_ids
+            )
+        else:
+            bearer_token, query_ids = cached
+
+        query_id = query_ids.get("TweetResultByRestId")
+
+        assert query_id is not None, (
+            f"Failed to find query ID in main.js. Tweet url: {tweet_url}, main.js url: {mainjs_url}"
+        )
+
+        guest_token = await activate_guest_token_async(bearer_token, session)
+
+    return bearer_token, guest_token, query_id
+
+
+async def activate_guest_token_async(bearer_token, session):
+    response = await session.post(
+        "https://api.twitter.com/1.1/guest/activate.json",
+        headers={"authorization": f"Bearer {bearer_token}"},
+    )
+
+    assert response.status_code == 200, (
+        f"Failed to activate guest token. Status code: {response.status_code}"
+    )
+
+    return response.json()["guest_token"]
+
+
+async def get_cached_tokens_async(tweet_url, force_refresh=False):
+    """Async version of get_cached_tokens (same token cache and guest token pool).
+
+    The token cache is a locked file, read and written off the event loop.
+    """
+    tokens = None if force_refresh else await asyncio.to_thread(tvdl.token_cache.get)
+    if tokens is None:
+        tokens = await get_tokens_async(tweet_url)
+        await asyncio.to_thread(tvdl.token_cache.put, *tokens)
+
+    bearer_token, guest_token, query_id = tokens
+    tvdl.guest_token_pool.add(bearer_token, guest_token)
+    # acquire only blocks (activating a token) when the pool is empty
+    guest_token = await asyncio.to_thread(tvdl.guest_token_pool.acquire, bearer_token)
+    return bearer_token, guest_token, query_id
+
+
+async def request_graphql_async(session, build_url, headers, tweet_url):
+    """Async version of request_graphql."""
+    features, variables = tvdl.request_schema.snapshot()
+    details = await session.get(build_url(features, variables), headers=headers)
+
+    if tvdl.is_guest_token_rejected(details):
+        raise tvdl.GuestTokenRejectedError(
+            f"Guest token was rejected. Status code: {details.status_code}. Tweet url: {tweet_url}"
+        )
+
+    max_retries = 10
+    cur_retry = 0
+    while details.status_code == 400 and cur_retry < max_retries:
+        try:
+            error_json = json.loads(details.text)
+        except json.JSONDecodeError:
+            assert False, (
+                f"Failed to parse json from details error. details text: {details.text}  Status code: {details.status_code}.  Tweet url: {tweet_url}"
+            )
+
+        assert "errors" in error_json, (
+            f"Failed to find errors in details error json.  Status code: {details.status_code}.  Tweet url: {tweet_url}"
+        )
+
+        learned = tvdl.request_schema.learn(error_json)
+        used = (features, variables)
+        features, variables = tvdl.request_schema.snapshot()
+        if not learned and (features, variables) == used:
+            break
+
+        details = await session.get(build_url(features, variables), headers=headers)
+        cur_retry += 1
+
+        if details.status_code == 200:
+            tvdl.request_schema.save()
+
+    assert details.status_code == 200, (
+        f"Failed to get tweet details.  Status code: {details.status_code}.  Tweet url: {tweet_url}"
+    )
+
+    return details
+
+
+async def get_tweet_details_async(tweet_url, session):
+    """
+    GraphQL lookup with cached tokens, retrying with another guest token (and then fresh tokens) when the guest token is rejected.
+    """
+    tweet_id = re.findall(r"(?<=status/)\d+", tweet_url)
+
+    assert tweet_id is not None and len(tweet_id) == 1, (
+        f"Could not parse tweet id from your url. Tweet url: {tweet_url}"
+    )
+
+    async def fetch(guest_token, bearer_token, query_id):
+        return await request_graphql_async(
+            session,
+            lambda features, variables: tvdl.get_details_url(
+                tweet_id[0], features, variables, query_id
+            ),
+            tvdl.get_graphql_headers(guest_token, bearer_token),
+            tweet_url,
+        )
+
+    bearer_token, guest_token, query_id = await get_cached_tokens_async(tweet_url)
+    for force_refresh in (False, True):
+        try:
+            return await fetch(guest_token, bearer_token, query_id)
+        except tvdl.GuestTokenRejectedError:
+            tvdl.guest_token_pool.retire(guest_token)
+            await asyncio.to_thread(tvdl.token_cache.invalidate, guest_token)
+            if force_refresh:
+                bearer_token, guest_token, query_id = await get_cached_tokens_async(
+                    tweet_url, force_refresh=True
+                )
+            else:
+                guest_token = await asyncio.to_thread(
+                    tvdl.guest_token_pool.acquire, bearer_token
+                )
+                await asyncio.to_thread(
+                    tvdl.token_cache.put, bearer_token, guest_token, query_id
+                )
+    return await fetch(guest_token, bearer_token, query_id)
+
+
+async def download_file_async(session, url, output_file_name, buffer_bytes=1024 * 1024):
+    """
+    Stream url into <output_file_name>.part and rename it into place once complete.  Returns True on success.
+    Chunks are collected up to buffer_bytes and written from a worker thread, so the event loop never waits for the disk.  A failed or cancelled transfer removes the .part file.
+    """
+    if await asyncio.to_thread(tvdl.media_store.fetch, url, output_file_name):
+        return True
+    async with session.stream("GET", url) as response:
+        if response.status_code != 200:
+            print(f"Failed to download from {url}. Status code: {response.status_code}")
+            return False
+        part_path = f"{output_file_name}.part"
+        f = await asyncio.to_thread(open, part_path, "wb")
+        try:
+            buffer = bytearray()
+            async for chunk in response.aiter_content():
+                if chunk:
+                    buffer += chunk
+                    if len(buffer) >= buffer_bytes:
+                        await asyncio.to_thread(f.write, bytes(buffer))
+                        buffer.clear()
+                    # Shares the process-wide bandwidth limit with the sync downloads
+                    delay = tvdl.bandwidth_limiter.reserve(url, len(chunk))
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+            await asyncio.to_thread(f.write, bytes(buffer))
+            await asyncio.to_thread(f.close)
+        except BaseException:
+            f.close()
+            os.remove(part_path)
+            raise
+    await asyncio.to_thread(os.replace, part_path, output_file_name)
+    await asyncio.to_thread(tvdl.media_store.add, url, output_file_name)
+    return True
+
+
+async def convert_to_gif_async(filename):
+    # Shares the process-wide limit on concurrent ffmpeg processes
+    success = await asyncio.wrap_future(
+        tvdl.transcode_queue.submit(f"{filename}.mp4", f"{filename}.gif")
+    )
+    tvdl.print_gif_converted(filename, success)
+
+
+async def download_videos_async(
+    video_urls, output_file, output_folder_path, gif_ptn, session
+):
+    """Async version of download_videos; all videos of the tweet are fetched concurrently."""
+    os.makedirs(output_folder_path, exist_ok=True)
+    num = len(video_urls)
+
+    async def download_one(i, video_url):
+        filename = tvdl.get_output_filename(output_file, output_folder_path, num, i)
+        if await download_file_async(session, video_url, f"{filename}.mp4"):
+            print(f"Video {filename}.mp4 downloaded successfully.")
+            if gif_ptn and tvdl.convert_gif_flag:
+                await convert_to_gif_async(filename)
+
+    await asyncio.gather(
+        *(download_one(i, url) for i, url in enumerate(video_urls, start=1))
+    )
+
+
+async def get_img_async(urls, file_name, output_folder_path, session):
+    """Async version of get_img; all images of the tweet are fetched concurrently."""
+    os.makedirs(output_folder_path, exist_ok=True)
+    num = len(urls)
+
+    async def download_one(i, url):
+        filename = tvdl.get_output_filename(file_name, output_folder_path, num, i)
+        if await download_file_async(session, url, f"{filename}.jpg"):
+            print(f"Image {filename}.jpg downloaded successfully.")
+
+    await asyncio.gather(*(download_one(i, url) for i, url in enumerate(urls, start=1)))
+
+
+async def fetch_tweet_data_async(tweet_url, tweet_id, session):
+    """
+    Async version of fetch_tweet_data.  When hedging, losing requests are cancelled as soon as one path answers.
+    """
+    if not tvdl.hedge_enabled:
+        try:
+            return "syndication", await get_tweet_details_syndication_async(
+                tweet_url, session
+            )
+        except Exception as e:
+            tvdl.debug_write_log(
+                f"Syndication API failed: {e}. Falling back to GraphQL API.",
+                tvdl.debug_option,
+            )
+            resp = await get_tweet_details_async(tweet_url, session)
+            return "graphql", json.loads(resp.text)
+
+    async def syndication_leg(api_url):
+        data = await fetch_syndication_endpoint_async(api_url, session)
+        return None if data is None else ("syndication", data)
+
+    async def graphql_leg():
+        resp = await get_tweet_details_async(tweet_url, session)
+        return "graphql", json.loads(resp.text)
+
+    legs = [
+        functools.partial(syndication_leg, api_url)
+        for api_url in tvdl.get_syndication_api_urls(tweet_id)
+    ]
+    legs.append(graphql_leg)
+
+    result, winner = await run_hedged_async(legs, tvdl.hedge_delay_seconds)
+    tvdl.debug_write_log(f"Hedged lookup won by path {winner}", tvdl.debug_option)
+    return result
+
+
+async def resolve_tweet_media_async(tweet_url, session, use_cache=True):
+    """Async version of resolve_tweet_media, sharing its metadata cache.
+
+    Cache entries are compressed and written on worker threads, not on the
+    event loop.
+    """
+    tweet_url = tweet_url.replace("https://twitter.com", "https://x.com")
+
+    tweet_id = re.findall(r"(?<=status/)\d+", tweet_url)
+
+    assert tweet_id is not None and len(tweet_id) == 1, (
+        f"Could not parse tweet id from your url. Tweet url: {tweet_url}"
+    )
+
+    tweet_id = tweet_id[0]
+
+    if use_cache:
+        cached = await asyncio.to_thread(tvdl.metadata_cache.get, tweet_id)
+        if cached == NEGATIVE:
+            return [], False, []
+        if cached is not None:
+            return tvdl.extract_media(cached["source"], cached["data"])
+
+    source, data = await fetch_tweet_data_async(tweet_url, tweet_id, session)
+    media = tvdl.extract_media(source, data)
+
+    if use_cache:
+        video_urls, _, img_urls = media
+        if video_urls or img_urls:
+            await asyncio.to_thread(tvdl.metadata_cache.put, tweet_id, source, data)
+        else:
+            await asyncio.to_thread(tvdl.metadata_cache.put_negative, tweet_id)
+
+    return media
+
+
+async def download_video_for_sc_async(
+    tweet_url, output_file="", output_folder_path="./output", session=None
+):
+    """Awaitable version of download_video_for_sc."""
+    if session is None:
+        async with tvdl.http_client.new_async_session() as session:
+            return await download_video_for_sc_async(
+                tweet_url, output_file, output_folder_path, session
+            )
+
+    tweet_url = tweet_url.replace("https://twitter.com", "https://x.com")
+
+    video_urls, gif_ptn, img_urls = await resolve_tweet_media_async(tweet_url, session)
+
+    tasks = []
+    if tvdl.image_save_option and img_urls:
+        tasks.append(get_img_async(img_urls, output_file, output_folder_path, session))
+    if video_urls:
+        tasks.append(
+            download_videos_async(
+                video_urls, output_file, output_folder_path, gif_ptn, session
+            )
+        )
+    else:
+        print(f"No videos found in tweet: {tweet_url}")
+    await asyncio.gather(*tasks)
+
+
+async def download_videos_for_sc_async(
+    entries, output_folder_path="./output", concurrency=8
+):
+    """
+    Download many tweets concurrently on one event loop.
+    entries: list of (tweet_url, output_file).  At most `concurrency` tweets are in flight at once.
+    Returns the list of exceptions (or None) in the order of entries.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with tvdl.http_client.new_async_session(max_clients=concurrency) as session:
+
+        async def run(tweet_url, output_file):
+            async with semaphore:
+                await download_video_for_sc_async(
+                    tweet_url, output_file, output_folder_path, session
+                )
+
+        results = await asyncio.gather(
+            *(run(tweet_url, output_file) for tweet_url, output_file in entries),
+            return_exceptions=True,
+        )
+
+    return [result if isinstance(result, BaseException) else None for result in results]
@@ -0,0 +1,109 @@
+import collections
+import threading
+import time
+import urllib.parse
+
+
+class TokenBucket:
+    """Token bucket of ``rate`` bytes per second holding up to ``burst`` bytes.
+
+    Callers reserve the bytes they just received and sleep for the returned
+    delay.  The bucket may go into debt, so a reservation larger than the
+    burst still works and concurrent callers queue up behind each other in
+    the order they reserved.
+    """
+
+    def __init__(self, rate, burst, window=2.0):
+        self.rate = rate
+        self.burst = burst
+        self.window = window
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._history = collections.deque()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        # Called with the lock held
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        while self._history and self._history[0][0] < now - self.window:
+            self._history.popleft()
+
+    def reserve(self, size):
+        """Take ``size`` tokens; return the seconds to wait before using them."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= size
+            self._history.append((now, size))
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def throughput(self):
+        """Bytes per second granted over the last ``window`` seconds."""
+        with self._lock:
+            self._refill(time.monotonic())
+            return sum(size for _, size in self._history) / self.window
+
+    def stats(self):
+        throughput = self.throughput()
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "throughput": throughput,
+            "utilization": throughput / self.rate,
+        }
+
+
+class BandwidthLimiter:
+    """Process-wide bandwidth cap shared by every download loop.
+
+    A global bucket caps the total rate and optional per-host buckets (e.g.
+    video.twimg.com vs pbs.twimg.com) cap single hosts; a download waits
+    for whichever of its buckets is further behind.  A rate of 0 means
+    unlimited, and with no limits at all ``throttle`` returns None so the
+    download loops skip the limiter entirely.
+    """
+
+    def __init__(self, rate=0, burst=0, host_limits=None):
+        self.global_bucket = TokenBucket(rate, burst or rate) if rate > 0 else None
+        self.host_buckets = {
+            host: TokenBucket(host_rate, host_burst or host_rate)
+            for host, (host_rate, host_burst) in (host_limits or {}).items()
+            if host_rate > 0
+        }
+
+    def _buckets(self, host):
+        buckets = [self.global_bucket] if self.global_bucket is not None else []
+        if host in self.host_buckets:
+            buckets.append(self.host_buckets[host])
+        return buckets
+
+    def reserve(self, url, size):
+        """Reserve ``size`` bytes received from ``url``; return the seconds to wait."""
+        host = urllib.parse.urlsplit(url).hostname
+        return max(
+            (bucket.reserve(size) for bucket in self._buckets(host)), default=0.0
+        )
+
+    def throttle(self, url):
+        """A callable(size) that blocks as needed for ``url``, or None if unlimited."""
+        host = urllib.parse.urlsplit(url).hostname
+        buckets = self._buckets(host)
+        if not buckets:
+            return None
+
+        def throttle(size):
+            delay = max(bucket.reserve(size) for bucket in buckets)
+            if delay > 0:
+                time.sleep(delay)
+
+        return throttle
+
+    def utilization(self):
+        """Rate, burst, recent throughput (bytes/s) and utilization per bucket."""
+        stats = {}
+        if self.global_bucket is not None:
+            stats["global"] = self.global_bucket.stats()
+        for host, bucket in self.host_buckets.items():
+            stats[host] = bucket.stats()
+        return stats
@@ -0,0 +1,104 @@
+import asyncio
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Legs of every lookup run on these long-lived threads, so the per-thread
+# sessions of HttpClient (and their keep-alive connections) are reused.
+hedge_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="hedge")
+
+
+def run_hedged(legs, delay):
+    """Run interchangeable ``legs`` (callables) and return the first usable result.
+
+    Legs are started in order: the next one starts ``delay`` seconds after
+    the previous one, or immediately once every running leg has failed.
+    With ``delay`` 0 they all race from the start.  A leg fails by raising
+    or by returning None.  Legs run on ``hedge_executor``; legs that have not
+    started yet are cancelled when a result is found, running ones are left
+    to finish in the background and their results are discarded.
+
+    Returns (result, index of the winning leg).  Raises AssertionError with
+    the collected errors if every leg fails.
+    """
+    futures = {}
+    pending = set()
+    errors = []
+    next_leg = 0
+    timed_out = True
+
+    try:
+        while True:
+            if next_leg < len(legs) and (timed_out or not pending):
+                future = hedge_executor.submit(legs[next_leg])
+                futures[future] = next_leg
+                pending.add(future)
+                next_leg += 1
+
+            if not pending:
+                break
+
+            done, pending = wait(
+                pending,
+                timeout=delay if next_leg < len(legs) else None,
+                return_when=FIRST_COMPLETED,
+            )
+            timed_out = not done
+
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                if result is not None:
+                    return result, futures[future]
+                errors.append(f"Leg {futures[future]} returned no usable result")
+    finally:
+        for future in pending:
+            future.cancel()
+
+    assert False, f"All {len(legs)} hedged requests failed: {errors}"
+
+
+async def run_hedged_async(legs, delay):
+    """Async version of run_hedged; ``legs`` are coroutine functions.
+
+    Losing legs are cancelled as soon as a usable result arrives.
+    """
+    tasks = {}
+    pending = set()
+    errors = []
+    next_leg = 0
+    timed_out = True
+
+    try:
+        while True:
+            if next_leg < len(legs) and (timed_out or not pending):
+                task = asyncio.ensure_future(legs[next_leg]())
+                tasks[task] = next_leg
+                pending.add(task)
+                next_leg += 1
+
+            if not pending:
+                break
+
+            done, pending = await asyncio.wait(
+                pending,
+                timeout=delay if next_leg < len(legs) else None,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            timed_out = not done
+
+            for task in done:
+                try:
+                    result = task.result()
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                if result is not None:
+                    return result, tasks[task]
+                errors.append(f"Leg {tasks[task]} returned no usable result")
+    finally:
+        for task in pending:
+            task.cancel()
+
+    assert False, f"All {len(legs)} hedged requests failed: {errors}"
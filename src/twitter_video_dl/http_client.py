@@ -0,0 +1,116 @@
+import threading
+import time
+
+# Use curl-cffi instead of standard requests for TLS fingerprint handling
+try:
+    from curl_cffi import CurlHttpVersion, requests
+    from curl_cffi.requests import AsyncSession
+
+    USE_CURL_CFFI = True
+except ImportError:
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    AsyncSession = None
+
+    USE_CURL_CFFI = False
+
+
+class HttpClient:
+    """Shared HTTP client used by every network call.
+
+    Each thread gets its own long-lived session (sessions are not safe to
+    share between threads), so connections to cdn.syndication.twimg.com,
+    video.twimg.com, pbs.twimg.com, ... are kept alive and reused across
+    requests and media items.  Browser impersonation, HTTP/2 and timeouts
+    are configured here only.  ``observe(method, url, status, seconds)`` is
+    called after every request with the time to the response headers
+    (status "error" if the request raised).
+    """
+
+    def __init__(
+        self,
+        connect_timeout=10,
+        read_timeout=30,
+        http2=True,
+        impersonate="chrome110",
+        pool_maxsize=10,
+        observe=None,
+    ):
+        self.timeout = (connect_timeout, read_timeout)
+        self.http2 = http2
+        self.impersonate = impersonate
+        self.pool_maxsize = pool_maxsize
+        self.observe = observe
+        self._local = threading.local()
+
+    def new_session(self):
+        """Create a session with this client's settings.
+
+        Used directly only where a private cookie jar is needed (get_tokens).
+        """
+        if USE_CURL_CFFI:
+            # Impersonated Chrome negotiates HTTP/2 via ALPN; force 1.1 if disabled
+            kwargs = {"impersonate": self.impersonate, "timeout": self.timeout}
+            if not self.http2:
+                kwargs["http_version"] = CurlHttpVersion.V1_1
+            return requests.Session(**kwargs)
+
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_maxsize, pool_maxsize=self.pool_maxsize
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def new_async_session(self, max_clients=10):
+        """Create a curl_cffi AsyncSession with this client's settings."""
+        assert AsyncSession is not None, (
+            "The async API requires curl-cffi. Install it with: pip install curl-cffi"
+        )
+
+        kwargs = {
+            "impersonate": self.impersonate,
+            "timeout": self.timeout,
+            "max_clients": max_clients,
+        }
+        if not self.http2:
+            kwargs["http_version"] = CurlHttpVersion.V1_1
+        return AsyncSession(**kwargs)
+
+    @property
+    def session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = self.new_session()
+        return session
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        if self.observe is None:
+            return self.session.request(method, url, **kwargs)
+        start = time.monotonic()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except Exception:
+            self.observe(method, url, "error", time.monotonic() - start)
+            raise
+        self.observe(method, url, response.status_code, time.monotonic() - start)
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request("HEAD", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def close(self):
+        """Close the calling thread's session."""
+        session = getattr(self._local, "session", None)
+        if session is not None:
+            session.close()
+            self._local.session = None
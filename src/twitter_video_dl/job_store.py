@@ -0,0 +1,207 @@
+import contextlib
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    file_name TEXT NOT NULL,
+    output_folder_path TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    next_run_at REAL NOT NULL,
+    lease_until REAL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_runnable ON jobs (status, next_run_at);
+"""
+
+COLUMNS = (
+    "id",
+    "url",
+    "file_name",
+    "output_folder_path",
+    "status",
+    "attempts",
+    "error",
+    "next_run_at",
+    "lease_until",
+    "created_at",
+    "started_at",
+    "finished_at",
+)
+
+
+class JobStore:
+    """Crash-safe job table in SQLite (WAL mode) shared by the server and batch runs.
+
+    A job is "queued" until a worker leases it: ``lease`` marks it "running"
+    until ``lease_until`` and the worker renews the lease while it works.
+    ``complete`` marks it "done"; ``fail`` puts it back in the queue after
+    ``retry_backoff * 2 ** (attempts - 1)`` seconds, or marks it "failed"
+    after ``max_attempts``.  A job whose lease ran out (its process died)
+    can be leased again, so unfinished work is picked up after a restart.
+    ``renew``, ``complete`` and ``fail`` take the attempt number of the
+    lease and are ignored once the job has been leased again.  The database
+    file is created on first use.
+    """
+
+    def __init__(self, path, max_attempts=3, retry_backoff=5.0):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self._local = threading.local()
+        self._created = False
+        self._create_lock = threading.Lock()
+
+    @property
+    def _db(self):
+        # One connection per thread; WAL lets readers run next to the writer
+        db = getattr(self._local, "db", None)
+        if db is None:
+            with self._create_lock:
+                if not self._created:
+                    directory = os.path.dirname(os.path.abspath(self.path))
+                    os.makedirs(directory, exist_ok=True)
+                db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute("PRAGMA synchronous=NORMAL")
+                if not self._created:
+                    db.executescript(SCHEMA)
+                    self._created = True
+            self._local.db = db
+        return db
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so a SELECT followed by
+        # an UPDATE cannot interleave with another process leasing the same job
+        db = self._db
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    @staticmethod
+    def _row(row):
+        return None if row is None else dict(zip(COLUMNS, row))
+
+    def enqueue(self, job_id, url, file_name="", output_folder_path="./output"):
+        """Add a queued job.  Returns False if a job with this ID already exists."""
+        now = time.time()
+        with self._transaction() as db:
+            cursor = db.execute(
+                "INSERT OR IGNORE INTO jobs (id, url, file_name, output_folder_path,"
+                " status, next_run_at, created_at) VALUES (?, ?, ?, ?, 'queued', ?, ?)",
+                (job_id, url, file_name, output_folder_path, now, now),
+            )
+            return cursor.rowcount == 1
+
+    def requeue(self, job_id):
+        """Queue a failed job again with a fresh retry budget."""
+        with self._transaction() as db:
+            db.execute(
+                "UPDATE jobs SET status = 'queued', attempts = 0, next_run_at = ?"
+                " WHERE id = ? AND status = 'failed'",
+                (time.time(), job_id),
+            )
+
+    def lease(self, lease_seconds):
+        """Take the oldest runnable job: queued and due, or running with an expired lease.
+
+        Returns: the job row as a dict (status "running"), or None
+        """
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM jobs"
+                " WHERE (status = 'queued' AND next_run_at <= ?)"
+                " OR (status = 'running' AND lease_until < ?)"
+                " ORDER BY next_run_at LIMIT 1",
+                (now, now),
+            ).fetchone()
+            if row is None:
+                return None
+            job = self._row(row)
+            job.update(
+                status="running",
+                attempts=job["attempts"] + 1,
+                lease_until=now + lease_seconds,
+                started_at=now,
+            )
+            db.execute(
+                "UPDATE jobs SET status = ?, attempts = ?, lease_until = ?,"
+                " started_at = ? WHERE id = ?",
+                ("running", job["attempts"], job["lease_until"], now, job["id"]),
+            )
+            return job
+
+    def renew(self, job_id, attempt, lease_seconds):
+        with self._transaction() as db:
+            db.execute(
+                "UPDATE jobs SET lease_until = ?"
+                " WHERE id = ? AND attempts = ? AND status = 'running'",
+                (time.time() + lease_seconds, job_id, attempt),
+            )
+
+    def complete(self, job_id, attempt):
+        with self._transaction() as db:
+            db.execute(
+                "UPDATE jobs SET status = 'done', error = NULL, lease_until = NULL,"
+                " finished_at = ? WHERE id = ? AND attempts = ? AND status = 'running'",
+                (time.time(), job_id, attempt),
+            )
+
+    def fail(self, job_id, attempt, error):
+        """Record a failed attempt.
+
+        Returns: the new status ("queued" to retry, or "failed"), or None if the lease was lost
+        """
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute(
+                "SELECT attempts FROM jobs"
+                " WHERE id = ? AND attempts = ? AND status = 'running'",
+                (job_id, attempt),
+            ).fetchone()
+            if row is None:
+                return None
+            if attempt < self.max_attempts:
+                status, finished_at = "queued", None
+                next_run_at = now + self.retry_backoff * 2 ** (attempt - 1)
+            else:
+                status, finished_at, next_run_at = "failed", now, now
+            db.execute(
+                "UPDATE jobs SET status = ?, error = ?, lease_until = NULL,"
+                " next_run_at = ?, finished_at = ? WHERE id = ?",
+                (status, error, next_run_at, finished_at, job_id),
+            )
+            return status
+
+    def get(self, job_id):
+        return self._row(
+            self._db.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        )
+
+    def counts(self):
+        """Number of jobs per status."""
+        return dict(
+            self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+        )
+
+    def close(self):
+        db = getattr(self._local, "db", None)
+        if db is not None:
+            db.close()
+            self._local.db = None
@@ -0,0 +1,269 @@
+import queue
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+
+from .progress import Progress
+
+
+class Job:
+    """One download requested from the server (tweet URL and file name).
+
+    ``progress`` is handed to the download so it can report the stage and
+    the bytes transferred.
+    """
+
+    def __init__(self, url, file_name="", output_folder_path="./output", job_id=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.url = url
+        self.file_name = file_name
+        self.output_folder_path = output_folder_path
+        self.status = "queued"
+        self.attempts = 0
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.progress = Progress()
+
+    @classmethod
+    def from_row(cls, row):
+        """A Job for a row of the job store."""
+        job = cls(row["url"], row["file_name"], row["output_folder_path"], row["id"])
+        for name in ("status", "attempts", "error", "created_at", "started_at"):
+            setattr(job, name, row[name])
+        job.finished_at = row["finished_at"]
+        return job
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "url": self.url,
+            "file_name": self.file_name,
+            "status": self.status,
+            "attempts": self.attempts,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "progress": self.progress.snapshot(),
+        }
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed")
+
+
+class JobQueue:
+    """Download jobs drained by a pool of ``workers`` threads.
+
+    ``submit`` returns at once with the queued Job; a worker later calls
+    ``handler(job)`` and marks the job "done", or "failed" with the error if
+    the handler raised.  The last ``max_finished`` finished jobs stay
+    available through ``get``.
+
+    With a ``key`` function (e.g. URL -> tweet ID), a job submitted while an
+    unfinished job has the same key and file name is not queued again: the
+    caller gets the job already in flight.
+
+    With a ``store`` (job_store.JobStore) the queue lives in SQLite instead
+    of memory: workers lease jobs from the store (renewing the lease every
+    ``lease_seconds / 3`` while they work), failed jobs are retried with
+    backoff, and jobs left unfinished by a previous process are picked up
+    once their lease has run out.
+    """
+
+    def __init__(
+        self,
+        handler,
+        workers=2,
+        max_finished=1000,
+        key=None,
+        store=None,
+        lease_seconds=60,
+        poll_seconds=1.0,
+    ):
+        self.handler = handler
+        self.workers = workers
+        self.max_finished = max_finished
+        self.key = key
+        self.store = store
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+        self._queue = queue.Queue()
+        self._jobs = OrderedDict()
+        self._in_flight = {}
+        self._running = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._stopping = False
+        self._threads = []
+
+    def start(self):
+        self._stopping = False
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self._work, name=f"job-worker-{i}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        if self.store is not None:
+            thread = threading.Thread(
+                target=self._renew_leases, name="job-lease", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """Let the workers finish the jobs in progress, then end them."""
+        if self.store is None:
+            for _ in range(self.workers):
+                self._queue.put(None)
+        with self._wakeup:
+            self._stopping = True
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _flight_key(self, url, file_name):
+        if self.key is None:
+            return None
+        # URLs the key function cannot parse are never coalesced
+        key = self.key(url)
+        return None if key is None else (key, file_name)
+
+    def submit(self, url, file_name="", output_folder_path="./output", job_id=None):
+        """Queue a job, or return the unfinished job for the same key and file name.
+
+        With a store, ``job_id`` makes submitting idempotent: a job already in
+        the store is not added again (a failed one is queued again).
+        """
+        flight_key = self._flight_key(url, file_name)
+        with self._lock:
+            job = self._in_flight.get(flight_key)
+            if job is not None:
+                return job
+            job = Job(url, file_name, output_folder_path, job_id)
+            if self.store is not None and not self.store.enqueue(
+                job.id, url, file_name, output_folder_path
+            ):
+                self.store.requeue(job.id)
+                job = Job.from_row(self.store.get(job.id))
+            self._jobs[job.id] = job
+            if flight_key is not None and not job.finished:
+                self._in_flight[flight_key] = job
+            self._wakeup.notify()
+        if self.store is None:
+            self._queue.put(job)
+        return job
+
+    def get(self, job_id):
+        """The current state of a job, or None if it is unknown.
+
+        With a store, a job no worker of this queue is running (still queued,
+        or run by another process) is read from the store on every call.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            running_here = job_id in self._running
+        if self.store is None or running_here:
+            return job
+        row = self.store.get(job_id)
+        if row is None:
+            return job
+        current = Job.from_row(row)
+        if job is not None:
+            current.progress = job.progress
+        return current
+
+    def depth(self):
+        """Number of jobs waiting for a worker."""
+        if self.store is not None:
+            return self.store.counts().get("queued", 0)
+        return self._queue.qsize()
+
+    def running(self):
+        """Number of jobs a worker of this queue is working on."""
+        with self._lock:
+            return len(self._running)
+
+    def wait_idle(self):
+        """Block until the store has no queued or running jobs left (store only)."""
+        while True:
+            counts = self.store.counts()
+            if not counts.get("queued") and not counts.get("running"):
+                return
+            time.sleep(self.poll_seconds)
+
+    def _forget_finished(self):
+        # Called with the lock held
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[: max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+    def _next_job(self):
+        if self.store is None:
+            return self._queue.get()
+        while True:
+            with self._wakeup:
+                if self._stopping:
+                    return None
+            row = self.store.lease(self.lease_seconds)
+            if row is not None:
+                break
+            with self._wakeup:
+                if self._stopping:
+                    return None
+                self._wakeup.wait(self.poll_seconds)
+        with self._lock:
+            # Jobs of a previous process (or retries) get a fresh in-memory Job
+            job = self._jobs.get(row["id"])
+            if job is None:
+                job = self._jobs[row["id"]] = Job.from_row(row)
+            elif row["attempts"] > 1:
+                job.progress = Progress()
+        job.attempts = row["attempts"]
+        return job
+
+    def _renew_leases(self):
+        while True:
+            with self._wakeup:
+                if self._stopping:
+                    return
+                self._wakeup.wait(self.lease_seconds / 3)
+                running = list(self._running.items())
+            for job_id, attempt in running:
+                self.store.renew(job_id, attempt, self.lease_seconds)
+
+    def _work(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            with self._lock:
+                self._running[job.id] = job.attempts
+            job.status = "running"
+            job.started_at = time.time()
+            try:
+                self.handler(job)
+                job.status = "done"
+                if self.store is not None:
+                    self.store.complete(job.id, job.attempts)
+            except Exception as e:
+                job.error = str(e) or type(e).__name__
+                job.status = "failed"
+                if self.store is not None:
+                    # "queued" again if the store retries it later
+                    job.status = (
+                        self.store.fail(job.id, job.attempts, job.error) or "failed"
+                    )
+                traceback.print_exc()
+            job.finished_at = time.time() if job.finished else None
+            with self._lock:
+                self._running.pop(job.id, None)
+                if job.finished:
+                    self._in_flight.pop(self._flight_key(job.url, job.file_name), None)
+                self._forget_finished()
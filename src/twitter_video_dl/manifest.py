@@ -0,0 +1,141 @@
+import contextlib
+import hashlib
+import os
+import threading
+
+from .media_store import hash_file
+from .storage import file_lock, read_json, write_json_atomic
+
+# One manifest per output folder, next to the files it describes
+MANIFEST_NAME = ".twitter-video-dl.json"
+
+_lock = threading.Lock()
+
+
+def manifest_path(output_filename):
+    return os.path.join(
+        os.path.dirname(os.path.abspath(output_filename)), MANIFEST_NAME
+    )
+
+
+def read_entry(output_filename):
+    """Manifest entry of a downloaded file, or None."""
+    manifest = read_json(manifest_path(output_filename), None) or {}
+    return manifest.get(os.path.basename(output_filename))
+
+
+def record_download(
+    output_filename, url, validator, sha256, lock_dir, source_size=None
+):
+    """Remember what was downloaded to ``output_filename``.
+
+    The entry holds the URL, the size and mtime of the file, the validator
+    (ETag or Last-Modified) the server sent and the SHA-256 of the content.
+    ``source_size`` is the size of the download if the file was made from it
+    (a GIF converted from the MP4 at ``url``).  The lock file lives in
+    ``lock_dir`` so the output folder only gets the manifest itself.
+    """
+    stat = os.stat(output_filename)
+    entry = {
+        "url": url,
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "validator": validator,
+        "sha256": sha256,
+    }
+    if source_size is not None:
+        entry["source_size"] = source_size
+    with locked_manifest(output_filename, lock_dir) as manifest:
+        manifest[os.path.basename(output_filename)] = entry
+
+
+def record_conversion(source_filename, output_filename, lock_dir):
+    """Move the entry of a converted (and deleted) download to its output.
+
+    The URL and validator stay, so the output is skipped like the download
+    would have been.  Nothing is recorded if the source had no entry.
+    """
+    stat = os.stat(output_filename)
+    sha256 = hash_file(output_filename)
+    with locked_manifest(output_filename, lock_dir) as manifest:
+        entry = manifest.pop(os.path.basename(source_filename), None)
+        if entry is None:
+            return
+        manifest[os.path.basename(output_filename)] = {
+            "url": entry["url"],
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "validator": entry["validator"],
+            "sha256": sha256,
+            "source_size": entry.get("source_size", entry["size"]),
+        }
+
+
+@contextlib.contextmanager
+def locked_manifest(output_filename, lock_dir):
+    """The manifest of the folder of ``output_filename``, written back on exit."""
+    path = manifest_path(output_filename)
+    name = hashlib.sha256(path.encode()).hexdigest()[:16]
+    # Media of one tweet finish concurrently in the same folder
+    with _lock, file_lock(os.path.join(lock_dir, f"{name}.lock")):
+        manifest = read_json(path, None) or {}
+        yield manifest
+        write_json_atomic(path, manifest)
+
+
+def is_local_copy_intact(output_filename, entry):
+    """True if the file still has the recorded content.
+
+    Size and mtime are compared first; the file is only hashed again if the
+    mtime changed (e.g. after a copy).
+    """
+    try:
+        stat = os.stat(output_filename)
+    except OSError:
+        return False
+    if stat.st_size != entry["size"]:
+        return False
+    if stat.st_mtime == entry["mtime"]:
+        return True
+    return hash_file(output_filename) == entry["sha256"]
+
+
+def conditional_headers(validator):
+    if validator.startswith(('"', 'W/"')):
+        return {"If-None-Match": validator}
+    return {"If-Modified-Since": validator}
+
+
+def is_unchanged(client, url, output_filename):
+    """True if ``output_filename`` already holds the current content of ``url``.
+
+    The local file is checked against its manifest entry, then a conditional
+    HEAD asks the server whether the media changed: 304, or 200 with the
+    same validator and size (of the source, for a converted file), means
+    unchanged.  Only a few hundred bytes go
+    over the network.  Files without an entry or validator count as changed.
+    """
+    entry = read_entry(output_filename)
+    if (
+        entry is None
+        or entry["url"] != url
+        or not entry["validator"]
+        or not is_local_copy_intact(output_filename, entry)
+    ):
+        return False
+
+    try:
+        response = client.head(
+            url, headers=conditional_headers(entry["validator"]), allow_redirects=True
+        )
+    except Exception:
+        return False
+    if response.status_code == 304:
+        return True
+    if response.status_code != 200:
+        return False
+    validator = response.headers.get("ETag") or response.headers.get("Last-Modified")
+    length = response.headers.get("Content-Length")
+    return validator == entry["validator"] and (
+        length is None or int(length) == entry.get("source_size", entry["size"])
+    )
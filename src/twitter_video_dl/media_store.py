@@ -0,0 +1,241 @@
+import errno
+import hashlib
+import os
+import shutil
+import threading
+import time
+import urllib.parse
+
+from .storage import file_lock, read_json, write_json_atomic
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# ioctl(dst, FICLONE, src): copy-on-write clone on btrfs, XFS, ...
+FICLONE = 0x40049409
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def media_key(url):
+    """Store key of a media URL: host and path, without the query.
+
+    The path of a twimg URL contains the media ID (and the variant), while
+    the query (``?tag=12``, ``?name=orig``) changes between API responses.
+    """
+    parts = urllib.parse.urlsplit(url)
+    return f"{parts.hostname}{parts.path}"
+
+
+def hash_file(path):
+    """SHA-256 of a file, read in chunks into one reusable buffer."""
+    digest = hashlib.sha256()
+    buffer = bytearray(HASH_CHUNK_SIZE)
+    view = memoryview(buffer)
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            digest.update(view[:n])
+    return digest.hexdigest()
+
+
+def reflink(src, dst):
+    """Clone ``src`` to ``dst`` sharing its blocks; raises OSError if unsupported."""
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, "reflink is not supported")
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        try:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        except OSError:
+            d.close()
+            os.remove(dst)
+            raise
+
+
+def clone_file(src, dst, link_mode="auto"):
+    """Make ``dst`` a copy of ``src`` the cheapest way ``link_mode`` allows.
+
+    ``"auto"`` tries a reflink, then a hardlink, then a plain copy;
+    ``"reflink"``, ``"hardlink"`` and ``"copy"`` fall back to a copy only.
+    ``dst`` is replaced atomically.  Returns the method used.
+    """
+    methods = {
+        "auto": ("reflink", "hardlink"),
+        "reflink": ("reflink",),
+        "hardlink": ("hardlink",),
+        "copy": (),
+    }[link_mode]
+
+    tmp_path = f"{dst}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        for method in methods:
+            try:
+                if method == "reflink":
+                    reflink(src, tmp_path)
+                else:
+                    os.link(src, tmp_path)
+                break
+            except OSError:
+                continue
+        else:
+            method = "copy"
+            shutil.copyfile(src, tmp_path)
+        os.replace(tmp_path, dst)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return method
+
+
+class MediaStore:
+    """Content-addressed store of downloaded media shared across tweets.
+
+    The same video is reached through reposts, quote tweets and repeated
+    links.  Every downloaded file is added as ``blobs/<sha256>`` and indexed
+    by its ``media_key``, so the next request for the same media is served
+    from the store (reflink, hardlink or copy, see ``clone_file``) without
+    touching the network.  Identical content under different keys is stored
+    once.  When the blobs exceed ``max_bytes`` the least recently used ones
+    are evicted.  The index is shared between processes through
+    ``index.json`` and a lock file.
+
+    Lookups only read the index (it is always replaced atomically); the
+    last use of a hit is kept in memory and written with the next change of
+    the index, or at most every ``touch_interval`` seconds.
+    """
+
+    def __init__(
+        self, directory, max_bytes, link_mode="auto", enabled=True, touch_interval=60
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.link_mode = link_mode
+        self.enabled = enabled
+        self.touch_interval = touch_interval
+        self.index_path = os.path.join(directory, "index.json")
+        self.lock_path = os.path.join(directory, "index.lock")
+        self._lock = threading.Lock()
+        self._touches = {}
+        self._written_at = time.monotonic()
+
+    def _blob_path(self, digest):
+        return os.path.join(self.directory, "blobs", digest)
+
+    def _read_index(self):
+        return read_json(self.index_path, None) or {"keys": {}, "blobs": {}}
+
+    def _update_index(self, update):
+        # Read-modify-write of the index, serialized across threads and processes
+        with self._lock, file_lock(self.lock_path):
+            index = self._read_index()
+            touches, self._touches = self._touches, {}
+            for digest, last_used in touches.items():
+                blob = index["blobs"].get(digest)
+                if blob is not None:
+                    blob["last_used"] = max(blob["last_used"], last_used)
+            result = update(index)
+            write_json_atomic(self.index_path, index, indent=None)
+            self._written_at = time.monotonic()
+        return result
+
+    def _touch(self, digest):
+        with self._lock:
+            self._touches[digest] = time.time()
+            due = time.monotonic() - self._written_at >= self.touch_interval
+        if due:
+            self._update_index(lambda index: None)
+
+    def _forget(self, key, digest):
+        def forget(index):
+            # Unless it was added again in the meantime
+            if index["keys"].get(key) == digest:
+                del index["keys"][key]
+                index["blobs"].pop(digest, None)
+
+        self._update_index(forget)
+
+    def fetch(self, url, output_filename):
+        """Materialize the stored media of ``url`` at ``output_filename``.
+
+        Returns: the method used ("reflink", "hardlink" or "copy"), or None if the media is not stored
+        """
+        if not self.enabled:
+            return None
+        key = media_key(url)
+        index = self._read_index()
+        digest = index["keys"].get(key)
+        if digest is None:
+            return None
+        blob = index["blobs"].get(digest)
+        path = self._blob_path(digest)
+        try:
+            valid = blob is not None and os.path.getsize(path) == blob["size"]
+        except OSError:
+            valid = False
+        if not valid:
+            # Evicted or damaged behind our back
+            self._forget(key, digest)
+            return None
+        self._touch(digest)
+        try:
+            return clone_file(path, output_filename, self.link_mode)
+        except OSError:
+            return None
+
+    def add(self, url, filename):
+        """Add a downloaded file to the store under the key of ``url``.
+
+        Returns: the SHA-256 of the file
+        """
+        digest = hash_file(filename)
+        if not self.enabled:
+            return digest
+        path = self._blob_path(digest)
+        size = os.path.getsize(filename)
+
+        def insert(index):
+            if digest not in index["blobs"] or not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                clone_file(filename, path, self.link_mode)
+            index["keys"][media_key(url)] = digest
+            index["blobs"][digest] = {"size": size, "last_used": time.time()}
+            self._evict(index)
+
+        self._update_index(insert)
+        return digest
+
+    def _evict(self, index):
+        # Called while the index is locked
+        total = sum(blob["size"] for blob in index["blobs"].values())
+        if total <= self.max_bytes:
+            return
+        for digest, blob in sorted(
+            index["blobs"].items(), key=lambda item: item[1]["last_used"]
+        ):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(self._blob_path(digest))
+            except FileNotFoundError:
+                pass
+            del index["blobs"][digest]
+            total -= blob["size"]
+        index["keys"] = {
+            key: digest
+            for key, digest in index["keys"].items()
+            if digest in index["blobs"]
+        }
+
+    def stats(self):
+        """Number of keys and blobs and the total size of the blobs in bytes."""
+        index = self._read_index()
+        return {
+            "keys": len(index["keys"]),
+            "blobs": len(index["blobs"]),
+            "bytes": sum(blob["size"] for blob in index["blobs"].values()),
+        }
@@ -0,0 +1,207 @@
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Stored for tweets that resolved to no media (or no longer exist)
+NEGATIVE = {"source": None, "data": None}
+
+
+class MetadataCache:
+    """Raw API responses keyed by tweet ID.
+
+    Entries are ``{"source": "syndication" | "graphql", "data": <parsed JSON>}``
+    so the media can be re-extracted offline when the extraction code
+    changes.  A bounded LRU is kept in memory; optionally every entry is also
+    written to ``directory`` compressed with zstd (if the ``zstandard``
+    package is installed and selected) or gzip.  Entries expire after
+    ``ttl`` seconds, negative entries after ``negative_ttl`` seconds.
+
+    An expired file is deleted when a lookup finds it.  At most every
+    ``sweep_interval`` seconds a write also sweeps the directory, like the
+    media store's eviction: files older than the longer TTL go, and above
+    ``max_disk_bytes`` the least recently used ones (a file's mtime is
+    refreshed on every hit).
+    """
+
+    def __init__(
+        self,
+        directory,
+        memory_entries=256,
+        ttl=86400,
+        negative_ttl=3600,
+        disk=True,
+        compression="gzip",
+        max_disk_bytes=256 * 1024 * 1024,
+        sweep_interval=3600,
+    ):
+        self.directory = directory
+        self.memory_entries = memory_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.disk = disk
+        self.compression = (
+            "zstd" if compression == "zstd" and zstandard is not None else "gzip"
+        )
+        self.max_disk_bytes = max_disk_bytes
+        self.sweep_interval = sweep_interval
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        # The first write of a process sweeps
+        self._swept_at = None
+
+    def _path(self, tweet_id, compression=None):
+        extension = "zst" if (compression or self.compression) == "zstd" else "gz"
+        return os.path.join(self.directory, f"{tweet_id}.json.{extension}")
+
+    def _is_fresh(self, record):
+        ttl = self.negative_ttl if record["entry"] == NEGATIVE else self.ttl
+        return time.time() - record["created_at"] < ttl
+
+    def _read_disk(self, tweet_id):
+        """Return (record, path) of the entry on disk, or (None, None)."""
+        for compression in ("zstd", "gzip"):
+            path = self._path(tweet_id, compression)
+            if not os.path.exists(path):
+                continue
+            try:
+                with open(path, "rb") as f:
+                    raw = f.read()
+                if compression == "zstd":
+                    if zstandard is None:
+                        continue
+                    raw = zstandard.ZstdDecompressor().decompress(raw)
+                else:
+                    raw = gzip.decompress(raw)
+                return json.loads(raw), path
+            except (OSError, ValueError, EOFError):
+                continue
+        return None, None
+
+    def _write_disk(self, tweet_id, record):
+        raw = json.dumps(record, ensure_ascii=False).encode()
+        if self.compression == "zstd":
+            raw = zstandard.ZstdCompressor().compress(raw)
+        else:
+            raw = gzip.compress(raw)
+
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(raw)
+            os.replace(tmp_path, self._path(tweet_id))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _remember(self, tweet_id, record):
+        # Called with the lock held
+        self._memory[tweet_id] = record
+        self._memory.move_to_end(tweet_id)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, tweet_id):
+        """Return the cached entry (``NEGATIVE`` for negative entries) or None."""
+        with self._lock:
+            record = self._memory.get(tweet_id)
+            if record is not None:
+                if self._is_fresh(record):
+                    self._memory.move_to_end(tweet_id)
+                    return record["entry"]
+                del self._memory[tweet_id]
+
+        if not self.disk:
+            return None
+
+        record, path = self._read_disk(tweet_id)
+        if record is None:
+            return None
+        if not self._is_fresh(record):
+            remove_file(path)
+            return None
+        try:
+            # The sweep evicts by mtime, so a hit marks the file as used
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            self._remember(tweet_id, record)
+        return record["entry"]
+
+    def put(self, tweet_id, source, data):
+        self._put(tweet_id, {"source": source, "data": data})
+
+    def put_negative(self, tweet_id):
+        self._put(tweet_id, NEGATIVE)
+
+    def _put(self, tweet_id, entry):
+        record = {"entry": entry, "created_at": time.time()}
+        with self._lock:
+            self._remember(tweet_id, record)
+        if self.disk:
+            self._write_disk(tweet_id, record)
+            self._maybe_sweep()
+
+    def invalidate(self, tweet_id):
+        with self._lock:
+            self._memory.pop(tweet_id, None)
+        for compression in ("zstd", "gzip"):
+            remove_file(self._path(tweet_id, compression))
+
+    def _maybe_sweep(self):
+        now = time.monotonic()
+        with self._lock:
+            if (
+                self._swept_at is not None
+                and now - self._swept_at < self.sweep_interval
+            ):
+                return
+            self._swept_at = now
+        self.sweep()
+
+    def sweep(self):
+        """Delete expired files, then the least recently used ones above ``max_disk_bytes``."""
+        max_age = max(self.ttl, self.negative_ttl)
+        now = time.time()
+        files = []
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            if now - stat.st_mtime >= max_age:
+                # Also left-over .tmp files of interrupted writes
+                remove_file(entry.path)
+            elif not entry.name.endswith(".tmp"):
+                # A fresh .tmp file is being written by another thread
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            remove_file(path)
+            total -= size
+
+
+def remove_file(path):
+    # Another thread or process may have removed it first
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,85 @@
+import collections
+import threading
+import time
+
+# Stages of a tweet download, in order
+STAGES = ("queued", "resolve", "download", "transcode")
+
+
+class Progress:
+    """Progress of one tweet download, updated by the download loops.
+
+    ``add_total`` and ``advance`` are called from many threads (media
+    items, ranges, segments) with byte counts; ``snapshot`` returns the
+    stage, bytes done and total, the throughput over the last ``window``
+    seconds and the errors reported so far.
+    """
+
+    def __init__(self, window=2.0):
+        self.window = window
+        self.stage = "queued"
+        self.bytes_done = 0
+        self.bytes_total = 0
+        self.errors = []
+        self._history = collections.deque()
+        self._lock = threading.Lock()
+
+    def set_stage(self, stage):
+        assert stage in STAGES, f"Unknown stage: {stage}"
+        self.stage = stage
+
+    def add_total(self, size):
+        with self._lock:
+            self.bytes_total += size
+
+    def add_done(self, size):
+        """Count bytes that were already there (resumed downloads, the media store)."""
+        with self._lock:
+            self.bytes_done += size
+
+    def advance(self, size):
+        now = time.monotonic()
+        with self._lock:
+            self.bytes_done += size
+            self._history.append((now, size))
+            while self._history and self._history[0][0] < now - self.window:
+                self._history.popleft()
+
+    def error(self, message):
+        with self._lock:
+            self.errors.append(message)
+
+    def throughput(self):
+        """Bytes per second over the last ``window`` seconds."""
+        now = time.monotonic()
+        with self._lock:
+            recent = sum(size for t, size in self._history if t >= now - self.window)
+        return recent / self.window
+
+    def snapshot(self):
+        throughput = self.throughput()
+        with self._lock:
+            return {
+                "stage": self.stage,
+                "bytes_done": self.bytes_done,
+                "bytes_total": self.bytes_total,
+                "throughput": throughput,
+                "errors": list(self.errors),
+            }
+
+
+def progress_hook(throttle, progress):
+    """Per-chunk callable(size) reporting to ``progress`` and then applying ``throttle``.
+
+    Either may be None; returns None if both are.
+    """
+    if progress is None:
+        return throttle
+    if throttle is None:
+        return progress.advance
+
+    def hook(size):
+        progress.advance(size)
+        throttle(size)
+
+    return hook
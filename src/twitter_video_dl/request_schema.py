@@ -0,0 +1,86 @@
+import copy
+import os
+import re
+import threading
+
+from .storage import file_lock, read_json, write_json_atomic
+
+needed_variable_pattern = re.compile(r"Variable '([^']+)'")
+needed_features_pattern = re.compile(r'The following features cannot be null: ([^"]+)')
+
+
+class RequestSchema:
+    """GraphQL ``features``/``variables`` learned from 400 error responses.
+
+    One in-memory copy is shared by all threads and guarded by a lock.  It is
+    persisted to RequestDetails.json with an atomic rename while holding a
+    cross-process file lock, and flags learned by other processes are picked
+    up from the file, so each new flag only has to be learned once.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = f"{path}.lock"
+        self._lock = threading.Lock()
+        self._details = read_json(path)
+        self._mtime = self._get_mtime()
+
+    def _get_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _merge(self, details):
+        # Keep our values, add anything new found in ``details``
+        changed = False
+        for key in ("features", "variables"):
+            for name, value in (details or {}).get(key, {}).items():
+                if name not in self._details[key]:
+                    self._details[key][name] = value
+                    changed = True
+        return changed
+
+    def snapshot(self):
+        """Return copies of (features, variables) to build a request with."""
+        with self._lock:
+            mtime = self._get_mtime()
+            if mtime != self._mtime:
+                self._merge(read_json(self.path))
+                self._mtime = mtime
+            return (
+                copy.deepcopy(self._details["features"]),
+                copy.deepcopy(self._details["variables"]),
+            )
+
+    def learn(self, error_json):
+        """Apply every missing variable/feature reported in one error response.
+
+        Returns True if anything new was learned.
+        """
+        needed_vars = []
+        needed_features = []
+        for error in error_json.get("errors", []):
+            message = error.get("message", "")
+            needed_vars += needed_variable_pattern.findall(message)
+            for nf in needed_features_pattern.findall(message):
+                needed_features += [feature.strip() for feature in nf.split(",")]
+
+        changed = False
+        with self._lock:
+            for name in needed_vars:
+                if self._details["variables"].get(name) is not True:
+                    self._details["variables"][name] = True
+                    changed = True
+            for name in needed_features:
+                if name and self._details["features"].get(name) is not True:
+                    self._details["features"][name] = True
+                    changed = True
+        return changed
+
+    def save(self):
+        """Persist the learned schema, merging flags other processes saved."""
+        with self._lock, file_lock(self.lock_path):
+            self._merge(read_json(self.path))
+            write_json_atomic(self.path, self._details)
+            self._mtime = self._get_mtime()
@@ -0,0 +1,44 @@
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into one.
+
+    The first caller of ``do(key, fn)`` runs ``fn``; callers arriving with
+    the same key while it runs wait for it and get its result (or its
+    exception) instead of running ``fn`` again.  Once the call has
+    finished the key is free again, so later calls are not cached here.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """Returns: (result of fn, True if the result came from another caller's call)"""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+
+        if not leader:
+            return future.result(), True
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return result, False
+
+    def in_flight(self):
+        """Number of keys with a call running."""
+        with self._lock:
+            return len(self._calls)
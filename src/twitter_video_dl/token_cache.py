@@ -0,0 +1,214 @@
+import re
+import threading
+import time
+
+from .storage import read_json, write_json_atomic
+
+
+class TokenCache:
+    """Cache of (bearer_token, guest_token, query_id) kept in memory and on disk.
+
+    The disk copy lets the CLI entry points and the server process share one
+    set of tokens.  Entries expire after ``ttl`` seconds and can be dropped
+    early with ``invalidate`` when the API rejects the guest token.
+    """
+
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entry = None
+
+    def _is_fresh(self, entry):
+        if not isinstance(entry, dict):
+            return False
+        if not all(entry.get(k) for k in ("bearer_token", "guest_token", "query_id")):
+            return False
+        return time.time() - entry.get("created_at", 0) < self.ttl
+
+    def get(self):
+        """Return the cached token tuple, or None if nothing fresh is cached."""
+        with self._lock:
+            if not self._is_fresh(self._entry):
+                # Another process may have refreshed the tokens in the meantime
+                self._entry = read_json(self.path)
+                if not self._is_fresh(self._entry):
+                    self._entry = None
+                    return None
+            entry = self._entry
+            return entry["bearer_token"], entry["guest_token"], entry["query_id"]
+
+    def put(self, bearer_token, guest_token, query_id):
+        entry = {
+            "bearer_token": bearer_token,
+            "guest_token": guest_token,
+            "query_id": query_id,
+            "created_at": time.time(),
+        }
+        with self._lock:
+            self._entry = entry
+            write_json_atomic(self.path, entry)
+
+    def invalidate(self, guest_token=None):
+        """Drop the cached entry.
+
+        If ``guest_token`` is given, the entry is only dropped when it still
+        holds that token, so a refresh done by someone else is not discarded.
+        """
+        with self._lock:
+            if self._matches(self._entry, guest_token):
+                self._entry = None
+            if self._matches(read_json(self.path), guest_token):
+                write_json_atomic(self.path, {})
+
+    @staticmethod
+    def _matches(entry, guest_token):
+        if not isinstance(entry, dict) or not entry:
+            return False
+        return guest_token is None or entry.get("guest_token") == guest_token
+
+
+class MainJsCache:
+    """Cache of values parsed out of main.js, keyed by the hash in its filename.
+
+    A ``main.<hash>.js`` bundle never changes once published, so the bearer
+    token and the operationName -> queryId map only need to be parsed once
+    per hash.  Only the parsed values are stored, not the bundle itself.
+    """
+
+    def __init__(self, path, max_entries=8):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = None
+
+    @staticmethod
+    def key_for(mainjs_url):
+        match = re.search(r"main\.([^./]+)\.js", mainjs_url)
+        return match.group(1) if match else mainjs_url
+
+    def _load(self):
+        if self._entries is None:
+            entries = read_json(self.path, default={})
+            self._entries = entries if isinstance(entries, dict) else {}
+        return self._entries
+
+    def get(self, mainjs_url):
+        """Return (bearer_token, query_ids) for this main.js, or None."""
+        with self._lock:
+            entry = self._load().get(self.key_for(mainjs_url))
+            if entry is None:
+                # Pick up entries written by other processes
+                self._entries = None
+                entry = self._load().get(self.key_for(mainjs_url))
+            if not entry:
+                return None
+            return entry["bearer_token"], dict(entry["query_ids"])
+
+    def latest_query_id(self, operation_name):
+        """Return the queryId of ``operation_name`` from the newest cached main.js."""
+        with self._lock:
+            self._entries = None
+            for entry in reversed(list(self._load().values())):
+                query_id = entry.get("query_ids", {}).get(operation_name)
+                if query_id:
+                    return query_id
+            return None
+
+    def put(self, mainjs_url, bearer_token, query_ids):
+        with self._lock:
+            self._entries = None
+            entries = self._load()
+            entries.pop(self.key_for(mainjs_url), None)
+            entries[self.key_for(mainjs_url)] = {
+                "bearer_token": bearer_token,
+                "query_ids": query_ids,
+                "created_at": time.time(),
+            }
+            # Oldest entries first (insertion order), drop beyond max_entries
+            for key in list(entries)[: max(0, len(entries) - self.max_entries)]:
+                del entries[key]
+            write_json_atomic(self.path, entries)
+
+
+class GuestTokenPool:
+    """Pool of activated guest tokens shared by concurrent downloads.
+
+    Tokens are handed out least-used first, retired when the API answers
+    403/429, and refilled in a background thread with ``activate``
+    (a callable taking a bearer token and returning a new guest token).
+    """
+
+    def __init__(self, activate, size):
+        self._activate = activate
+        self.size = size
+        self._lock = threading.Lock()
+        self._uses = {}
+        self._retired = set()
+        self._bearer_token = None
+        self._refill_thread = None
+
+    def _set_bearer_token(self, bearer_token):
+        # Guest tokens are bound to the bearer token that activated them
+        if bearer_token != self._bearer_token:
+            self._bearer_token = bearer_token
+            self._uses.clear()
+
+    def add(self, bearer_token, guest_token):
+        with self._lock:
+            self._set_bearer_token(bearer_token)
+            if guest_token not in self._retired:
+                self._uses.setdefault(guest_token, 0)
+
+    def acquire(self, bearer_token):
+        """Return the least-used guest token, activating one if the pool is empty."""
+        with self._lock:
+            self._set_bearer_token(bearer_token)
+            if self._uses:
+                guest_token = min(self._uses, key=self._uses.get)
+                self._uses[guest_token] += 1
+                self._start_refill()
+                return guest_token
+
+        guest_token = self._activate(bearer_token)
+        with self._lock:
+            if bearer_token == self._bearer_token:
+                self._uses[guest_token] = self._uses.get(guest_token, 0) + 1
+            self._start_refill()
+        return guest_token
+
+    def retire(self, guest_token):
+        with self._lock:
+            self._uses.pop(guest_token, None)
+            self._retired.add(guest_token)
+            self._start_refill()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._uses)
+
+    def _start_refill(self):
+        # Called with the lock held
+        if len(self._uses) >= self.size or self._bearer_token is None:
+            return
+        if self._refill_thread is not None and self._refill_thread.is_alive():
+            return
+        self._refill_thread = threading.Thread(
+            target=self._refill, args=(self._bearer_token,), daemon=True
+        )
+        self._refill_thread.start()
+
+    def _refill(self, bearer_token):
+        while True:
+            with self._lock:
+                if bearer_token != self._bearer_token or len(self._uses) >= self.size:
+                    return
+            try:
+                guest_token = self._activate(bearer_token)
+            except Exception:
+                # Try again on the next acquire/retire instead of spinning
+                return
+            with self._lock:
+                if bearer_token != self._bearer_token:
+                    return
+                self._uses.setdefault(guest_token, 0)
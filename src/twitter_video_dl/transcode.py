@@ -0,0 +1,188 @@
+import contextlib
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .progress import progress_hook
+from .transfer import is_identity_encoded, iter_body
+
+
+def lower_priority(process, nice):
+    """Add ``nice`` to the niceness of a started process (POSIX only).
+
+    Done after the start rather than with preexec_fn, which is not safe in
+    a process running other threads.
+    """
+    if not nice or not hasattr(os, "setpriority"):
+        return
+    try:
+        current = os.getpriority(os.PRIO_PROCESS, process.pid)
+        os.setpriority(os.PRIO_PROCESS, process.pid, current + nice)
+    except OSError:
+        # Already exited
+        pass
+
+
+def convert_file_to_gif(mp4_path, gif_path, loglevel="error", nice=0):
+    """Convert a downloaded MP4 to a GIF with ffmpeg and delete the MP4.
+
+    ffmpeg gets no stdin, so a conversion running in the background cannot
+    swallow the answers to overwrite prompts.  The MP4 is kept if the
+    conversion fails.  Returns True on success.
+    """
+    command = [
+        "ffmpeg",
+        "-nostdin",
+        "-y",
+        "-loglevel",
+        loglevel,
+        "-i",
+        mp4_path,
+        gif_path,
+    ]
+    process = subprocess.Popen(command, stdin=subprocess.DEVNULL)
+    lower_priority(process, nice)
+    if process.wait() != 0:
+        return False
+    os.remove(mp4_path)
+    return True
+
+
+def stream_to_gif(
+    client,
+    url,
+    gif_path,
+    loglevel="error",
+    throttle=None,
+    nice=0,
+    progress=None,
+    info=None,
+):
+    """Download ``url`` straight into ffmpeg's stdin and write only the GIF.
+
+    No MP4 touches the disk: the response body is piped to ``ffmpeg -i
+    pipe:0`` as it arrives, ffmpeg writes ``<gif_path>.part`` and the file is
+    renamed into place when ffmpeg succeeds.  ffmpeg can only read an MP4
+    from a pipe if its index (moov atom) comes first, so a failure is
+    reported rather than raised and the caller can fall back to
+    convert_file_to_gif.  ``progress`` (see progress.Progress) gets the
+    length and every chunk piped.  If given, the ``info`` dict receives the
+    ``"validator"`` (ETag / Last-Modified) and ``"size"`` of the MP4.
+
+    Returns: the HTTP status code (200 on success), or None if ffmpeg failed
+    """
+    response = client.get(url, stream=True)
+    try:
+        if response.status_code != 200:
+            return response.status_code
+
+        length = response.headers.get("Content-Length")
+        if (
+            progress is not None
+            and length
+            and length.isdigit()
+            and is_identity_encoded(response)
+        ):
+            progress.add_total(int(length))
+        throttle = progress_hook(throttle, progress)
+        size = 0
+
+        part_path = f"{gif_path}.part"
+        command = [
+            "ffmpeg",
+            "-y",
+            "-loglevel",
+            loglevel,
+            "-i",
+            "pipe:0",
+            "-f",
+            "gif",
+            part_path,
+        ]
+        process = subprocess.Popen(command, stdin=subprocess.PIPE)
+        lower_priority(process, nice)
+        try:
+            for chunk in iter_body(response):
+                if not chunk:
+                    continue
+                if throttle is not None:
+                    throttle(len(chunk))
+                process.stdin.write(chunk)
+                size += len(chunk)
+            process.stdin.close()
+        except BrokenPipeError:
+            # ffmpeg gave up on the input; its exit code tells the rest
+            pass
+        except BaseException:
+            process.kill()
+            process.wait()
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+        finally:
+            if not process.stdin.closed:
+                try:
+                    process.stdin.close()
+                except BrokenPipeError:
+                    pass
+
+        if process.wait() != 0:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            return None
+        os.replace(part_path, gif_path)
+        if info is not None:
+            info["validator"] = response.headers.get("ETag") or response.headers.get(
+                "Last-Modified"
+            )
+            info["size"] = size
+        return 200
+    finally:
+        response.close()
+
+
+class TranscodeQueue:
+    """Runs ffmpeg conversions next to the downloads instead of in between.
+
+    At most ``max_workers`` ffmpeg processes (default: one per CPU) run at a
+    time, each started with ``nice`` added to its niceness so conversions do
+    not starve the downloads.  ``submit`` returns immediately with a Future;
+    ``on_done(success)`` is called from the worker thread when the
+    conversion finished.  ``slot`` lets a conversion running outside the
+    queue (pipe mode) count against the same limit.  ``observe(seconds)``
+    is called with the duration of every conversion run by the queue.
+    """
+
+    def __init__(self, max_workers=None, nice=0, loglevel="error", observe=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.nice = nice
+        self.loglevel = loglevel
+        self.observe = observe
+        self._slots = threading.BoundedSemaphore(self.max_workers)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="transcode"
+        )
+
+    @contextlib.contextmanager
+    def slot(self):
+        with self._slots:
+            yield
+
+    def _convert(self, mp4_path, gif_path, on_done):
+        with self.slot():
+            start = time.monotonic()
+            success = convert_file_to_gif(mp4_path, gif_path, self.loglevel, self.nice)
+            if self.observe is not None:
+                self.observe(time.monotonic() - start)
+        if on_done is not None:
+            on_done(success)
+        return success
+
+    def submit(self, mp4_path, gif_path, on_done=None):
+        """Queue the conversion of ``mp4_path``; the Future resolves to True on success."""
+        return self._executor.submit(self._convert, mp4_path, gif_path, on_done)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,515 @@
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from .http_client import USE_CURL_CFFI
+from .progress import progress_hook
+from .storage import read_json, write_json_atomic
+
+# Ranges and segments of every download run on these long-lived threads.
+# HttpClient keeps one session per thread, so reusing the threads keeps their
+# connections (and TLS sessions) open from one file to the next.
+transfer_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="transfer")
+
+
+def fetch_segment(client, url, retries=3, backoff=0.5, throttle=None):
+    """GET one segment into memory, retrying failed attempts.
+
+    ``throttle`` (see BandwidthLimiter.throttle) is charged for the segment.
+
+    Returns (content, attempts).  Raises AssertionError once every attempt
+    has failed.
+    """
+    errors = []
+    for attempt in range(1, retries + 2):
+        try:
+            response = client.get(url)
+            if response.status_code == 200:
+                if throttle is not None:
+                    throttle(len(response.content))
+                return response.content, attempt
+            errors.append(f"status code {response.status_code}")
+        except Exception as e:
+            errors.append(e)
+        if attempt <= retries:
+            time.sleep(backoff * attempt)
+
+    assert False, (
+        f"Could not download segment {url} after {len(errors)} attempts: {errors}"
+    )
+
+
+def download_segments(
+    client,
+    urls,
+    output_filename,
+    concurrency=8,
+    max_buffer_bytes=32 * 1024 * 1024,
+    retries=3,
+    throttle=None,
+    progress=None,
+):
+    """Download ``urls`` concurrently and write them to ``output_filename`` in order.
+
+    Up to ``concurrency`` segments are in flight at once on
+    ``transfer_executor`` (each worker thread reuses its pooled connection
+    via ``client``).  Segments that finish out
+    of order wait in a reorder buffer; no new segment is started while the
+    buffer holds more than ``max_buffer_bytes``, so memory stays bounded by
+    roughly that cap plus ``concurrency`` segments.  Each segment is retried
+    up to ``retries`` times; if one still fails, the partial file is removed
+    and the AssertionError is raised.  ``progress`` (see progress.Progress)
+    gets every segment as it arrives; the playlist does not list segment
+    sizes, so the total grows with them.
+
+    Returns per-segment stats in order: dicts with "url", "bytes",
+    "seconds", "attempts" and "mbps" (MB/s).
+    """
+    num = len(urls)
+    stats = [None] * num
+
+    def fetch(index):
+        start = time.perf_counter()
+        content, attempts = fetch_segment(
+            client, urls[index], retries, throttle=throttle
+        )
+        seconds = time.perf_counter() - start
+        if progress is not None:
+            progress.add_total(len(content))
+            progress.advance(len(content))
+        stats[index] = {
+            "url": urls[index],
+            "bytes": len(content),
+            "seconds": seconds,
+            "attempts": attempts,
+            "mbps": len(content) / seconds / 1e6 if seconds > 0 else 0.0,
+        }
+        return index, content
+
+    concurrency = max(1, concurrency)
+    pending = set()
+    buffered = {}
+    buffered_bytes = 0
+    next_submit = 0
+    next_write = 0
+
+    try:
+        with open(output_filename, "wb") as f:
+            while next_write < num:
+                while (
+                    next_submit < num
+                    and len(pending) < concurrency
+                    and buffered_bytes < max_buffer_bytes
+                ):
+                    pending.add(transfer_executor.submit(fetch, next_submit))
+                    next_submit += 1
+
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, content = future.result()
+                    buffered[index] = content
+                    buffered_bytes += len(content)
+
+                # Flush everything that is now contiguous
+                while next_write in buffered:
+                    content = buffered.pop(next_write)
+                    buffered_bytes -= len(content)
+                    f.write(content)
+                    next_write += 1
+    except BaseException:
+        for future in pending:
+            future.cancel()
+        # Do not leave a truncated video behind
+        if os.path.exists(output_filename):
+            os.remove(output_filename)
+        raise
+
+    return stats
+
+
+def iter_body(response, chunk_size=1024 * 1024):
+    """Iterate a streamed response body.
+
+    curl_cffi ignores (and warns about) chunk_size, so it is only passed to
+    requests.
+    """
+    if USE_CURL_CFFI:
+        return response.iter_content()
+    return response.iter_content(chunk_size=chunk_size)
+
+
+def is_identity_encoded(response):
+    """True if the body bytes on the wire are the file bytes (no gzip etc.)."""
+    return response.headers.get("Content-Encoding", "identity").lower() == "identity"
+
+
+def preallocate(fd, size):
+    """Reserve ``size`` bytes for ``fd`` (posix_fallocate, else ftruncate)."""
+    if hasattr(os, "posix_fallocate"):
+        os.posix_fallocate(fd, 0, size)
+    else:
+        os.ftruncate(fd, size)
+
+
+def copy_body(
+    response,
+    fd,
+    offset=None,
+    on_write=None,
+    min_chunk=64 * 1024,
+    max_chunk=4 * 1024 * 1024,
+    throttle=None,
+):
+    """Stream a response body into ``fd`` with few, large writes.
+
+    Data is read into one reusable buffer whose size starts at ``min_chunk``
+    and doubles every time it fills up, to at most ``max_chunk``.  With
+    requests the socket is read straight into it with ``raw.readinto``;
+    curl_cffi hands over its own (~16 KiB) chunks, which are coalesced in
+    the buffer instead.  Nothing is flushed per chunk.
+
+    Writes go to ``offset`` with os.pwrite (advancing it) or, if ``offset``
+    is None, to the current file position.  ``on_write`` is called with the
+    number of bytes after every write, and ``throttle`` (see
+    BandwidthLimiter.throttle) with the number of bytes before it.  Returns
+    the number of bytes written.
+    """
+    buffer = bytearray(max_chunk)
+    view = memoryview(buffer)
+    size = min_chunk
+    total = 0
+
+    def write(data):
+        nonlocal offset, total
+        if throttle is not None:
+            throttle(len(data))
+        while data:
+            if offset is None:
+                written = os.write(fd, data)
+            else:
+                written = os.pwrite(fd, data, offset)
+                offset += written
+            data = data[written:]
+            total += written
+            if on_write is not None:
+                on_write(written)
+
+    # requests exposes the urllib3 response as .raw; curl_cffi has no such thing
+    raw = getattr(response, "raw", None)
+    if hasattr(raw, "readinto") and is_identity_encoded(response):
+        while True:
+            read = raw.readinto(view[:size])
+            if not read:
+                break
+            write(view[:read])
+            if read == size and size < max_chunk:
+                size = min(size * 2, max_chunk)
+        return total
+
+    filled = 0
+    try:
+        for chunk in iter_body(response):
+            chunk = memoryview(chunk)
+            while chunk:
+                take = min(len(chunk), size - filled)
+                view[filled : filled + take] = chunk[:take]
+                filled += take
+                chunk = chunk[take:]
+                if filled == size:
+                    write(view[:filled])
+                    filled = 0
+                    if size < max_chunk:
+                        size = min(size * 2, max_chunk)
+    finally:
+        # Keep what was received before an error so it can be resumed
+        if filled:
+            write(view[:filled])
+    return total
+
+
+def probe(client, url):
+    """HEAD ``url``; return (size, accepts_ranges, validator).
+
+    size is None if unknown; validator is the ETag (or Last-Modified) used
+    to tell whether a partial download can be continued.
+    """
+    try:
+        response = client.head(url, allow_redirects=True)
+    except Exception:
+        return None, False, None
+    if response.status_code != 200:
+        return None, False, None
+
+    length = response.headers.get("Content-Length")
+    size = int(length) if length and length.isdigit() else None
+    accepts_ranges = response.headers.get("Accept-Ranges", "").lower() == "bytes"
+    validator = response.headers.get("ETag") or response.headers.get("Last-Modified")
+    return size, accepts_ranges, validator
+
+
+def split_ranges(size, parts):
+    """Split ``size`` bytes into ``parts`` contiguous (start, end) ranges, end inclusive."""
+    part_size = -(-size // parts)
+    return [
+        (start, min(start + part_size, size) - 1) for start in range(0, size, part_size)
+    ]
+
+
+def download_stream(client, url, output_filename, throttle=None, progress=None):
+    """Download ``url`` over a single streaming GET into ``<output_filename>.part``.
+
+    The file is preallocated when the length is known and renamed into
+    place once complete.  Returns the status code; nothing is written unless
+    it is 200.  ``progress`` (see progress.Progress) gets the length and
+    every chunk written.
+    """
+    part_path = f"{output_filename}.part"
+    response = client.get(url, stream=True)
+    try:
+        if response.status_code != 200:
+            return response.status_code
+
+        length = response.headers.get("Content-Length")
+        known_length = length and length.isdigit() and is_identity_encoded(response)
+        if known_length and progress is not None:
+            progress.add_total(int(length))
+        fd = os.open(part_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            if known_length:
+                preallocate(fd, int(length))
+            # Drop the preallocated tail if the body was shorter
+            os.ftruncate(
+                fd,
+                copy_body(response, fd, throttle=progress_hook(throttle, progress)),
+            )
+        except BaseException:
+            # Without Range support there is nothing to resume from
+            os.close(fd)
+            os.remove(part_path)
+            raise
+        os.close(fd)
+        os.replace(part_path, output_filename)
+        return response.status_code
+    finally:
+        response.close()
+
+
+def fetch_range(
+    client,
+    url,
+    fd,
+    span,
+    retries=3,
+    backoff=0.5,
+    stop=None,
+    on_write=None,
+    throttle=None,
+):
+    """GET the bytes of ``span`` and os.pwrite them at their offset.
+
+    ``span`` is a [start, end, next] list (end inclusive) and ``span[2]`` is
+    advanced as bytes are written, so a failed attempt (or a later run)
+    continues from the last byte written.  ``on_write`` is called with the
+    number of bytes after every write.  Gives up as soon as the ``stop``
+    event is set (another range failed).
+    """
+    start, end = span[0], span[1]
+    errors = []
+
+    def advance(written):
+        span[2] += written
+        if on_write is not None:
+            on_write(written)
+        assert stop is None or not stop.is_set(), "Download aborted"
+
+    for attempt in range(1, retries + 2):
+        try:
+            response = client.get(
+                url, headers={"Range": f"bytes={span[2]}-{end}"}, stream=True
+            )
+            try:
+                # 200 means the server ignored the range (or the file changed)
+                assert response.status_code == 206, (
+                    f"status code {response.status_code}"
+                )
+                copy_body(
+                    response,
+                    fd,
+                    offset=span[2],
+                    on_write=advance,
+                    throttle=throttle,
+                )
+            finally:
+                response.close()
+            if span[2] > end:
+                return
+            errors.append(f"connection closed at byte {span[2]}")
+        except Exception as e:
+            errors.append(e)
+            if stop is not None and stop.is_set():
+                raise
+        if attempt <= retries:
+            time.sleep(backoff * attempt)
+
+    assert False, (
+        f"Could not download bytes {start}-{end} of {url} after {len(errors)} attempts: {errors}"
+    )
+
+
+def load_resume_state(state_path, part_path, url, size, validator):
+    """Return the saved ranges of a partial download of ``url``, or None.
+
+    The download is only continued if the sidecar was written for the same
+    URL, size and validator, and the .part file is still there.
+    """
+    state = read_json(state_path)
+    if (
+        validator is None
+        or not isinstance(state, dict)
+        or state.get("url") != url
+        or state.get("validator") != validator
+        or state.get("size") != size
+        or not os.path.exists(part_path)
+        or os.path.getsize(part_path) != size
+    ):
+        return None
+    return state["ranges"]
+
+
+def download_ranged(
+    client,
+    url,
+    output_filename,
+    connections=4,
+    min_part_bytes=4 * 1024 * 1024,
+    retries=3,
+    checkpoint_bytes=8 * 1024 * 1024,
+    throttle=None,
+    info=None,
+    progress=None,
+):
+    """Download ``url`` over up to ``connections`` parallel Range requests.
+
+    The ranges run on ``transfer_executor``, whose threads keep their
+    connections open for the next download.
+
+    The size, Range support and validator (ETag / Last-Modified) are probed
+    with HEAD.  Data goes to a preallocated ``<output_filename>.part``, each
+    range written at its offset with os.pwrite, and a ``.part.json`` sidecar
+    records the URL, validator and the bytes done per range (every
+    ``checkpoint_bytes`` and when the download stops).  A later call for the
+    same file continues each range with ``Range: bytes=N-`` if the validator
+    still matches, and starts over otherwise.  The .part file is renamed
+    into place once complete.
+
+    Falls back to download_stream when the server does not support ranges,
+    the size is unknown, os.pwrite is not available (Windows) or the file is
+    smaller than two parts of ``min_part_bytes`` (most images) and there is
+    no partial download of it to continue; those files cost one plain GET
+    and no sidecar.
+
+    If ``info`` is a dict, the probed validator is stored in
+    ``info["validator"]``.  ``progress`` (see progress.Progress) gets the
+    size, the bytes already done when resuming and every chunk written.
+
+    Returns the status code (200 on success).  A range failing every retry
+    raises AssertionError; the .part file and sidecar are kept for resuming.
+    """
+    size, accepts_ranges, validator = probe(client, url)
+    if info is not None:
+        info["validator"] = validator
+    if not accepts_ranges or not size or not hasattr(os, "pwrite"):
+        return download_stream(
+            client, url, output_filename, throttle=throttle, progress=progress
+        )
+
+    part_path = f"{output_filename}.part"
+    state_path = f"{part_path}.json"
+
+    ranges = load_resume_state(state_path, part_path, url, size, validator)
+    resumed = ranges is not None
+    parts = max(1, min(connections, size // min_part_bytes))
+    if not resumed and parts == 1:
+        # A sidecar of an outdated partial download would never be used again
+        if os.path.exists(state_path):
+            os.remove(state_path)
+        return download_stream(
+            client, url, output_filename, throttle=throttle, progress=progress
+        )
+
+    if progress is not None:
+        progress.add_total(size)
+    throttle = progress_hook(throttle, progress)
+    if resumed:
+        fd = os.open(part_path, os.O_WRONLY)
+        if progress is not None:
+            progress.add_done(sum(span[2] - span[0] for span in ranges))
+    else:
+        ranges = [[start, end, start] for start, end in split_ranges(size, parts)]
+        fd = os.open(part_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+
+    lock = threading.Lock()
+    unsaved = 0
+
+    def save_state():
+        # Data first: the sidecar must never claim bytes that are not on disk
+        snapshot = [list(span) for span in ranges]
+        os.fsync(fd)
+        write_json_atomic(
+            state_path,
+            {"url": url, "validator": validator, "size": size, "ranges": snapshot},
+        )
+
+    def on_write(written):
+        nonlocal unsaved
+        with lock:
+            unsaved += written
+            if unsaved >= checkpoint_bytes:
+                unsaved = 0
+                save_state()
+
+    stop = threading.Event()
+    futures = []
+    try:
+        if not resumed:
+            preallocate(fd, size)
+            if validator is not None:
+                save_state()
+        futures = [
+            transfer_executor.submit(
+                fetch_range,
+                client,
+                url,
+                fd,
+                span,
+                retries,
+                stop=stop,
+                on_write=on_write if validator is not None else None,
+                throttle=throttle,
+            )
+            for span in ranges
+            if span[2] <= span[1]
+        ]
+        for future in futures:
+            future.result()
+    except BaseException:
+        # Running ranges still write to fd: stop them before closing it
+        stop.set()
+        for future in futures:
+            future.cancel()
+        wait(futures)
+        if validator is not None:
+            save_state()
+            os.close(fd)
+        else:
+            # Without a validator a later run could not trust the partial data
+            os.close(fd)
+            os.remove(part_path)
+        raise
+
+    os.close(fd)
+    os.replace(part_path, output_filename)
+    if os.path.exists(state_path):
+        os.remove(state_path)
+    return 200
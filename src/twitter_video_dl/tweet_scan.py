@@ -0,0 +1,208 @@
+import json
+import re
+
+VIDEO_PREFIX = "https://video.twimg.com/"
+TWEET_VIDEO_PREFIX = VIDEO_PREFIX + "tweet_video/"
+REPLIES_PREFIX = "conversationthread-"
+CONTAINER = "container=fmp4"
+INTERESTING_PREFIXES = (VIDEO_PREFIX, REPLIES_PREFIX)
+
+# https://video.twimg.com/amplify_video/1638969830442237953/vid/1080x1920/lXSFa54mAVp7KHim.mp4?tag=16
+amplify_pattern = re.compile(
+    r"(https://video.twimg.com/amplify_video/(\d+)/vid/(\d+x\d+)/[^.]+.mp4\?tag=\d+)"
+)
+# https://video.twimg.com/ext_tw_video/1451958820348080133/pu/vid/720x1280/GddnMJ7KszCQQFvA.mp4?tag=12
+ext_tw_pattern = re.compile(
+    r"(https://video.twimg.com/ext_tw_video/(\d+)/pu/vid/(avc1/)?(\d+x\d+)/[^.]+.mp4\?tag=\d+)"
+)
+# https://x.com/user/status/1641086559037579264/video/1
+status_url_pattern = re.compile(
+    r"https://(?:x\.com|twitter\.com)/[^/]+/status/(\d+)(.*)", re.DOTALL
+)
+# The strings scan_tweet_json needs from the serialized response.  Each
+# starts with a literal, so a separate pass per pattern is much faster than
+# one alternation; the reply cutoff is a position, not part of the order.
+JSON_STRING = r'"([^"\\]*(?:\\.[^"\\]*)*)"'
+expanded_url_pattern = re.compile(
+    r'"expanded_url"\s*:\s*' + JSON_STRING + r'(?:\s*,\s*"id_str"\s*:\s*"(\d+)"\s*,)?'
+)
+source_status_pattern = re.compile(r'"source_status_id_str"\s*:\s*"(\d+)"')
+video_url_pattern = re.compile(
+    r'"(https:\\?/\\?/video\.twimg\.com\\?/[^"\\]*(?:\\.[^"\\]*)*)"'
+)
+
+
+class TweetScan:
+    """Everything extract_mp4s, get_associated_media_id and repost_check need
+    from a GraphQL response, collected in a single pass.
+
+    Lists are in document order, i.e. the order a regex over the serialized
+    response would find them.  ``in_replies`` is True for entries after the
+    first ``"conversationthread-..."`` string (the start of the replies).
+    """
+
+    __slots__ = (
+        "mp4_matches",
+        "container_urls",
+        "tweet_video_urls",
+        "media_links",
+        "source_status_ids",
+        "expanded_urls",
+        "_video_urls",
+        "_status_urls",
+    )
+
+    def __init__(self):
+        # (url, media id, resolution) of amplify_video / ext_tw_video mp4s
+        self.mp4_matches = []
+        self.container_urls = []
+        self.tweet_video_urls = []
+        # (status id, rest of the url, id_str) of media entities linking to a status
+        self.media_links = []
+        # (source_status_id_str, in_replies)
+        self.source_status_ids = []
+        # (expanded_url, status id, rest of the url, in_replies) of status links
+        self.expanded_urls = []
+        # Every media is listed twice (entities and extended_entities); the
+        # second copy shares what was parsed from the first:
+        # url -> (container url, tweet_video url, mp4 matches)
+        self._video_urls = {}
+        # url -> (status id, rest of the url), or None if it is no status link
+        self._status_urls = {}
+
+    def add_video_url(self, value):
+        found = self._video_urls.get(value)
+        if found is None:
+            found = self._video_urls[value] = parse_video_url(value)
+        container_url, tweet_video_url, mp4_matches = found
+        if container_url is not None:
+            self.container_urls.append(container_url)
+        if tweet_video_url is not None:
+            self.tweet_video_urls.append(tweet_video_url)
+        self.mp4_matches += mp4_matches
+
+    def add_expanded_url(self, value, id_str, in_replies):
+        """Record a status link; ``id_str`` is set if it is a media entity."""
+        if value in self._status_urls:
+            found = self._status_urls[value]
+        else:
+            match = status_url_pattern.fullmatch(value)
+            found = self._status_urls[value] = match and match.groups()
+        if found is None:
+            return
+        status_id, rest = found
+        self.expanded_urls.append((value, status_id, rest, in_replies))
+        if id_str is not None:
+            self.media_links.append((status_id, rest, id_str))
+
+
+def parse_video_url(value):
+    end = value.rfind(CONTAINER)
+    container_url = value[: end + len(CONTAINER)] if end != -1 else None
+    tweet_video_url = value if value.startswith(TWEET_VIDEO_PREFIX) else None
+    mp4_matches = []
+    # findall returns a copy of value when the whole url matches; keep value
+    # Only mp4 urls can match; skip the regexes for playlists, thumbnails...
+    if ".mp4" in value:
+        if "/amplify_video/" in value:
+            for url, media_id, resolution in amplify_pattern.findall(value):
+                mp4_matches.append(
+                    (value if url == value else url, media_id, resolution)
+                )
+        if "/ext_tw_video/" in value:
+            for url, media_id, _, resolution in ext_tw_pattern.findall(value):
+                mp4_matches.append(
+                    (value if url == value else url, media_id, resolution)
+                )
+    return container_url, tweet_video_url, mp4_matches
+
+
+def scan_tweet_json(j):
+    """Scan a GraphQL response (text or parsed JSON) once and return a TweetScan.
+
+    Text is scanned as is, without parsing it: a response is usually only
+    read for these few strings, and the parsed tree costs more time and
+    memory than the regex pass.
+    """
+    if isinstance(j, TweetScan):
+        return j
+    if isinstance(j, bytes):
+        j = j.decode()
+    if isinstance(j, str):
+        return scan_text(j)
+
+    scan = TweetScan()
+    in_replies = False
+
+    def walk(obj):
+        # Hot loop: exact type checks and one startswith per string
+        nonlocal in_replies
+        if type(obj) is dict:
+            for key, value in obj.items():
+                if key.startswith(REPLIES_PREFIX):
+                    in_replies = True
+                value_type = type(value)
+                if value_type is str:
+                    if key == "expanded_url":
+                        scan.add_expanded_url(value, media_id_str(obj), in_replies)
+                    elif key == "source_status_id_str" and value.isdigit():
+                        scan.source_status_ids.append((value, in_replies))
+                    if value.startswith(INTERESTING_PREFIXES):
+                        if value.startswith(REPLIES_PREFIX):
+                            in_replies = True
+                        else:
+                            scan.add_video_url(value)
+                elif value_type is dict or value_type is list:
+                    walk(value)
+        else:
+            for value in obj:
+                value_type = type(value)
+                if value_type is str:
+                    if value.startswith(INTERESTING_PREFIXES):
+                        if value.startswith(REPLIES_PREFIX):
+                            in_replies = True
+                        else:
+                            scan.add_video_url(value)
+                elif value_type is dict or value_type is list:
+                    walk(value)
+
+    if isinstance(j, (dict, list)):
+        walk(j)
+    return scan
+
+
+def media_id_str(obj):
+    """id_str of a media entity, i.e. '"expanded_url": ..., "id_str": "<digits>", <more keys>'."""
+    keys = list(obj)
+    index = keys.index("expanded_url")
+    id_str = obj.get("id_str")
+    if (
+        index + 2 < len(keys)
+        and keys[index + 1] == "id_str"
+        and isinstance(id_str, str)
+        and id_str.isdigit()
+    ):
+        return id_str
+    return None
+
+
+def unescape(value):
+    # Twitter does not escape "/" in urls, so this is rarely needed
+    return json.loads(f'"{value}"') if "\\" in value else value
+
+
+def scan_text(text):
+    scan = TweetScan()
+    replies_start = text.find('"' + REPLIES_PREFIX)
+    if replies_start == -1:
+        replies_start = len(text)
+    for match in expanded_url_pattern.finditer(text):
+        url, id_str = match.groups()
+        in_replies = match.start() > replies_start
+        scan.add_expanded_url(unescape(url), id_str, in_replies)
+    for match in source_status_pattern.finditer(text):
+        in_replies = match.start() > replies_start
+        scan.source_status_ids.append((match.group(1), in_replies))
+    for match in video_url_pattern.finditer(text):
+        scan.add_video_url(unescape(match.group(1)))
+    return scan
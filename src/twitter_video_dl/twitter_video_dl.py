@@ -1,19 +1,27 @@
+import functools
+import hashlib
 import inspect
 import json
 import os
 import re
-import subprocess
 import urllib.parse
-
-# Use curl-cffi instead of standard requests for TLS fingerprint handling
-try:
-    from curl_cffi import requests
-
-    USE_CURL_CFFI = True
-except ImportError:
-    import requests
-
-    USE_CURL_CFFI = False
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+from .bandwidth import BandwidthLimiter
+from .hedging import run_hedged
+from .http_client import USE_CURL_CFFI, HttpClient  # noqa: F401
+from .job_store import JobStore
+from .jobs import JobQueue
+from .manifest import is_unchanged, record_conversion, record_download
+from .media_store import MediaStore, clone_file, hash_file, media_key
+from .metadata_cache import NEGATIVE, MetadataCache
+from .metrics import Metrics
+from .request_schema import RequestSchema
+from .singleflight import SingleFlight
+from .token_cache import GuestTokenPool, MainJsCache, TokenCache
+from .transcode import TranscodeQueue, stream_to_gif
+from .transfer import download_ranged, download_segments
+from .tweet_scan import scan_tweet_json
 
 """
 Hey, thanks for reading the comments.  I love you.
@@ -27,26 +35,197 @@ Here's how this works:
 """
 script_dir = os.path.dirname(os.path.realpath(__file__))
 request_details_file = f"{script_dir}{os.sep}RequestDetails.json"
-request_details = json.load(open(request_details_file, "r"))
-
-features, variables = request_details["features"], request_details["variables"]
+request_schema = RequestSchema(request_details_file)
 
 # Open setting file
 with open("./src/twitter_video_dl/settings.json", "r") as f:
     data = json.load(f)
 
+# Served by the server on /metrics (Prometheus text format)
+metrics = Metrics()
+stage_seconds = metrics.histogram(
+    "tvdl_stage_seconds",
+    "Time spent per stage: tokens, resolve (tweet metadata), download, transcode, queued (server jobs)",
+    ("stage",),
+)
+http_request_seconds = metrics.histogram(
+    "tvdl_http_request_seconds",
+    "Time to the response headers per endpoint",
+    ("endpoint",),
+)
+http_requests = metrics.counter(
+    "tvdl_http_requests_total",
+    "HTTP requests per endpoint and status",
+    ("endpoint", "status"),
+)
+tweet_lookups = metrics.counter(
+    "tvdl_tweet_lookups_total",
+    "Tweets looked up per API that answered (graphql: the Syndication API failed or lost the hedge)",
+    ("source",),
+)
+graphql_retries = metrics.counter(
+    "tvdl_graphql_400_retries_total",
+    "GraphQL requests sent again after a 400 named missing features or variables",
+)
+downloaded_bytes = metrics.counter(
+    "tvdl_downloaded_bytes_total", "Media bytes received per host", ("host",)
+)
+
+
+def endpoint_name(url):
+    """
+    Label for the endpoint of a URL: the host and the first path segment, or the operation name for GraphQL.
+    e.g. cdn.syndication.twimg.com/tweet-result, x.com/graphql/TweetResultByRestId, video.twimg.com/ext_tw_video
+    """
+    parsed = urllib.parse.urlparse(url)
+    parts = [part for part in parsed.path.split("/") if part]
+    if "graphql" in parts:
+        return f"{parsed.hostname}/graphql/{parts[-1]}"
+    return f"{parsed.hostname}/{parts[0]}" if parts else str(parsed.hostname)
+
+
+def observe_http_request(method, url, status, seconds):
+    endpoint = endpoint_name(url)
+    http_request_seconds.observe(seconds, endpoint=endpoint)
+    http_requests.inc(endpoint=endpoint, status=status)
+
+
 # Get the value of convert_gif_flag
 convert_gif_flag = data["gif"]["convert_gif_flag"]
 
+# Pipe the download straight into ffmpeg instead of converting a saved mp4
+gif_pipe = data["gif"]["pipe"]
+
 # Get ffmpeg loglevel
 ffmpeg_loglevel = data["ffmpeg"]["loglevel"]
 
+# Get transcode settings (max_workers 0 = one per CPU)
+transcode_settings = data["transcode"]
+
+# mp4 -> gif conversions run here, next to the downloads
+transcode_queue = TranscodeQueue(
+    max_workers=transcode_settings["max_workers"],
+    nice=transcode_settings["nice"],
+    loglevel=ffmpeg_loglevel,
+    observe=functools.partial(stage_seconds.observe, stage="transcode"),
+)
+
 # Get image save option
 image_save_option = data["image"]["save_option"]
 
 # Get debug option
 debug_option = data["debug_option"]
 
+# Get cache settings
+cache_dir = data["cache"]["directory"]
+token_ttl_seconds = data["cache"]["token_ttl_seconds"]
+
+# Tokens are shared between the CLI entry points and the server through this file
+token_cache = TokenCache(f"{cache_dir}{os.sep}tokens.json", token_ttl_seconds)
+mainjs_cache = MainJsCache(f"{cache_dir}{os.sep}mainjs.json")
+
+guest_token_pool_size = data["graphql"]["guest_token_pool_size"]
+graphql_batch_size = data["graphql"]["batch_size"]
+
+# Get network settings
+network_settings = data["network"]
+
+# Every network call goes through this client (pooled keep-alive connections)
+http_client = HttpClient(
+    connect_timeout=network_settings["connect_timeout_seconds"],
+    read_timeout=network_settings["read_timeout_seconds"],
+    http2=network_settings["http2"],
+    observe=observe_http_request,
+)
+
+# Get metadata cache settings
+metadata_cache_settings = data["metadata_cache"]
+
+# Raw API responses per tweet ID (memory LRU + compressed files)
+metadata_cache = MetadataCache(
+    f"{cache_dir}{os.sep}metadata",
+    memory_entries=metadata_cache_settings["memory_entries"],
+    ttl=metadata_cache_settings["ttl_seconds"],
+    negative_ttl=metadata_cache_settings["negative_ttl_seconds"],
+    disk=metadata_cache_settings["disk"],
+    compression=metadata_cache_settings["compression"],
+    max_disk_bytes=metadata_cache_settings["max_disk_mb"] * 1024 * 1024,
+)
+
+# Get download settings
+download_settings = data["download"]
+
+# Media items of every tweet run on these long-lived threads (see run_media_jobs),
+# so their sessions and connections are reused from one tweet to the next.
+# media_concurrency items per tweet, for as many tweets as the server runs at once.
+media_executor = ThreadPoolExecutor(
+    max_workers=download_settings["media_concurrency"]
+    * max(1, data["server"]["workers"]),
+    thread_name_prefix="media",
+)
+
+# Get bandwidth settings (MB per second, 0 = unlimited)
+bandwidth_settings = data["bandwidth"]
+
+# Shared by every download loop in this process
+bandwidth_limiter = BandwidthLimiter(
+    rate=bandwidth_settings["rate_mb"] * 1024 * 1024,
+    burst=bandwidth_settings["burst_mb"] * 1024 * 1024,
+    host_limits={
+        host: (limits["rate_mb"] * 1024 * 1024, limits["burst_mb"] * 1024 * 1024)
+        for host, limits in bandwidth_settings["hosts"].items()
+    },
+)
+metrics.gauge(
+    "tvdl_bandwidth_utilization",
+    "Recent throughput over the rate limit, per host bucket (global for the total cap)",
+    lambda: {
+        host: stats["utilization"]
+        for host, stats in bandwidth_limiter.utilization().items()
+    },
+    ("host",),
+)
+
+# Get media store settings
+media_store_settings = data["media_store"]
+
+# Downloaded media by URL and content hash, shared across tweets
+media_store = MediaStore(
+    f"{cache_dir}{os.sep}media",
+    max_bytes=media_store_settings["max_size_mb"] * 1024 * 1024,
+    link_mode=media_store_settings["link_mode"],
+    enabled=media_store_settings["enabled"],
+)
+# Locks of the manifests written in "verify" mode (see manifest.py)
+manifest_locks = f"{cache_dir}{os.sep}locks"
+
+# Concurrent requests for the same tweet (by ID) or media (by media_key) share one lookup / download
+tweet_flights = SingleFlight()
+media_flights = SingleFlight()
+metrics.gauge(
+    "tvdl_shared_calls_in_flight",
+    "Tweet lookups and media downloads running that concurrent requests can join",
+    lambda: {"tweet": tweet_flights.in_flight(), "media": media_flights.in_flight()},
+    ("kind",),
+)
+
+# Get server settings (twitter-video-dl-server.py)
+server_settings = data["server"]
+
+# Get job store settings (server and resumable batch runs)
+job_store_settings = data["job_store"]
+
+# Get hedging settings
+hedge_enabled = data["hedging"]["enabled"]
+hedge_delay_seconds = data["hedging"]["delay_seconds"]
+
+# X API error codes meaning the guest token is no longer accepted
+GUEST_TOKEN_ERROR_CODES = (239, 200)
+
+
+class GuestTokenRejectedError(AssertionError):
+    """Raised when the GraphQL API rejects the guest token as stale or invalid."""
+
 
 def delete_debug_log(debug_option=False):
     if debug_option:
@@ -70,51 +249,118 @@ def debug_write_log(message, debug_option=False):
             log_file.write(debug_message)
 
 
-def get_tokens(tweet_url):
+def parse_mainjs(mainjs_text):
     """
-    Welcome to the world of getting a bearer token and guest id.
-    1. If you request the twitter url for the tweet you'll get back a blank 'tweet not found' page.  In the browser, subsequent javascript calls will populate this page with data.  The blank page includes a script tag for a 'main.js' file that contains the bearer token.
-    2. 'main.js' has a random string of numbers and letters in the filename.  We will request the tweet url, use a regex to find our unique main.js file, and then request that main.js file.
-    3. The main.js file contains a bearer token.  We will extract that token and return it.  We can find the token by looking for a lot of A characters in a row.
-    4. Now that we have the bearer token, how do we get the guest id?  Easy, we activate the bearer token to get it.
+    Extract the bearer token and every operationName -> queryId pair from main.js in one pass.
+    Returns: (bearer_token or None, query_ids)
     """
+    # Multiple methods to find bearer token
+    bearer_token = re.search(r'AAAAAAAAA[^"]+', mainjs_text)
 
-    # Normalize URL (twitter.com -> x.com)
-    tweet_url = tweet_url.replace("https://twitter.com", "https://x.com")
+    # Fallback method if first method fails
+    if bearer_token is None:
+        bearer_token = re.search(r'Bearer\s+([^\s"]+)', mainjs_text)
+        bearer_token = bearer_token.group(1) if bearer_token else None
+    else:
+        bearer_token = bearer_token.group(0)
 
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:84.0) Gecko/20100101 Firefox/84.0",
-        "Accept": "*/*",
-        "Accept-Language": "en-US, en, *;q=0.5",
-        "Accept-Encoding": "gzip, deflate, br",
-        "TE": "trailers",
-    }
+    # Remove "Bearer " prefix if present
+    if bearer_token and bearer_token.startswith("Bearer "):
+        bearer_token = bearer_token.replace("Bearer ", "")
 
-    # Use curl-cffi with browser impersonation to avoid TLS fingerprint blocking
-    if USE_CURL_CFFI:
-        session = requests.Session(impersonate="chrome110")
-    else:
-        session = requests.Session()
+    # Pattern: queryId:"...",...operationName:"..." (first queryId wins per operation)
+    query_ids = {}
+    for query_id, operation_name in re.findall(
+        r'queryId:"([a-zA-Z0-9_-]+)"[^}]*?operationName:"([a-zA-Z0-9_]+)"',
+        mainjs_text,
+    ):
+        query_ids.setdefault(operation_name, query_id)
+
+    return bearer_token, query_ids
+
+
+def get_mainjs_details(session, mainjs_url, tweet_url):
+    """
+    Return (bearer_token, query_ids) for main.js, downloading and parsing it only when its hash is not cached yet.
+    """
+    cached = mainjs_cache.get(mainjs_url)
+    if cached is not None:
+        debug_write_log(f"Using cached main.js details: {mainjs_url}", debug_option)
+        return cached
+
+    mainjs = session.get(mainjs_url)
+
+    assert (
+        mainjs.status_code == 200
+    ), f"Failed to get main.js file. Status code: {mainjs.status_code}. Tweet url: {tweet_url}"
+
+    bearer_token, query_ids = parse_mainjs(mainjs.text)
+
+    assert (
+        bearer_token is not None and len(bearer_token) > 0
+    ), f"Failed to find bearer token. Tweet url: {tweet_url}, main.js url: {mainjs_url}"
+
+    mainjs_cache.put(mainjs_url, bearer_token, query_ids)
+    return bearer_token, query_ids
+
+
+TOKEN_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:84.0) Gecko/20100101 Firefox/84.0",
+    "Accept": "*/*",
+    "Accept-Language": "en-US, en, *;q=0.5",
+    "Accept-Encoding": "gzip, deflate, br",
+    "TE": "trailers",
+}
+
+
+def create_token_session():
+    # Own session (cookie jar) for the token flow, configured like the shared client
+    session = http_client.new_session()
 
     # Persist headers across all requests (like Node.js axios.create())
-    session.headers.update(headers)
+    session.headers.update(TOKEN_HEADERS)
+    return session
 
-    response = session.get(tweet_url)
-    debug_write_log(response.text, debug_option)
+
+def activate_guest_token(bearer_token, session=None):
+    if session is None:
+        session = create_token_session()
+
+    # Get guest token via API (more reliable with curl-cffi)
+    session.headers.update({"authorization": f"Bearer {bearer_token}"})
+    guest_token_response = session.post(
+        "https://api.twitter.com/1.1/guest/activate.json"
+    )
+
+    debug_write_log(guest_token_response.text, debug_option)
 
     assert (
-        response.status_code == 200
-    ), f"Failed to get tweet page. Status code: {response.status_code}. Tweet url: {tweet_url}"
+        guest_token_response.status_code == 200
+    ), f"Failed to activate guest token. Status code: {guest_token_response.status_code}"
+
+    return guest_token_response.json()["guest_token"]
+
+
+guest_token_pool = GuestTokenPool(activate_guest_token, guest_token_pool_size)
+
+
+MIGRATE_URL = "https://x.com/x/migrate"
 
+
+def find_redirect_url(page_text, tweet_url):
+    """
+    Find the redirect target of the tweet page.
+    Returns: (redirect_url, tok parameter or None)
+    """
     # Multiple redirect detection methods
     redirect_url_match = re.search(
-        r'content="0; url = (https://twitter\.com/[^"]+)"', response.text
+        r'content="0; url = (https://twitter\.com/[^"]+)"', page_text
     )
 
     # Fallback to JavaScript redirect if meta refresh not found
     if redirect_url_match is None:
         js_redirect_match = re.search(
-            r'window\.location\.replace\("([^"]+)"\)', response.text
+            r'window\.location\.replace\("([^"]+)"\)', page_text
         )
         if js_redirect_match:
             redirect_url_match = js_redirect_match
@@ -129,108 +375,162 @@ def get_tokens(tweet_url):
     tok_match = re.search(r'tok=([^&"]+)', redirect_url)
     tok = tok_match.group(1) if tok_match else None
 
-    response = session.get(redirect_url, allow_redirects=False)
-    debug_write_log(response.text, debug_option)
+    return redirect_url, tok
 
-    assert (
-        response.status_code == 200
-    ), f"Failed to get redirect page. Status code: {response.status_code}. Redirect URL: {redirect_url}"
 
+def get_migrate_params(page_text, tok):
     # Find data parameter (optional)
-    data_match = re.search(
-        r'<input type="hidden" name="data" value="([^"]+)"', response.text
-    )
+    data_match = re.search(r'<input type="hidden" name="data" value="([^"]+)"', page_text)
     data = data_match.group(1) if data_match else None
 
     # Prepare authentication request
-    auth_url = "https://x.com/x/migrate"
     auth_params = {}
     if tok:
         auth_params["tok"] = tok
     if data:
         auth_params["data"] = data
+    return auth_params
+
+
+def find_mainjs_url(page_text):
+    mainjs_urls = re.findall(
+        r"https://abs\.twimg\.com/responsive-web/client-web(?:-legacy)?/main\.[^\.]+\.js",
+        page_text,
+    )
+    return mainjs_urls[0] if mainjs_urls else None
+
+
+def get_tokens(tweet_url):
+    """
+    Welcome to the world of getting a bearer token and guest id.
+    1. If you request the twitter url for the tweet you'll get back a blank 'tweet not found' page.  In the browser, subsequent javascript calls will populate this page with data.  The blank page includes a script tag for a 'main.js' file that contains the bearer token.
+    2. 'main.js' has a random string of numbers and letters in the filename.  We will request the tweet url, use a regex to find our unique main.js file, and then request that main.js file.
+    3. The main.js file contains a bearer token.  We will extract that token and return it.  We can find the token by looking for a lot of A characters in a row.
+    4. Now that we have the bearer token, how do we get the guest id?  Easy, we activate the bearer token to get it.
+    """
+
+    # Normalize URL (twitter.com -> x.com)
+    tweet_url = tweet_url.replace("https://twitter.com", "https://x.com")
+
+    session = create_token_session()
+
+    response = session.get(tweet_url)
+    debug_write_log(response.text, debug_option)
+
+    assert (
+        response.status_code == 200
+    ), f"Failed to get tweet page. Status code: {response.status_code}. Tweet url: {tweet_url}"
+
+    redirect_url, tok = find_redirect_url(response.text, tweet_url)
+
+    response = session.get(redirect_url, allow_redirects=False)
+    debug_write_log(response.text, debug_option)
+
+    assert (
+        response.status_code == 200
+    ), f"Failed to get redirect page. Status code: {response.status_code}. Redirect URL: {redirect_url}"
+
+    auth_params = get_migrate_params(response.text, tok)
 
     # Only send auth request if we have parameters
     if auth_params:
-        response = session.post(auth_url, data=auth_params, allow_redirects=True)
+        response = session.post(MIGRATE_URL, data=auth_params, allow_redirects=True)
 
         debug_write_log(response.text, debug_option)
 
         assert (
             response.status_code == 200
-        ), f"Failed to authenticate. Status code: {response.status_code}. Auth URL: {auth_url}"
+        ), f"Failed to authenticate. Status code: {response.status_code}. Auth URL: {MIGRATE_URL}"
     else:
         response = session.get(redirect_url)
 
-    # Find main.js URL
-    mainjs_urls = re.findall(
-        r"https://abs\.twimg\.com/responsive-web/client-web(?:-legacy)?/main\.[^\.]+\.js",
-        response.text,
-    )
+    mainjs_url = find_mainjs_url(response.text)
 
     assert (
-        mainjs_urls is not None and len(mainjs_urls) > 0
+        mainjs_url is not None
     ), f"Failed to find main.js file. Tweet url: {tweet_url}"
 
-    mainjs_url = mainjs_urls[0]
-    mainjs = session.get(mainjs_url)
+    bearer_token, query_ids = get_mainjs_details(session, mainjs_url, tweet_url)
+
+    # Example: queryId:"tCVRZ3WCvoj0BVO7BKnL-Q",operationName:"TweetResultByRestId"
+    query_id = query_ids.get("TweetResultByRestId")
 
     assert (
-        mainjs.status_code == 200
-    ), f"Failed to get main.js file. Status code: {mainjs.status_code}. Tweet url: {tweet_url}"
+        query_id is not None
+    ), f"Failed to find query ID in main.js. Tweet url: {tweet_url}, main.js url: {mainjs_url}"
 
-    # Multiple methods to find bearer token
-    bearer_token = re.findall(r'AAAAAAAAA[^"]+', mainjs.text)
+    debug_write_log(f"Extracted Query ID: {query_id}", debug_option)
 
-    # Fallback method if first method fails
-    if not bearer_token:
-        bearer_token = re.findall(r'Bearer\s+([^\s"]+)', mainjs.text)
+    guest_token = activate_guest_token(bearer_token, session)
 
     assert (
-        bearer_token is not None and len(bearer_token) > 0
-    ), f"Failed to find bearer token. Tweet url: {tweet_url}, main.js url: {mainjs_url}"
-
-    bearer_token = bearer_token[0]
-
-    # Remove "Bearer " prefix if present
-    if bearer_token.startswith("Bearer "):
-        bearer_token = bearer_token.replace("Bearer ", "")
+        guest_token is not None and len(guest_token) > 0
+    ), f"Failed to find guest token. Tweet url: {tweet_url}, main.js url: {mainjs_url}"
 
-    # Extract Query ID from main.js
-    # Pattern: Look for queryId before operationName:"TweetResultByRestId"
-    # Example: queryId:"tCVRZ3WCvoj0BVO7BKnL-Q",operationName:"TweetResultByRestId"
-    query_id_match = re.search(
-        r'queryId:"([a-zA-Z0-9_-]+)"[^}]*?operationName:"TweetResultByRestId"',
-        mainjs.text,
-    )
+    return bearer_token, guest_token, query_id
 
-    assert (
-        query_id_match is not None
-    ), f"Failed to find query ID in main.js. Tweet url: {tweet_url}, main.js url: {mainjs_url}"
 
-    query_id = query_id_match.group(1)
+def get_cached_tokens(tweet_url, force_refresh=False):
+    """
+    Return (bearer_token, guest_token, query_id) from the token cache, calling get_tokens only when nothing fresh is cached.
+    The guest token is taken from guest_token_pool so concurrent downloads spread their requests over several tokens.
+    """
+    tokens = None if force_refresh else token_cache.get()
+    if tokens is None:
+        with stage_seconds.time(stage="tokens"):
+            tokens = get_tokens(tweet_url)
+        token_cache.put(*tokens)
+    else:
+        debug_write_log("Using cached tokens", debug_option)
 
-    debug_write_log(f"Extracted Query ID: {query_id}", debug_option)
+    bearer_token, guest_token, query_id = tokens
+    guest_token_pool.add(bearer_token, guest_token)
+    return bearer_token, guest_token_pool.acquire(bearer_token), query_id
 
-    # Get guest token via API (more reliable with curl-cffi)
-    session.headers.update({"authorization": f"Bearer {bearer_token}"})
-    guest_token_response = session.post(
-        "https://api.twitter.com/1.1/guest/activate.json"
-    )
 
-    debug_write_log(guest_token_response.text, debug_option)
+def is_guest_token_rejected(details):
+    if details.status_code in (401, 403, 429):
+        return True
+    try:
+        errors = json.loads(details.text).get("errors", [])
+    except (json.JSONDecodeError, AttributeError):
+        return False
+    return any(error.get("code") in GUEST_TOKEN_ERROR_CODES for error in errors)
 
-    assert (
-        guest_token_response.status_code == 200
-    ), f"Failed to activate guest token. Status code: {guest_token_response.status_code}. Tweet url: {tweet_url}"
 
-    guest_token = guest_token_response.json()["guest_token"]
+def call_with_cached_tokens(tweet_url, fetch):
+    """
+    Call fetch(guest_token, bearer_token, query_id) with cached tokens.
+    When the API rejects the guest token (403/429, bad guest token), the token is retired from the pool and the call is retried with another one; if that is rejected too, all tokens are refreshed once.
+    """
+    bearer_token, guest_token, query_id = get_cached_tokens(tweet_url)
+    for force_refresh in (False, True):
+        try:
+            return fetch(guest_token, bearer_token, query_id)
+        except GuestTokenRejectedError as e:
+            debug_write_log(f"{e} Retiring guest token.", debug_option)
+            guest_token_pool.retire(guest_token)
+            token_cache.invalidate(guest_token)
+            if force_refresh:
+                bearer_token, guest_token, query_id = get_cached_tokens(
+                    tweet_url, force_refresh=True
+                )
+            else:
+                guest_token = guest_token_pool.acquire(bearer_token)
+                token_cache.put(bearer_token, guest_token, query_id)
+    return fetch(guest_token, bearer_token, query_id)
 
-    assert (
-        guest_token is not None and len(guest_token) > 0
-    ), f"Failed to find guest token. Tweet url: {tweet_url}, main.js url: {mainjs_url}"
 
-    return bearer_token, guest_token, query_id
+def get_tweet_details_with_cached_tokens(tweet_url):
+    """
+    GraphQL lookup using cached tokens, refreshed only when the API rejects the guest token.
+    """
+    return call_with_cached_tokens(
+        tweet_url,
+        lambda guest_token, bearer_token, query_id: get_tweet_details(
+            tweet_url, guest_token, bearer_token, query_id
+        ),
+    )
 
 
 def get_details_url(tweet_id, features, variables, query_id):
@@ -250,11 +550,18 @@ def get_tweet_details(tweet_url, guest_token, bearer_token, query_id):
 
     tweet_id = tweet_id[0]
 
-    # the url needs a url encoded version of variables and features as a query string
-    url = get_details_url(tweet_id, features, variables, query_id)
+    return request_graphql(
+        lambda features, variables: get_details_url(
+            tweet_id, features, variables, query_id
+        ),
+        get_graphql_headers(guest_token, bearer_token),
+        tweet_url,
+    )
 
+
+def get_graphql_headers(guest_token, bearer_token):
     # Use curl-cffi for GraphQL API requests to avoid TLS fingerprint blocking
-    headers = {
+    return {
         "authorization": f"Bearer {bearer_token}",
         "x-guest-token": guest_token,
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:84.0) Gecko/20100101 Firefox/84.0",
@@ -264,7 +571,16 @@ def get_tweet_details(tweet_url, guest_token, bearer_token, query_id):
         "Content-Type": "application/json",
     }
 
-    details = requests.get(url, headers=headers)
+
+def request_graphql(build_url, headers, tweet_url):
+    """
+    Send a GraphQL request built by build_url(features, variables), learning missing features/variables from 400 responses.
+    """
+    # the url needs a url encoded version of variables and features as a query string
+    features, variables = request_schema.snapshot()
+    url = build_url(features, variables)
+
+    details = http_client.get(url, headers=headers)
 
     # Log response status and try to parse JSON
     debug_write_log(f"Response status: {details.status_code}", debug_option)
@@ -281,6 +597,11 @@ def get_tweet_details(tweet_url, guest_token, bearer_token, query_id):
             f"Response text (first 1000 chars): {details.text[:1000]}", debug_option
         )
 
+    if is_guest_token_rejected(details):
+        raise GuestTokenRejectedError(
+            f"Guest token was rejected. Status code: {details.status_code}. Tweet url: {tweet_url}"
+        )
+
     max_retries = 10
     cur_retry = 0
     while details.status_code == 400 and cur_retry < max_retries:
@@ -293,24 +614,18 @@ def get_tweet_details(tweet_url, guest_token, bearer_token, query_id):
             "errors" in error_json
         ), f"Failed to find errors in details error json.  If you are using the correct Twitter URL this suggests a bug in the script.  Please open a GitHub issue and copy and paste this message.  Status code: {details.status_code}.  Tweet url: {tweet_url}"
 
-        needed_variable_pattern = re.compile(r"Variable '([^']+)'")
-        needed_features_pattern = re.compile(
-            r'The following features cannot be null: ([^"]+)'
-        )
-
-        for error in error_json["errors"]:
-            needed_vars = needed_variable_pattern.findall(error["message"])
-            for needed_var in needed_vars:
-                variables[needed_var] = True
-
-            needed_features = needed_features_pattern.findall(error["message"])
-            for nf in needed_features:
-                for feature in nf.split(","):
-                    features[feature.strip()] = True
+        # Apply every missing variable/feature from this response at once.
+        # Another worker may already have learned them, so compare snapshots too.
+        learned = request_schema.learn(error_json)
+        used = (features, variables)
+        features, variables = request_schema.snapshot()
+        if not learned and (features, variables) == used:
+            debug_write_log("No new features or variables to learn", debug_option)
+            break
 
-        url = get_details_url(tweet_id, features, variables, query_id)
+        url = build_url(features, variables)
 
-        details = requests.get(url, headers=headers)
+        details = http_client.get(url, headers=headers)
 
         # Try to log the response
         try:
@@ -326,14 +641,11 @@ def get_tweet_details(tweet_url, guest_token, bearer_token, query_id):
             )
 
         cur_retry += 1
+        graphql_retries.inc()
 
         if details.status_code == 200:
             # save new variables
-            request_details["variables"] = variables
-            request_details["features"] = features
-
-            with open(request_details_file, "w") as f:
-                json.dump(request_details, f, indent=4)
+            request_schema.save()
 
     assert (
         details.status_code == 200
@@ -342,19 +654,186 @@ def get_tweet_details(tweet_url, guest_token, bearer_token, query_id):
     return details
 
 
-def get_tweet_status_id(tweet_url):
+def get_details_url_batch(tweet_ids, features, variables, query_id):
+    # create a copy of variables - we don't want to modify the original
+    variables = {**variables}
+    variables.pop("tweetId", None)
+    variables["tweetIds"] = list(tweet_ids)
+
+    return f"https://twitter.com/i/api/graphql/{query_id}/TweetResultsByRestIds?variables={urllib.parse.quote(json.dumps(variables))}&features={urllib.parse.quote(json.dumps(features))}"
+
+
+def get_tweet_details_batch(tweet_ids, guest_token, bearer_token, query_id):
+    """
+    Look up many tweets with one TweetResultsByRestIds request.
+    Returns: {tweet_id: tweetResult item, or None if the tweet was not returned}
+    """
+    details = request_graphql(
+        lambda features, variables: get_details_url_batch(
+            tweet_ids, features, variables, query_id
+        ),
+        get_graphql_headers(guest_token, bearer_token),
+        f"tweet ids: {','.join(tweet_ids)}",
+    )
+
+    tweet_results = json.loads(details.text).get("data", {}).get("tweetResult") or []
+
+    # Results normally come back in request order; otherwise match them by rest_id
+    if len(tweet_results) == len(tweet_ids):
+        return {
+            tweet_id: (item if item and item.get("result") else None)
+            for tweet_id, item in zip(tweet_ids, tweet_results)
+        }
+
+    items = {}
+    for item in tweet_results:
+        rest_id = ((item or {}).get("result") or {}).get("rest_id")
+        if rest_id:
+            items[rest_id] = item
+    return {tweet_id: items.get(tweet_id) for tweet_id in tweet_ids}
+
+
+def resolve_tweet_media_batch(tweet_urls):
+    """
+    Resolve the media of many tweets through the GraphQL API, graphql_batch_size tweets per request.
+    Results are fanned out into create_video_urls, one tweet at a time.  Tweets found in the metadata cache are not requested.
+    Returns: {tweet_url: (video_urls, gif_ptn, img_urls), or None if the tweet could not be resolved}
+    """
+    tweet_ids = {}
+    for tweet_url in tweet_urls:
+        tweet_id = re.findall(r"(?<=status/)\d+", tweet_url)
+        assert (
+            len(tweet_id) == 1
+        ), f"Could not parse tweet id from your url. Tweet url: {tweet_url}"
+        tweet_ids[tweet_url] = tweet_id[0]
+
+    # Tweets in the metadata cache need no request at all
+    cached_media = {}
+    for tweet_id in dict.fromkeys(tweet_ids.values()):
+        cached = metadata_cache.get(tweet_id)
+        if cached == NEGATIVE:
+            cached_media[tweet_id] = ([], False, [])
+        elif cached is not None:
+            cached_media[tweet_id] = extract_media(cached["source"], cached["data"])
+
+    unique_ids = [
+        tweet_id
+        for tweet_id in dict.fromkeys(tweet_ids.values())
+        if tweet_id not in cached_media
+    ]
+    items = {}
+
+    for start in range(0, len(unique_ids), graphql_batch_size):
+        chunk = unique_ids[start : start + graphql_batch_size]
+
+        def fetch(guest_token, bearer_token, query_id, chunk=chunk):
+            batch_query_id = mainjs_cache.latest_query_id("TweetResultsByRestIds")
+            if batch_query_id is None:
+                # main.js details are not cached; resolve this chunk one tweet at a time
+                return {
+                    tweet_id: json.loads(
+                        get_tweet_details(
+                            f"https://x.com/i/status/{tweet_id}",
+                            guest_token,
+                            bearer_token,
+                            query_id,
+                        ).text
+                    )["data"]["tweetResult"]
+                    for tweet_id in chunk
+                }
+            return get_tweet_details_batch(
+                chunk, guest_token, bearer_token, batch_query_id
+            )
+
+        with stage_seconds.time(stage="resolve"):
+            items.update(call_with_cached_tokens(tweet_urls[0], fetch))
+        tweet_lookups.inc(len(chunk), source="graphql_batch")
+        debug_write_log(f"Resolved {len(chunk)} tweets in one request", debug_option)
+
+    for tweet_id, item in items.items():
+        if item is None:
+            continue
+        data = {"data": {"tweetResult": item}}
+        video_urls, gif_ptn, img_urls = cached_media[tweet_id] = extract_media(
+            "graphql", data
+        )
+        if video_urls or img_urls:
+            metadata_cache.put(tweet_id, "graphql", data)
+        else:
+            metadata_cache.put_negative(tweet_id)
+
+    return {
+        tweet_url: cached_media.get(tweet_id)
+        for tweet_url, tweet_id in tweet_ids.items()
+    }
+
+
+def parse_tweet_status_id(tweet_url):
+    """
+    Status ID of a tweet URL (x.com or twitter.com, any query).
+    Returns: the ID, or None if the URL is not a tweet URL
+    """
     sid_patern = r"https://(?:x\.com|twitter\.com)/[^/]+/status/(\d+)"
     if tweet_url[len(tweet_url) - 1] != "/":
         tweet_url = tweet_url + "/"
 
     match = re.findall(sid_patern, tweet_url)
     if len(match) == 0:
+        return None
+    return match[0]
+
+
+def get_tweet_status_id(tweet_url):
+    status_id = parse_tweet_status_id(tweet_url)
+    if status_id is None:
         print("error, could not get status id from this tweet url :", tweet_url)
         exit()
-    status_id = match[0]
     return status_id
 
 
+SYNDICATION_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:84.0) Gecko/20100101 Firefox/84.0",
+    "Accept": "*/*",
+    "Accept-Language": "en-US, en, *;q=0.5",
+}
+
+
+def get_syndication_api_urls(tweet_id):
+    return [
+        f"https://cdn.syndication.twimg.com/tweet-result?id={tweet_id}&lang=en&token=0",
+        f"https://cdn.syndication.twimg.com/tweet-result?id={tweet_id}",
+        f"https://syndication.twitter.com/srv/timeline-profile/screen-name/x?tweet_id={tweet_id}",
+    ]
+
+
+def fetch_syndication_endpoint(api_url):
+    """
+    Request one Syndication API endpoint.  Returns the JSON data, or None if the response is not usable.
+    """
+    debug_write_log(f"Trying API: {api_url}", debug_option)
+
+    response = http_client.get(api_url, headers=SYNDICATION_HEADERS)
+
+    debug_write_log(f"API status: {response.status_code}", debug_option)
+    debug_write_log(f"Response (first 500 chars): {response.text[:500]}", debug_option)
+
+    if response.status_code == 200:
+        try:
+            data = response.json()
+            # Check if we got meaningful data
+            if data and (isinstance(data, dict) and len(data) > 0):
+                debug_write_log("Got valid JSON response", debug_option)
+                debug_write_log(
+                    json.dumps(data, indent=2, ensure_ascii=False)[:2000],
+                    debug_option,
+                )
+                return data
+        except json.JSONDecodeError:
+            debug_write_log(f"Failed to parse JSON from {api_url}", debug_option)
+
+    return None
+
+
 def get_tweet_details_syndication(tweet_url):
     """
     Use Twitter's Syndication API and fallback methods to get tweet details.
@@ -371,43 +850,11 @@ def get_tweet_details_syndication(tweet_url):
 
     tweet_id = tweet_id[0]
 
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:84.0) Gecko/20100101 Firefox/84.0",
-        "Accept": "*/*",
-        "Accept-Language": "en-US, en, *;q=0.5",
-    }
-
     # Try multiple API endpoints
-    api_urls = [
-        f"https://cdn.syndication.twimg.com/tweet-result?id={tweet_id}&lang=en&token=0",
-        f"https://cdn.syndication.twimg.com/tweet-result?id={tweet_id}",
-        f"https://syndication.twitter.com/srv/timeline-profile/screen-name/x?tweet_id={tweet_id}",
-    ]
-
-    for api_url in api_urls:
-        debug_write_log(f"Trying API: {api_url}", debug_option)
-
-        response = requests.get(api_url, headers=headers)
-
-        debug_write_log(f"API status: {response.status_code}", debug_option)
-        debug_write_log(
-            f"Response (first 500 chars): {response.text[:500]}", debug_option
-        )
-
-        if response.status_code == 200:
-            try:
-                data = response.json()
-                # Check if we got meaningful data
-                if data and (isinstance(data, dict) and len(data) > 0):
-                    debug_write_log("Got valid JSON response", debug_option)
-                    debug_write_log(
-                        json.dumps(data, indent=2, ensure_ascii=False)[:2000],
-                        debug_option,
-                    )
-                    return data
-            except json.JSONDecodeError:
-                debug_write_log(f"Failed to parse JSON from {api_url}", debug_option)
-                continue
+    for api_url in get_syndication_api_urls(tweet_id):
+        data = fetch_syndication_endpoint(api_url)
+        if data is not None:
+            return data
 
     # If all API attempts failed, raise error
     assert False, f"Failed to get tweet details from any Syndication API endpoint. Tweet url: {tweet_url}"
@@ -508,67 +955,38 @@ def extract_media_from_syndication(syndication_data):
 
 def get_associated_media_id(j, tweet_url):
     sid = get_tweet_status_id(tweet_url)
-    pattern = (
-        r'"expanded_url"\s*:\s*"https://(?:x\.com|twitter\.com)/[^/]+/status/'
-        + sid
-        + r'/[^"]+",\s*"id_str"\s*:\s*"\d+",'
-    )
-    matches = re.findall(pattern, j)
-    if len(matches) > 0:
-        target = matches[0]
-        target = target[0 : len(target) - 1]  # remove the coma at the end
-        return json.loads("{" + target + "}")["id_str"]
+    scan = scan_tweet_json(j)
+    # the media entity whose expanded_url is https://x.com/<user>/status/<sid>/...
+    for status_id, rest, id_str in scan.media_links:
+        if status_id == sid and rest.startswith("/") and len(rest) > 1:
+            return id_str
     return None
 
 
 def extract_mp4s(j, tweet_url, target_all_mp4s=False):
-    # pattern looks like https://video.twimg.com/amplify_video/1638969830442237953/vid/1080x1920/lXSFa54mAVp7KHim.mp4?tag=16 or https://video.twimg.com/ext_tw_video/1451958820348080133/pu/vid/720x1280/GddnMJ7KszCQQFvA.mp4?tag=12
-    amplitude_pattern = re.compile(
-        r"(https://video.twimg.com/amplify_video/(\d+)/vid/(\d+x\d+)/[^.]+.mp4\?tag=\d+)"
-    )
-    ext_tw_pattern = re.compile(
-        r"(https://video.twimg.com/ext_tw_video/(\d+)/pu/vid/(avc1/)?(\d+x\d+)/[^.]+.mp4\?tag=\d+)"
-    )
-    # format - https://video.twimg.com/tweet_video/Fvh6brqWAAQhU9p.mp4
-    tweet_video_pattern = re.compile(r'https://video.twimg.com/tweet_video/[^"]+')
+    # j is the GraphQL response (text, parsed JSON or a TweetScan); the urls are collected by scan_tweet_json
+    scan = scan_tweet_json(j)
+    media_id = get_associated_media_id(scan, tweet_url)
+    matches = scan.mp4_matches
+    container_matches = scan.container_urls
 
-    # https://video.twimg.com/ext_tw_video/1451958820348080133/pu/pl/b-CiC-gZClIwXgDz.m3u8?tag=12&container=fmp4
-    container_pattern = re.compile(r'https://video.twimg.com/[^"]*container=fmp4')
-    media_id = get_associated_media_id(j, tweet_url)
-    # find all the matches
-    matches = amplitude_pattern.findall(j)
-    matches += ext_tw_pattern.findall(j)
-    container_matches = container_pattern.findall(j)
-
-    tweet_video_matches = tweet_video_pattern.findall(j)
+    tweet_video_matches = scan.tweet_video_urls
 
     if len(matches) == 0 and len(tweet_video_matches) > 0:
         return tweet_video_matches
 
     results = {}
 
-    for match in matches:
-        url, tweet_id, _, resolution = match
-        if tweet_id not in results:
-            results[tweet_id] = {"resolution": resolution, "url": url}
-        else:
-            # if we already have a higher resolution video, then don't overwrite it
-            my_dims = [int(x) for x in resolution.split("x")]
-            their_dims = [int(x) for x in results[tweet_id]["resolution"].split("x")]
-
-            if my_dims[0] * my_dims[1] > their_dims[0] * their_dims[1]:
-                results[tweet_id] = {"resolution": resolution, "url": url}
+    for url, tweet_id, resolution in matches:
+        width, height = resolution.split("x")
+        area = int(width) * int(height)
+        # if we already have a higher resolution video, then don't overwrite it
+        if tweet_id not in results or area > results[tweet_id]["area"]:
+            results[tweet_id] = {"area": area, "url": url}
 
     if media_id:
-        all_urls = []
-        for twid in results:
-            all_urls.append(results[twid]["url"])
-        all_urls += container_matches
-
-        url_with_media_id = []
-        for url in all_urls:
-            if url.__contains__(media_id):
-                url_with_media_id.append(url)
+        all_urls = [x["url"] for x in results.values()] + container_matches
+        url_with_media_id = [url for url in all_urls if media_id in url]
 
         if len(url_with_media_id) > 0:
             return url_with_media_id
@@ -584,8 +1002,12 @@ def extract_mp4s(j, tweet_url, target_all_mp4s=False):
     return [x["url"] for x in results.values()]
 
 
-def download_parts(url, output_filename):
-    resp = requests.get(url, stream=True)
+def download_parts(url, output_filename, progress=None):
+    """
+    Download the highest resolution of a fragmented MP4 (fmp4 playlist) to output_filename.
+    progress (a progress.Progress) receives the size and bytes of every segment.
+    """
+    resp = http_client.get(url)
 
     # container begins with / ends with fmp4 and has a resolution in it we want to capture
     pattern = re.compile(r"(/[^\n]*/(\d+x\d+)/[^\n]*container=fmp4)")
@@ -609,7 +1031,7 @@ def download_parts(url, output_filename):
 
     video_part_prefix = "https://video.twimg.com"
 
-    resp = requests.get(video_part_prefix + max_res_url, stream=True)
+    resp = http_client.get(video_part_prefix + max_res_url)
 
     mp4_pattern = re.compile(r"(/[^\n]*\.mp4)")
     mp4_parts = mp4_pattern.findall(resp.text)
@@ -618,25 +1040,28 @@ def download_parts(url, output_filename):
         len(mp4_parts) == 1
     ), f"There should be exactly 1 mp4 container at this point.  Instead, found {len(mp4_parts)}.  Please open a GitHub issue and copy and paste this message into it.  Tweet url: {url}"
 
-    mp4_url = video_part_prefix + mp4_parts[0]
-
     m4s_part_pattern = re.compile(r"(/[^\n]*\.m4s)")
     m4s_parts = m4s_part_pattern.findall(resp.text)
 
-    with open(output_filename, "wb") as f:
-        r = requests.get(mp4_url, stream=True)
-        for chunk in r.iter_content(chunk_size=1024):
-            if chunk:
-                f.write(chunk)
-                f.flush()
-
-        for part in m4s_parts:
-            part_url = video_part_prefix + part
-            r = requests.get(part_url, stream=True)
-            for chunk in r.iter_content(chunk_size=1024):
-                if chunk:
-                    f.write(chunk)
-                    f.flush()
+    # Init segment first, then the media segments, fetched in parallel and written in order
+    part_urls = [video_part_prefix + part for part in [mp4_parts[0]] + m4s_parts]
+    with stage_seconds.time(stage="download"):
+        stats = download_segments(
+            http_client,
+            part_urls,
+            output_filename,
+            concurrency=download_settings["segment_concurrency"],
+            max_buffer_bytes=download_settings["segment_buffer_mb"] * 1024 * 1024,
+            retries=download_settings["segment_retries"],
+            throttle=media_throttle(part_urls[0]),
+            progress=progress,
+        )
+
+    for i, stat in enumerate(stats):
+        debug_write_log(
+            f"Segment {i}/{len(stats) - 1}: {stat['bytes']} bytes in {stat['seconds']:.2f}s ({stat['mbps']:.2f} MB/s, {stat['attempts']} attempt(s))",
+            debug_option,
+        )
 
     return True
 
@@ -651,63 +1076,33 @@ def repost_check(j, exclude_replies=True):
 
     # Where "media_url_https" is the thumbnail url and "source_status_id_str" the status id for the original tweet (where the video is posted)
     # This is valid for all video repost, even for those in the tweet's replies.
-    # That's why we have to know where the replies start in our twitter response data, to focus on the given tweet.
+    # That's why scan_tweet_json flags everything after the first '"conversationthread-' (where the replies start), to focus on the given tweet.
     # If we want to download ALL the videos below a tweet, we'll need to include replies
+    scan = scan_tweet_json(j)
 
-    try:
-        # This line extract the index of the first reply
-        reply_index = j.index('"conversationthread-')
-    except ValueError:
-        # If there are no replies we use the enrire response data length
-        reply_index = len(j)
-    # We truncate the response data to exclude replies
-    if exclude_replies:
-        j = j[0:reply_index]
-
-    # We use this regular expression to extract the source status
-    source_status_pattern = r'"source_status_id_str"\s*:\s*"\d+"'
-    matches = re.findall(source_status_pattern, j)
-
-    if len(matches) > 0 and exclude_replies:
-        # We extract the source status id (ssid)
-        ssid = json.loads("{" + matches[0] + "}")["source_status_id_str"]
-        # We plug it in this regular expression to find expanded_url (the original tweet url)
-        expanded_url_pattern = (
-            r'"expanded_url"\s*:\s*"https://(?:x\.com|twitter\.com)/[^/]+/status/'
-            + ssid
-            + '[^"]+"'
-        )
-        matches2 = re.findall(expanded_url_pattern, j)
-
-        if len(matches2) > 0:
-            # We extract the url and return it
-            status_url = json.loads("{" + matches2[0] + "}")["expanded_url"]
-            return status_url
+    ssids = [
+        ssid
+        for ssid, in_replies in scan.source_status_ids
+        if not (exclude_replies and in_replies)
+    ]
+    # The original tweet url is the expanded_url pointing at the source status
+    status_urls = {}
+    for url, status_id, rest, in_replies in scan.expanded_urls:
+        if rest and not (exclude_replies and in_replies):
+            status_urls.setdefault(status_id, []).append(url)
+
+    if len(ssids) > 0 and exclude_replies:
+        # We extract the first source status id (ssid)
+        if ssids[0] in status_urls:
+            # We return the url
+            return status_urls[ssids[0]][0]
 
     if not exclude_replies:
-        # If we include replies we'll have to get all ssids and remove duplicates
-        ssids = []
-        for match in matches:
-            ssids.append(json.loads("{" + match + "}")["source_status_id_str"])
-        # we remove duplicates (this line is messy but it's the easiest way to do it)
-        ssids = list(set(ssids))
-        if len(ssids) > 0:
-            for ssid in ssids:
-                expanded_url_pattern = (
-                    r'"expanded_url"\s*:\s*"https://(?:x\.com|twitter\.com)/[^/]+/status/'
-                    + ssid
-                    + '[^"]+"'
-                )
-                matches2 = re.findall(expanded_url_pattern, j)
-                if len(matches2) > 0:
-                    status_urls = []
-                    for match in matches2:
-                        status_urls.append(
-                            json.loads("{" + match + "}")["expanded_url"]
-                        )
-                    # We remove duplicates another time
-                    status_urls = list(set(status_urls))
-                    return status_urls
+        # If we include replies we'll have to check all ssids, without duplicates
+        for ssid in set(ssids):
+            if ssid in status_urls:
+                # We remove duplicates another time
+                return list(set(status_urls[ssid]))
 
     # If we don't find source_status_id_str, the tweet doesn't feature a reposted video
     return None
@@ -719,20 +1114,23 @@ def download_video(tweet_url, output_file, target_all_videos=False):
         syndication_data = get_tweet_details_syndication(tweet_url)
         video_urls, _, _ = extract_media_from_syndication(syndication_data)
         mp4s = video_urls if video_urls else []
+        # No GraphQL response to check for reposts
+        scan = None
     except Exception as e:
         debug_write_log(
             f"Syndication API failed: {e}. Falling back to GraphQL API.", debug_option
         )
         # Fallback to GraphQL API
-        bearer_token, guest_token = get_tokens(tweet_url)
-        resp = get_tweet_details(tweet_url, guest_token, bearer_token)
-        mp4s = extract_mp4s(resp.text, tweet_url, target_all_videos)
+        resp = get_tweet_details_with_cached_tokens(tweet_url)
+        # Scan the response text once; extract_mp4s and repost_check share the result
+        scan = scan_tweet_json(resp.text)
+        mp4s = extract_mp4s(scan, tweet_url, target_all_videos)
     # sometimes there will be multiple mp4s extracted.  This happens when a twitter thread has multiple videos.  What should we do?  Could get all of them, or just the first one.  I think the first one in the list is the one that the user requested... I think that's always true.  We'll just do that and change it if someone complains.
     # names = [output_file.replace('.mp4', f'_{i}.mp4') for i in range(len(mp4s))]
 
     if target_all_videos:
         video_counter = 1
-        original_urls = repost_check(resp.text, exclude_replies=False)
+        original_urls = repost_check(scan, exclude_replies=False)
 
         if len(original_urls) > 0:
             for url in original_urls:
@@ -747,16 +1145,10 @@ def download_video(tweet_url, output_file, target_all_videos=False):
                         download_parts(mp4, output_file)
 
                     else:
-                        # use a stream to download the file
-                        r = requests.get(mp4, stream=True)
-                        with open(output_file, "wb") as f:
-                            for chunk in r.iter_content(chunk_size=1024):
-                                if chunk:
-                                    f.write(chunk)
-                                    f.flush()
+                        download_file(mp4, output_file)
                     video_counter += 1
     else:
-        original_url = repost_check(resp.text)
+        original_url = repost_check(scan)
 
         if original_url:
             download_video(original_url, output_file)
@@ -769,13 +1161,7 @@ def download_video(tweet_url, output_file, target_all_videos=False):
             if "container" in mp4:
                 download_parts(mp4, output_file)
             else:
-                # use a stream to download the file
-                r = requests.get(mp4, stream=True)
-                with open(output_file, "wb") as f:
-                    for chunk in r.iter_content(chunk_size=1024):
-                        if chunk:
-                            f.write(chunk)
-                            f.flush()
+                download_file(mp4, output_file)
 
 
 def create_video_urls(json_data):
@@ -874,63 +1260,113 @@ def get_img_url(media_list):
     return img_urls
 
 
-def get_img(urls, file_name, output_folder_path):
+def confirm_overwrite(output_file_name, existing_files=None):
+    """
+    Ask the user if the file should be overwritten if it exists.
+    With "existing_files" set to "verify" or "overwrite" nobody is asked: the download goes ahead (and download_file skips unchanged files in "verify" mode).
+    existing_files overrides the setting (job runs never ask).
+    Returns: False if the user declined
+    """
+    if not os.path.exists(output_file_name):
+        return True
+    if (existing_files or download_settings["existing_files"]) in (
+        "verify",
+        "overwrite",
+    ):
+        return True
+
+    while True:
+        response = (
+            input(
+                f"The file '{output_file_name}' already exists. Do you want to overwrite it? (y/n): "
+            )
+            .strip()
+            .lower()
+        )
+        if response == "y":
+            return True
+        elif response == "n":
+            print("Exit the program.")
+            return False
+        else:
+            print("Invalid input. Please enter 'y' or 'n'.")
+
+
+def download_image(url, output_file_name, progress=None, existing_files=None):
+    status_code = download_file(
+        url, output_file_name, progress, existing_files=existing_files
+    )
+    if status_code == 304:
+        print(f"Image {output_file_name} is unchanged, skipped.")
+    elif status_code == 200:
+        print(f"Image {output_file_name} downloaded successfully.")
+    else:
+        message = f"Failed to download image from {url}. Status code: {status_code}"
+        print(message)
+        if progress is not None:
+            progress.error(message)
+        print(
+            f"If you are using the correct Twitter URL this suggests a bug in the script. Please open a GitHub issue and copy and paste this message. Tweet url: {url}"
+        )
+
+
+def get_img_jobs(
+    urls, file_name, output_folder_path, progress=None, existing_files=None
+):
+    """
+    Plan the image downloads of a tweet: one callable per image, named <file_name>_1.jpg, <file_name>_2.jpg, ...
+    Overwrite prompts are asked here, up front and in order; planning stops at the first declined file.
+    progress (a progress.Progress) receives the bytes of every download; existing_files overrides the "existing_files" setting.
+    """
     os.makedirs(output_folder_path, exist_ok=True)
     num = len(urls)
+    jobs = []
     for i, url in enumerate(urls, start=1):
-        if file_name == "":
-            if num > 1:
-                save_filename = f"output_{i}"
-                filename = f"{output_folder_path}/{save_filename}]"
-            else:
-                save_filename = "output"
-                filename = f"{output_folder_path}/{save_filename}"
-        else:
-            if num > 1:
-                save_filename = f"{file_name}_{i}"
-                filename = f"{output_folder_path}/{save_filename}"
-            else:
-                save_filename = file_name
-                filename = f"{output_folder_path}/{save_filename}"
-
-        # Ask the user if the file should be overwritten if it exists
+        filename = get_output_filename(file_name, output_folder_path, num, i)
         output_file_name = f"{filename}.jpg"
+        if not confirm_overwrite(output_file_name, existing_files):
+            break
+        jobs.append(
+            functools.partial(
+                download_image,
+                url,
+                output_file_name,
+                progress,
+                existing_files=existing_files,
+            )
+        )
+    return jobs
 
-        if os.path.exists(output_file_name):
-            while True:
-                response = (
-                    input(
-                        f"The file '{output_file_name}' already exists. Do you want to overwrite it? (y/n): "
-                    )
-                    .strip()
-                    .lower()
-                )
-                if response == "y":
-                    break
-                elif response == "n":
-                    print("Exit the program.")
-                    return
-                else:
-                    print("Invalid input. Please enter 'y' or 'n'.")
-
-        response = requests.get(url, stream=True)
-        try:
-            if response.status_code == 200:
-                with open(output_file_name, "wb") as f:
-                    # iter_content() without chunk_size to avoid curl-cffi warning
-                    for chunk in response.iter_content():
-                        if chunk:
-                            f.write(chunk)
-                    print(f"Image {output_file_name} downloaded successfully.")
-            else:
-                print(
-                    f"Failed to download image from {url}. Status code: {response.status_code}"
-                )
-                print(
-                    f"If you are using the correct Twitter URL this suggests a bug in the script. Please open a GitHub issue and copy and paste this message. Tweet url: {url}"
-                )
-        finally:
-            response.close()
+
+def run_media_jobs(jobs, conversions=None):
+    """
+    Run the download jobs of a tweet on media_executor, media_concurrency at a time.
+    A job may return a Future of a conversion it queued; those are waited for last, so the downloads never wait for ffmpeg.
+    If a conversions list is given, the Futures are appended to it instead and the caller waits for them.
+    Errors are raised in job order once every job has finished.
+    """
+    if len(jobs) <= 1:
+        results = [job() for job in jobs]
+    else:
+        futures, running = [], set()
+        for job in jobs:
+            if len(running) >= download_settings["media_concurrency"]:
+                _, running = wait(running, return_when=FIRST_COMPLETED)
+            future = media_executor.submit(job)
+            futures.append(future)
+            running.add(future)
+        wait(running)
+        results = [future.result() for future in futures]
+    pending = [result for result in results if isinstance(result, Future)]
+    if conversions is not None:
+        conversions.extend(pending)
+        return
+    for future in pending:
+        future.result()
+
+
+def get_img(urls, file_name, output_folder_path):
+    run_media_jobs(get_img_jobs(urls, file_name, output_folder_path))
 
 
 def get_card_type_vid_url(data):
@@ -1027,109 +1463,560 @@ def get_non_card_type_extended_entities_vid_urls(media_list):
     return video_url_list, gif_ptn
 
 
-def download_videos(video_urls, output_file, output_folder_path, gif_ptn):
-    os.makedirs(output_folder_path, exist_ok=True)
-    num = len(video_urls)
+def download_file(url, output_filename, progress=None, existing_files=None):
+    """
+    Download a progressive file over parallel Range requests (a single stream for small files or if the server does not support them).
+    Data is written to <output_filename>.part and renamed into place when complete; an interrupted download is continued on the next call.
+    Media already in the media store (e.g. the same video reached through a repost) is linked or copied from there without a request.
+    With "existing_files": "verify", downloads are recorded in the manifest of their folder, and an existing file whose entry still matches the server (conditional HEAD) is left alone.
+    The same media requested concurrently (e.g. one tweet sent twice under different names) is downloaded once and linked or copied to the other names.
+    progress (a progress.Progress) receives the size and every chunk written; existing_files overrides the "existing_files" setting.
+    Returns: the HTTP status code (200 on success, 304 if the existing file is unchanged)
+    """
+    existing_files = existing_files or download_settings["existing_files"]
+    if existing_files == "verify" and is_unchanged(http_client, url, output_filename):
+        return 304
+
+    (status_code, source), shared = media_flights.do(
+        media_key(url),
+        lambda: (
+            fetch_media_file(url, output_filename, progress, existing_files),
+            output_filename,
+        ),
+    )
+    if not shared or status_code != 200 or source == output_filename:
+        return status_code
 
-    for i, video_url in enumerate(video_urls, start=1):
-        if output_file == "":
-            if num > 1:
-                save_filename = f"output_{i}"
-                filename = f"{output_folder_path}/{save_filename}"
-            else:
-                save_filename = "output"
-                filename = f"{output_folder_path}/{save_filename}"
-        else:
-            if num > 1:
-                save_filename = f"{output_file}_{i}"
-                filename = f"{output_folder_path}/{save_filename}"
-            else:
-                save_filename = output_file
-                filename = f"{output_folder_path}/{save_filename}"
-
-        # Ask the user if the file should be overwritten if it exists
-        output_file_name = f"{filename}.mp4"
-        if os.path.exists(output_file_name):
-            while True:
-                response = (
-                    input(
-                        f"The file '{output_file_name}' already exists. Do you want to overwrite it? (y/n): "
-                    )
-                    .strip()
-                    .lower()
-                )
-                if response == "y":
-                    break
-                elif response == "n":
-                    print("Exit the program.")
-                    return
-                else:
-                    print("Invalid input. Please enter 'y' or 'n'.")
-
-        response = requests.get(video_url, stream=True)
+    debug_write_log(f"Joined an in-flight download: {url}", debug_option)
+    if media_store.fetch(url, output_filename) is None:
         try:
-            if response.status_code == 200:
-                with open(output_file_name, "wb") as f:
-                    # iter_content() without chunk_size to avoid curl-cffi warning
-                    for chunk in response.iter_content():
-                        if chunk:
-                            f.write(chunk)
-                    print(f"Video {output_file_name} downloaded successfully.")
-            else:
-                print(
-                    f"Failed to download video from {video_url}. Status code: {response.status_code}"
-                )
-                print(
-                    f"If you are using the correct Twitter URL this suggests a bug in the script. Please open a GitHub issue and copy and paste this message. Tweet url: {video_url}"
-                )
-        finally:
-            response.close()
-
-        if gif_ptn:
-            # Covert mp4 to gif
-            if convert_gif_flag:
-                command = [
-                    "ffmpeg",
-                    "-i",
-                    f"{filename}.mp4",
+            clone_file(source, output_filename, media_store.link_mode)
+        except OSError:
+            # The other download's file is gone (e.g. converted to gif)
+            return fetch_media_file(url, output_filename, progress, existing_files)
+    if progress is not None:
+        size = os.path.getsize(output_filename)
+        progress.add_total(size)
+        progress.add_done(size)
+    return 200
+
+
+def fetch_media_file(url, output_filename, progress=None, existing_files=None):
+    """
+    download_file without the checks for existing files and in-flight downloads: the media store, then the network.
+    Downloads are only recorded in the manifest with "existing_files": "verify", the one mode that reads it.
+    Returns: the HTTP status code (200 on success)
+    """
+    method = media_store.fetch(url, output_filename)
+    if method is not None:
+        debug_write_log(f"{url} served from the media store ({method})", debug_option)
+        if progress is not None:
+            size = os.path.getsize(output_filename)
+            progress.add_total(size)
+            progress.add_done(size)
+        return 200
+
+    info = {}
+    with stage_seconds.time(stage="download"):
+        status_code = download_ranged(
+            http_client,
+            url,
+            output_filename,
+            connections=download_settings["range_connections"],
+            min_part_bytes=download_settings["range_min_part_mb"] * 1024 * 1024,
+            retries=download_settings["range_retries"],
+            throttle=media_throttle(url),
+            info=info,
+            progress=progress,
+        )
+    if status_code == 200:
+        sha256 = media_store.add(url, output_filename)
+        existing_files = existing_files or download_settings["existing_files"]
+        if existing_files == "verify":
+            record_download(
+                output_filename,
+                url,
+                info.get("validator"),
+                sha256,
+                manifest_locks,
+            )
+    return status_code
+
+
+def media_throttle(url):
+    """
+    Per-chunk callable(size) for media downloads: counts the bytes for /metrics and applies the bandwidth limit.
+    """
+    throttle = bandwidth_limiter.throttle(url)
+    host = urllib.parse.urlparse(url).hostname
+
+    def hook(size):
+        downloaded_bytes.inc(size, host=host)
+        if throttle is not None:
+            throttle(size)
+
+    return hook
+
+
+def get_output_filename(output_file, output_folder_path, num, i):
+    """
+    Path (without extension) of the i-th of num media items: output, output_1, ... or <output_file>, <output_file>_1, ...
+    """
+    if output_file == "":
+        save_filename = f"output_{i}" if num > 1 else "output"
+    else:
+        save_filename = f"{output_file}_{i}" if num > 1 else output_file
+    return f"{output_folder_path}/{save_filename}"
+
+
+def print_video_failed(video_url, status_code, progress=None):
+    message = f"Failed to download video from {video_url}. Status code: {status_code}"
+    print(message)
+    if progress is not None:
+        progress.error(message)
+    print(
+        f"If you are using the correct Twitter URL this suggests a bug in the script. Please open a GitHub issue and copy and paste this message. Tweet url: {video_url}"
+    )
+
+
+def print_gif_converted(filename, success, progress=None):
+    if success:
+        print(f"Video Convert Success(mp4 to gif): {filename}.gif")
+        return
+    message = f"Failed to convert {filename}.mp4 to gif."
+    print(message)
+    if progress is not None:
+        progress.error(message)
+
+
+def finish_gif_conversion(filename, existing_files, success, progress=None):
+    """
+    on_done of a queued GIF conversion: in "verify" mode the manifest entry of the (deleted) mp4 moves to the gif.
+    """
+    if success and existing_files == "verify":
+        record_conversion(f"{filename}.mp4", f"{filename}.gif", manifest_locks)
+    print_gif_converted(filename, success, progress)
+
+
+def download_video_file(
+    video_url, filename, gif_ptn, progress=None, existing_files=None
+):
+    """
+    Download one video; GIF videos are converted to <filename>.gif.
+    With "existing_files": "verify", a gif is recorded in the manifest under the URL and validator of its mp4 and skipped while they are unchanged.
+    progress (a progress.Progress) receives the size, the bytes downloaded and any error; existing_files overrides the "existing_files" setting.
+    Returns: the Future of the conversion if it was queued on transcode_queue, otherwise None
+    """
+    existing_files = existing_files or download_settings["existing_files"]
+    if (
+        gif_ptn
+        and convert_gif_flag
+        and existing_files == "verify"
+        and is_unchanged(http_client, video_url, f"{filename}.gif")
+    ):
+        print(f"GIF {filename}.gif is unchanged, skipped.")
+        return
+
+    if gif_ptn and convert_gif_flag and gif_pipe:
+        # Pipe mode: the response body goes straight into ffmpeg, no mp4 on disk
+        # Download and conversion overlap here, so it is all timed as "transcode"
+        info = {}
+        with transcode_queue.slot(), stage_seconds.time(stage="transcode"):
+            status_code = stream_to_gif(
+                http_client,
+                video_url,
+                f"{filename}.gif",
+                ffmpeg_loglevel,
+                throttle=media_throttle(video_url),
+                nice=transcode_queue.nice,
+                progress=progress,
+                info=info,
+            )
+        if status_code == 200:
+            if existing_files == "verify":
+                record_download(
                     f"{filename}.gif",
-                    "-loglevel",
-                    ffmpeg_loglevel,
-                ]
-                subprocess.run(command)
-                # Delete mp4 after creating gif file
-                subprocess.run(["rm", f"{filename}.mp4"])
-                print(f"Video Convert Success(mp4 to gif): {filename}.gif")
+                    video_url,
+                    info["validator"],
+                    hash_file(f"{filename}.gif"),
+                    manifest_locks,
+                    source_size=info["size"],
+                )
+            print_gif_converted(filename, True)
+            return
+        if status_code is not None:
+            print_video_failed(video_url, status_code, progress)
+            return
+        # ffmpeg could not read the mp4 from a pipe (index at the end of the file)
+        debug_write_log(
+            f"Pipe conversion failed, converting from a file: {video_url}",
+            debug_option,
+        )
+
+    output_file_name = f"{filename}.mp4"
+    status_code = download_file(
+        video_url, output_file_name, progress, existing_files=existing_files
+    )
+    if status_code == 304:
+        print(f"Video {output_file_name} is unchanged, skipped.")
+        return
+    elif status_code == 200:
+        print(f"Video {output_file_name} downloaded successfully.")
+    else:
+        print_video_failed(video_url, status_code, progress)
+        return
+
+    if gif_ptn:
+        # Covert mp4 to gif (the mp4 is deleted afterwards) while the next download runs
+        if convert_gif_flag:
+            return transcode_queue.submit(
+                f"{filename}.mp4",
+                f"{filename}.gif",
+                on_done=functools.partial(
+                    finish_gif_conversion, filename, existing_files, progress=progress
+                ),
+            )
+
+
+def get_video_jobs(
+    video_urls,
+    output_file,
+    output_folder_path,
+    gif_ptn,
+    progress=None,
+    existing_files=None,
+):
+    """
+    Plan the video downloads of a tweet, like get_img_jobs.
+    Returns: (jobs, False if the user declined to overwrite a file)
+    """
+    os.makedirs(output_folder_path, exist_ok=True)
+    num = len(video_urls)
+    jobs = []
+    for i, video_url in enumerate(video_urls, start=1):
+        filename = get_output_filename(output_file, output_folder_path, num, i)
+        if not confirm_overwrite(f"{filename}.mp4", existing_files):
+            return jobs, False
+        jobs.append(
+            functools.partial(
+                download_video_file,
+                video_url,
+                filename,
+                gif_ptn,
+                progress,
+                existing_files=existing_files,
+            )
+        )
+    return jobs, True
+
+
+def print_videos_done():
     if image_save_option:
         print("All videos(gifs) & images downloaded successfully.")
     else:
         print("All videos(gifs) downloaded successfully.")
 
 
-def download_video_for_sc(tweet_url, output_file="", output_folder_path="./output"):
+def download_videos(video_urls, output_file, output_folder_path, gif_ptn):
+    jobs, completed = get_video_jobs(
+        video_urls, output_file, output_folder_path, gif_ptn
+    )
+    run_media_jobs(jobs)
+    if completed:
+        print_videos_done()
+
+
+def download_media(
+    video_urls,
+    img_urls,
+    output_file,
+    output_folder_path,
+    gif_ptn,
+    conversions=None,
+    progress=None,
+    existing_files=None,
+):
+    """
+    Download every video and image of a tweet concurrently (bounded by media_concurrency), so a tweet takes about as long as its largest item.
+    File names are the same as with get_img / download_videos.
+    GIF conversions are waited for unless a conversions list is given (see run_media_jobs).
+    progress (a progress.Progress) follows the downloads and is moved to the "transcode" stage while conversions are waited for.
+    existing_files overrides the "existing_files" setting (see confirm_overwrite).
+    Returns: False if the tweet has no videos
+    """
+    img_jobs = []
+    if image_save_option and img_urls:
+        img_jobs = get_img_jobs(
+            img_urls, output_file, output_folder_path, progress, existing_files
+        )
+
+    video_jobs, completed = [], False
+    if video_urls:
+        video_jobs, completed = get_video_jobs(
+            video_urls,
+            output_file,
+            output_folder_path,
+            gif_ptn,
+            progress,
+            existing_files,
+        )
+
+    # Videos first: the largest items should start as early as possible
+    pending = [] if conversions is None else conversions
+    run_media_jobs(video_jobs + img_jobs, pending)
+    if conversions is None and pending:
+        if progress is not None:
+            progress.set_stage("transcode")
+        for future in pending:
+            future.result()
+
+    if completed:
+        print_videos_done()
+    return bool(video_urls)
+
+
+def extract_media(source, data):
+    """
+    Extract (video_urls, gif_ptn, img_urls) from a parsed Syndication ("syndication") or GraphQL ("graphql") response.
+    """
+    if source == "syndication":
+        return extract_media_from_syndication(data)
+    return create_video_urls(json.dumps(data))
+
+
+def fetch_tweet_data(tweet_url, tweet_id):
+    """
+    Get the raw tweet data: Syndication API first, GraphQL API as fallback.
+    With hedging enabled, the next syndication endpoint (and finally GraphQL) starts hedge_delay_seconds after the previous one instead of after it has failed, and the first usable answer wins.
+    Returns: (source, parsed JSON)
+    """
+    if not hedge_enabled:
+        # Use Syndication API (no authentication required)
+        try:
+            return "syndication", get_tweet_details_syndication(tweet_url)
+        except Exception as e:
+            debug_write_log(
+                f"Syndication API failed: {e}. Falling back to GraphQL API.",
+                debug_option,
+            )
+            # Fallback to GraphQL API
+            resp = get_tweet_details_with_cached_tokens(tweet_url)
+            return "graphql", json.loads(resp.text)
+
+    def syndication_leg(api_url):
+        data = fetch_syndication_endpoint(api_url)
+        return None if data is None else ("syndication", data)
+
+    def graphql_leg():
+        resp = get_tweet_details_with_cached_tokens(tweet_url)
+        return "graphql", json.loads(resp.text)
+
+    legs = [
+        functools.partial(syndication_leg, api_url)
+        for api_url in get_syndication_api_urls(tweet_id)
+    ]
+    legs.append(graphql_leg)
+
+    result, winner = run_hedged(legs, hedge_delay_seconds)
+    debug_write_log(f"Hedged lookup won by path {winner}", debug_option)
+    return result
+
+
+def lookup_tweet_data(tweet_url, tweet_id):
+    """
+    fetch_tweet_data, timed as the "resolve" stage and counted per API that answered.
+    """
+    with stage_seconds.time(stage="resolve"):
+        source, data = fetch_tweet_data(tweet_url, tweet_id)
+    tweet_lookups.inc(source=source)
+    return source, data
+
+
+def resolve_tweet_media(tweet_url, use_cache=True):
+    """
+    Resolve the media of a tweet, using the metadata cache when possible.
+    Returns: (video_urls, gif_ptn, img_urls)
+    """
+    tweet_url = tweet_url.replace("https://twitter.com", "https://x.com")
+
+    tweet_id = re.findall(r"(?<=status/)\d+", tweet_url)
+
+    assert (
+        tweet_id is not None and len(tweet_id) == 1
+    ), f"Could not parse tweet id from your url. Tweet url: {tweet_url}"
+
+    tweet_id = tweet_id[0]
+
+    if use_cache:
+        cached = metadata_cache.get(tweet_id)
+        if cached == NEGATIVE:
+            debug_write_log(f"Negative cache hit: {tweet_id}", debug_option)
+            return [], False, []
+        if cached is not None:
+            debug_write_log(f"Metadata cache hit: {tweet_id}", debug_option)
+            return extract_media(cached["source"], cached["data"])
+
+    # A concurrent request for the same tweet shares this lookup
+    (source, data), shared = tweet_flights.do(
+        tweet_id, lambda: lookup_tweet_data(tweet_url, tweet_id)
+    )
+    if shared:
+        debug_write_log(f"Joined an in-flight lookup: {tweet_id}", debug_option)
+    media = extract_media(source, data)
+
+    if use_cache:
+        video_urls, _, img_urls = media
+        if video_urls or img_urls:
+            metadata_cache.put(tweet_id, source, data)
+        else:
+            metadata_cache.put_negative(tweet_id)
+
+    return media
+
+
+def download_video_for_sc(
+    tweet_url,
+    output_file="",
+    output_folder_path="./output",
+    progress=None,
+    existing_files=None,
+):
     delete_debug_log(debug_option)
 
     # Normalize URL
     tweet_url = tweet_url.replace("https://twitter.com", "https://x.com")
 
-    # Use Syndication API (no authentication required)
+    if progress is not None:
+        progress.set_stage("resolve")
+    video_urls, gif_ptn, img_urls = resolve_tweet_media(tweet_url)
+
+    if progress is not None:
+        progress.set_stage("download")
+    if not download_media(
+        video_urls,
+        img_urls,
+        output_file,
+        output_folder_path,
+        gif_ptn,
+        progress=progress,
+        existing_files=existing_files,
+    ):
+        print(f"No videos found in tweet: {tweet_url}")
+        debug_write_log("No videos found in tweet", debug_option)
+
+
+def open_job_store(file_name):
+    """
+    The SQLite job table <cache directory>/<file_name>, configured by the "job_store" settings.
+    """
+    return JobStore(
+        f"{cache_dir}{os.sep}{file_name}",
+        max_attempts=job_store_settings["max_attempts"],
+        retry_backoff=job_store_settings["retry_backoff_seconds"],
+    )
+
+
+def run_download_job(job):
+    """
+    JobQueue handler: download the tweet of a job.
+    Raises AssertionError if a media item failed, so that the job store retries the job (a partial download continues from its .part file).
+    Jobs run on worker threads and never ask about existing files: "ask" is run as "verify", so the files a previous attempt finished are kept if unchanged.
+    """
+    if job.attempts <= 1:
+        stage_seconds.observe(job.started_at - job.created_at, stage="queued")
+    existing_files = download_settings["existing_files"]
+    download_video_for_sc(
+        job.url,
+        job.file_name,
+        job.output_folder_path,
+        progress=job.progress,
+        existing_files="overwrite" if existing_files == "overwrite" else "verify",
+    )
+    assert not job.progress.errors, "; ".join(job.progress.errors)
+
+
+def batch_store_name(url_list):
+    """
+    File name of the job store of a URL list for open_job_store: one store per list, so a resumed run only runs (and waits for) the jobs of its own list.
+    """
+    digest = hashlib.sha1(os.path.abspath(url_list).encode()).hexdigest()[:16]
+    return f"batch-{digest}.sqlite3"
+
+
+def batch_job_id(tweet_url, output_file, output_folder_path):
+    # The same entry of the same list gets the same job on every run
+    return hashlib.sha1(
+        f"{tweet_url}\0{output_file}\0{output_folder_path}".encode()
+    ).hexdigest()
+
+
+def download_video_for_sc_batch(entries, output_folder_path="./output", job_store=None):
+    """
+    Download many tweets, resolving their media with batched GraphQL lookups.
+    entries: list of (tweet_url, output_file).  Tweets the batch lookup cannot resolve fall back to download_video_for_sc.
+    With a job_store (see open_job_store) every entry is recorded as a job: failed entries are retried with backoff, and running the same list again after a crash only downloads the entries that are not done yet.
+    """
+    delete_debug_log(debug_option)
+
+    entries = [
+        (tweet_url.replace("https://twitter.com", "https://x.com"), output_file)
+        for tweet_url, output_file in entries
+    ]
+
+    job_queue = None
+    if job_store is not None:
+        job_queue = JobQueue(
+            run_download_job,
+            workers=1,
+            store=job_store,
+            lease_seconds=job_store_settings["lease_seconds"],
+        )
+        jobs = [
+            job_queue.submit(
+                tweet_url,
+                output_file,
+                output_folder_path,
+                job_id=batch_job_id(tweet_url, output_file, output_folder_path),
+            )
+            for tweet_url, output_file in entries
+        ]
+        # Entries finished by an earlier run are skipped
+        entries = [(job.url, job.file_name) for job in jobs if not job.finished]
+
     try:
-        syndication_data = get_tweet_details_syndication(tweet_url)
-        video_urls, gif_ptn, img_urls = extract_media_from_syndication(syndication_data)
+        media = resolve_tweet_media_batch([tweet_url for tweet_url, _ in entries])
     except Exception as e:
         debug_write_log(
-            f"Syndication API failed: {e}. Falling back to GraphQL API.", debug_option
+            f"Batch GraphQL lookup failed: {e}. Falling back to single lookups.",
+            debug_option,
         )
-        # Fallback to GraphQL API
-        bearer_token, guest_token, query_id = get_tokens(tweet_url)
-        resp = get_tweet_details(tweet_url, guest_token, bearer_token, query_id)
-        video_urls, gif_ptn, img_urls = create_video_urls(resp.text)
-
-    if image_save_option and img_urls:
-        get_img(img_urls, output_file, output_folder_path)
+        media = {}
+
+    if job_queue is not None:
+        # The lookups above filled the metadata cache the jobs resolve from
+        job_queue.start()
+        job_queue.wait_idle()
+        job_queue.stop()
+        return
+
+    # GIF conversions of earlier tweets run while the next tweets download
+    conversions = []
+    for tweet_url, output_file in entries:
+        if media.get(tweet_url) is None:
+            download_video_for_sc(tweet_url, output_file, output_folder_path)
+            continue
+
+        video_urls, gif_ptn, img_urls = media[tweet_url]
+
+        if not download_media(
+            video_urls,
+            img_urls,
+            output_file,
+            output_folder_path,
+            gif_ptn,
+            conversions,
+        ):
+            print(f"No videos found in tweet: {tweet_url}")
 
-    if video_urls:
-        download_videos(video_urls, output_file, output_folder_path, gif_ptn)
-    else:
-        print(f"No videos found in tweet: {tweet_url}")
-        debug_write_log("No videos found in tweet", debug_option)
+    for future in conversions:
+        future.result()
@@ -0,0 +1,132 @@
+"""Test for the asyncio download API against a local HTTP server (offline)"""
+
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import src.twitter_video_dl.twitter_video_dl as tvdl
+from src.twitter_video_dl import async_api
+from src.twitter_video_dl.async_api import download_videos_async
+from src.twitter_video_dl.media_store import MediaStore
+from src.twitter_video_dl.metadata_cache import MetadataCache
+
+pytest.importorskip("curl_cffi")
+
+PAYLOAD = bytes(range(256)) * 4096
+
+
+class MediaHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith("/missing"):
+            self.send_response(404)
+            self.end_headers()
+            return
+        if self.path.startswith("/truncated"):
+            # Promise the whole payload, send half, then close the connection
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(PAYLOAD)))
+            self.end_headers()
+            self.wfile.write(PAYLOAD[: len(PAYLOAD) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(PAYLOAD)))
+        self.end_headers()
+        self.wfile.write(PAYLOAD)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def media_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MediaHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def media_store(monkeypatch, tmp_path):
+    store = MediaStore(str(tmp_path / "store"), max_bytes=64 * 1024 * 1024)
+    monkeypatch.setattr(tvdl, "media_store", store)
+    return store
+
+
+def test_download_videos_async(media_server, tmp_path):
+    """Test every video of a tweet is downloaded concurrently with deterministic names"""
+    video_urls = [f"{media_server}/video{i}.mp4" for i in range(3)]
+
+    async def run():
+        async with tvdl.http_client.new_async_session() as session:
+            await download_videos_async(
+                video_urls, "test", str(tmp_path), False, session
+            )
+
+    asyncio.run(run())
+
+    for i in range(1, 4):
+        assert (tmp_path / f"test_{i}.mp4").read_bytes() == PAYLOAD
+
+
+def test_download_videos_async_failed_download(media_server, tmp_path):
+    """Test a failed download does not leave a file behind"""
+
+    async def run():
+        async with tvdl.http_client.new_async_session() as session:
+            await download_videos_async(
+                [f"{media_server}/missing.mp4"], "", str(tmp_path), False, session
+            )
+
+    asyncio.run(run())
+
+    assert not (tmp_path / "output.mp4").exists()
+
+
+def test_download_videos_async_interrupted_download(media_server, tmp_path):
+    """Test a transfer that breaks off leaves neither a truncated file nor a .part"""
+
+    async def run():
+        async with tvdl.http_client.new_async_session() as session:
+            await download_videos_async(
+                [f"{media_server}/truncated.mp4"], "", str(tmp_path), False, session
+            )
+
+    with pytest.raises(Exception):
+        asyncio.run(run())
+
+    assert not (tmp_path / "output.mp4").exists()
+    assert not (tmp_path / "output.mp4.part").exists()
+
+
+def test_metadata_cache_runs_off_the_event_loop(monkeypatch, tmp_path):
+    """Test the compressed cache files are read and written on worker threads"""
+    cache = MetadataCache(str(tmp_path / "metadata"))
+    monkeypatch.setattr(tvdl, "metadata_cache", cache)
+    threads = []
+    for name in ("get", "put"):
+        method = getattr(cache, name)
+
+        def record(*args, method=method):
+            threads.append(threading.get_ident())
+            return method(*args)
+
+        monkeypatch.setattr(cache, name, record)
+
+    async def fetch_tweet_data_async(tweet_url, tweet_id, session):
+        return "syndication", {"photos": [{"url": "https://pbs.twimg.com/a.jpg"}]}
+
+    monkeypatch.setattr(async_api, "fetch_tweet_data_async", fetch_tweet_data_async)
+
+    media = asyncio.run(
+        async_api.resolve_tweet_media_async("https://x.com/a/status/1", None)
+    )
+
+    assert media[2] == ["https://pbs.twimg.com/a.jpg"]
+    assert len(threads) == 2
+    assert threading.get_ident() not in threads
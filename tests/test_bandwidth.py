@@ -0,0 +1,55 @@
+"""Test for the token-bucket bandwidth limiter (offline)"""
+
+import time
+
+import pytest
+
+from src.twitter_video_dl.bandwidth import BandwidthLimiter, TokenBucket
+
+VIDEO_URL = "https://video.twimg.com/ext_tw_video/1/pu/vid/1280x720/a.mp4"
+IMAGE_URL = "https://pbs.twimg.com/media/a.jpg"
+
+
+def test_token_bucket_burst_then_rate():
+    """Test the burst is free and further bytes wait at the configured rate"""
+    bucket = TokenBucket(rate=1000, burst=500)
+
+    assert bucket.reserve(500) == 0.0
+    assert bucket.reserve(250) == pytest.approx(0.25, abs=0.01)
+    # Concurrent callers queue up behind the debt
+    assert bucket.reserve(250) == pytest.approx(0.5, abs=0.01)
+
+
+def test_unlimited_limiter_has_no_throttle():
+    """Test downloads skip the limiter when no rate is configured"""
+    limiter = BandwidthLimiter(host_limits={"video.twimg.com": (0, 0)})
+
+    assert limiter.throttle(VIDEO_URL) is None
+    assert limiter.reserve(VIDEO_URL, 10**9) == 0.0
+    assert limiter.utilization() == {}
+
+
+def test_per_host_buckets():
+    """Test a host bucket only applies to its own host"""
+    limiter = BandwidthLimiter(host_limits={"video.twimg.com": (1000, 100)})
+
+    assert limiter.throttle(IMAGE_URL) is None
+    assert limiter.reserve(VIDEO_URL, 600) == pytest.approx(0.5, abs=0.01)
+    assert limiter.reserve(IMAGE_URL, 600) == 0.0
+
+
+def test_throttle_caps_throughput_and_reports_utilization():
+    """Test the throttle sleeps to hold the rate and utilization is reported"""
+    limiter = BandwidthLimiter(rate=100_000, burst=10_000)
+    throttle = limiter.throttle(VIDEO_URL)
+
+    start = time.perf_counter()
+    for _ in range(4):
+        throttle(10_000)
+    elapsed = time.perf_counter() - start
+
+    assert elapsed >= 0.25
+    stats = limiter.utilization()["global"]
+    assert stats["rate"] == 100_000
+    assert stats["throughput"] == pytest.approx(40_000 / 2.0)
+    assert 0 < stats["utilization"] <= 1
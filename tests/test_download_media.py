@@ -0,0 +1,72 @@
+"""Test for downloading every media item of a tweet concurrently (offline)"""
+
+import threading
+import time
+
+import src.twitter_video_dl.twitter_video_dl as tvdl
+
+
+def fake_download_file(delay, calls):
+    lock = threading.Lock()
+
+    def download_file(url, output_filename, progress=None, existing_files=None):
+        time.sleep(delay)
+        with open(output_filename, "w") as f:
+            f.write(url)
+        with lock:
+            calls.append(output_filename)
+        return 200
+
+    return download_file
+
+
+def test_download_media_runs_items_concurrently(mocker, tmp_path):
+    """Test a tweet takes about as long as one item and names stay deterministic"""
+    calls = []
+    mocker.patch.object(tvdl, "download_file", fake_download_file(0.3, calls))
+    mocker.patch.object(tvdl, "image_save_option", True)
+    mocker.patch.dict(tvdl.download_settings, {"media_concurrency": 4})
+
+    start = time.perf_counter()
+    has_videos = tvdl.download_media(
+        ["https://video.twimg.com/v.mp4"],
+        [f"https://pbs.twimg.com/media/{i}.jpg" for i in range(3)],
+        "tweet",
+        str(tmp_path),
+        False,
+    )
+    elapsed = time.perf_counter() - start
+
+    assert has_videos
+    assert elapsed < 0.9, "Items should be downloaded concurrently"
+    assert (tmp_path / "tweet.mp4").read_text() == "https://video.twimg.com/v.mp4"
+    for i in range(3):
+        assert (
+            tmp_path / f"tweet_{i + 1}.jpg"
+        ).read_text() == f"https://pbs.twimg.com/media/{i}.jpg"
+
+
+def test_get_img_default_names(mocker, tmp_path):
+    """Test images without an output name are saved as output_1.jpg, output_2.jpg"""
+    calls = []
+    mocker.patch.object(tvdl, "download_file", fake_download_file(0, calls))
+
+    tvdl.get_img(["a", "b"], "", str(tmp_path))
+
+    assert sorted(calls) == [
+        f"{tmp_path}/output_1.jpg",
+        f"{tmp_path}/output_2.jpg",
+    ]
+
+
+def test_declined_overwrite_stops_planning(mocker, tmp_path):
+    """Test answering "n" skips that file and the ones after it"""
+    calls = []
+    mocker.patch.object(tvdl, "download_file", fake_download_file(0, calls))
+    mocker.patch("builtins.input", return_value="n")
+    (tmp_path / "tweet_2.mp4").write_text("existing")
+
+    tvdl.download_videos(["a", "b", "c"], "tweet", str(tmp_path), False)
+
+    assert calls == [f"{tmp_path}/tweet_1.mp4"]
+    assert (tmp_path / "tweet_2.mp4").read_text() == "existing"
@@ -0,0 +1,75 @@
+"""Test for batched GraphQL lookups (offline, requests are mocked)"""
+
+import json
+import urllib.parse
+
+import src.twitter_video_dl.twitter_video_dl as tvdl
+
+
+def make_tweet_result(tweet_id, video_url):
+    return {
+        "result": {
+            "rest_id": tweet_id,
+            "legacy": {
+                "extended_entities": {
+                    "media": [
+                        {
+                            "type": "video",
+                            "video_info": {
+                                "variants": [
+                                    {"bitrate": 256000, "url": video_url + "?low"},
+                                    {"bitrate": 2176000, "url": video_url},
+                                ]
+                            },
+                        }
+                    ]
+                }
+            },
+        }
+    }
+
+
+class FakeResponse:
+    def __init__(self, payload, status_code=200):
+        self.text = json.dumps(payload)
+        self.status_code = status_code
+        self.headers = {}
+
+
+def test_get_details_url_batch():
+    """Test all tweet ids are sent in one TweetResultsByRestIds request"""
+    url = tvdl.get_details_url_batch(["1", "2"], {"f": True}, {"tweetId": "x"}, "qid")
+
+    assert "/graphql/qid/TweetResultsByRestIds?" in url
+    variables = json.loads(
+        urllib.parse.unquote(url.split("variables=")[1].split("&")[0])
+    )
+    assert variables == {"tweetIds": ["1", "2"]}
+
+
+def test_get_tweet_details_batch_fans_out_results(mocker):
+    """Test one request resolves several tweets and missing tweets map to None"""
+    payload = {
+        "data": {
+            "tweetResult": [
+                make_tweet_result("111", "https://video.twimg.com/a.mp4"),
+                {},
+                make_tweet_result("333", "https://video.twimg.com/c.mp4"),
+            ]
+        }
+    }
+    get = mocker.patch.object(
+        tvdl.http_client, "get", return_value=FakeResponse(payload)
+    )
+
+    items = tvdl.get_tweet_details_batch(
+        ["111", "222", "333"], "guest", "bearer", "qid"
+    )
+
+    assert get.call_count == 1
+    assert items["222"] is None
+    video_urls, gif_ptn, _ = tvdl.create_video_urls(
+        json.dumps({"data": {"tweetResult": items["333"]}})
+    )
+    assert video_urls == ["https://video.twimg.com/c.mp4"]
+    assert gif_ptn is False
@@ -0,0 +1,96 @@
+"""Test for hedged requests (offline)"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.twitter_video_dl.hedging import run_hedged, run_hedged_async
+
+
+def test_run_hedged_first_usable_result_wins():
+    """Test a slow first leg is overtaken by the hedged second leg"""
+
+    def slow():
+        time.sleep(1)
+        return "slow"
+
+    start = time.monotonic()
+    result, winner = run_hedged([slow, lambda: "fast"], delay=0.05)
+
+    assert (result, winner) == ("fast", 1)
+    assert time.monotonic() - start < 0.5, "Should not wait for the slow leg"
+
+
+def test_run_hedged_starts_next_leg_after_failure():
+    """Test the next leg starts immediately when the running one fails"""
+    calls = []
+
+    def failing():
+        calls.append("failing")
+        raise ValueError("boom")
+
+    def unusable():
+        calls.append("unusable")
+        return None
+
+    start = time.monotonic()
+    result, winner = run_hedged([failing, unusable, lambda: "ok"], delay=10)
+
+    assert (result, winner) == ("ok", 2)
+    assert calls == ["failing", "unusable"]
+    assert time.monotonic() - start < 1, "Failed legs should not wait for the delay"
+
+
+def test_run_hedged_all_legs_fail():
+    """Test an AssertionError with the collected errors when every leg fails"""
+
+    def failing():
+        raise ValueError("boom")
+
+    with pytest.raises(AssertionError) as e_info:
+        run_hedged([failing, lambda: None], delay=0)
+
+    assert "boom" in str(e_info.value)
+
+
+def test_run_hedged_async_cancels_losers():
+    """Test losing async legs are cancelled once a result arrives"""
+    cancelled = []
+
+    async def slow():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def fast():
+        return "fast"
+
+    async def run():
+        result = await run_hedged_async([slow, fast], delay=0.01)
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(run()) == ("fast", 1)
+    assert cancelled == [True]
+
+
+def test_run_hedged_reuses_threads():
+    """Test the legs of later lookups run on the threads of earlier ones"""
+    threads = set()
+
+    def leg():
+        threads.add(threading.current_thread())
+        return "ok"
+
+    for _ in range(20):
+        run_hedged([leg], delay=0)
+        time.sleep(0.01)
+
+    # Idle threads left by the other tests may take a turn, but no new
+    # thread is started per lookup
+    assert len(threads) < 5
+    assert all(thread.name.startswith("hedge") for thread in threads)
@@ -0,0 +1,194 @@
+"""Test for the SQLite job store and the queue running on it (offline)"""
+
+import time
+
+import pytest
+
+import src.twitter_video_dl.twitter_video_dl as tvdl
+from src.twitter_video_dl.job_store import JobStore
+from src.twitter_video_dl.jobs import Job, JobQueue
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"), max_attempts=2, retry_backoff=0)
+    yield store
+    store.close()
+
+
+def test_enqueue_is_idempotent(store):
+    """A job ID is only added once"""
+    assert store.enqueue("a", "https://x.com/a/status/1", "one")
+    assert not store.enqueue("a", "https://x.com/a/status/1", "one")
+    assert store.counts() == {"queued": 1}
+
+
+def test_lease_and_complete(store):
+    """A leased job is running until it is completed"""
+    store.enqueue("a", "https://x.com/a/status/1")
+    job = store.lease(60)
+    assert (job["id"], job["status"], job["attempts"]) == ("a", "running", 1)
+    assert store.lease(60) is None
+    store.complete("a", 1)
+    assert store.get("a")["status"] == "done"
+    assert store.get("a")["finished_at"] is not None
+
+
+def test_fail_retries_then_gives_up(tmp_path):
+    """A failed job is queued again after the backoff, and failed after max_attempts"""
+    store = JobStore(str(tmp_path / "jobs.sqlite3"), max_attempts=2, retry_backoff=0.2)
+    store.enqueue("a", "https://x.com/a/status/1")
+    store.lease(60)
+    assert store.fail("a", 1, "No media") == "queued"
+    assert store.get("a")["error"] == "No media"
+    # Not due before the backoff has passed
+    assert store.lease(60) is None
+
+    time.sleep(0.25)
+    assert store.lease(60)["attempts"] == 2
+    assert store.fail("a", 2, "No media") == "failed"
+    assert store.lease(60) is None
+
+    store.requeue("a")
+    assert store.lease(60)["attempts"] == 1
+
+
+def test_expired_lease_is_taken_again(store):
+    """A job whose worker died is leased again, and the old lease is fenced off"""
+    store.enqueue("a", "https://x.com/a/status/1")
+    store.lease(0)
+    time.sleep(0.01)
+    job = store.lease(60)
+    assert job["attempts"] == 2
+
+    # The first worker's late results are ignored
+    store.complete("a", 1)
+    assert store.fail("a", 1, "late") is None
+    assert store.get("a")["status"] == "running"
+    store.complete("a", 2)
+    assert store.get("a")["status"] == "done"
+
+
+def test_queue_resumes_jobs_of_previous_process(store):
+    """Jobs left queued or running by another process are run by a new queue"""
+    store.enqueue("a", "https://x.com/a/status/1", "one", "out")
+    store.enqueue("b", "https://x.com/a/status/2", "two", "out")
+    store.lease(0)  # "a" was running when the process died
+    time.sleep(0.01)
+
+    handled = []
+    job_queue = JobQueue(
+        lambda job: handled.append((job.id, job.file_name, job.output_folder_path)),
+        workers=1,
+        store=store,
+        poll_seconds=0.01,
+    )
+    job_queue.start()
+    job_queue.wait_idle()
+    job_queue.stop()
+
+    assert sorted(handled) == [("a", "one", "out"), ("b", "two", "out")]
+    assert store.counts() == {"done": 2}
+    assert job_queue.get("a").status == "done"
+
+
+def test_queue_retries_failed_jobs(store):
+    """The handler is called again until the job succeeds or runs out of attempts"""
+    calls = []
+
+    def handler(job):
+        calls.append(job.attempts)
+        if job.url.endswith("fail") or job.attempts == 1:
+            raise ValueError("No media")
+
+    job_queue = JobQueue(handler, workers=1, store=store, poll_seconds=0.01)
+    job_queue.start()
+    ok = job_queue.submit("https://x.com/a/status/1")
+    bad = job_queue.submit("https://x.com/a/status/fail")
+    job_queue.wait_idle()
+    job_queue.stop()
+
+    assert (ok.status, ok.attempts) == ("done", 2)
+    assert (bad.status, bad.error) == ("failed", "No media")
+    assert sorted(calls) == [1, 1, 2, 2]
+
+
+def test_batch_resume_skips_finished_entries(store, mocker, tmp_path):
+    """A resumed batch only downloads the entries that are not done yet"""
+    mocker.patch.object(tvdl, "resolve_tweet_media_batch", return_value={})
+    downloaded = []
+    mocker.patch.object(
+        tvdl,
+        "download_video_for_sc",
+        side_effect=lambda url, name, folder, **kwargs: downloaded.append(name),
+    )
+    entries = [
+        ("https://x.com/a/status/1", "one"),
+        ("https://x.com/a/status/2", "two"),
+    ]
+    done_id = tvdl.batch_job_id(*entries[0], str(tmp_path))
+    store.enqueue(done_id, *entries[0], str(tmp_path))
+    store.lease(60)
+    store.complete(done_id, 1)
+
+    tvdl.download_video_for_sc_batch(entries, str(tmp_path), job_store=store)
+
+    assert downloaded == ["two"]
+    assert store.counts() == {"done": 2}
+
+
+def test_batch_store_per_list(monkeypatch, tmp_path):
+    """Each URL list gets its own store, however its path is written"""
+    monkeypatch.chdir(tmp_path)
+    name = tvdl.batch_store_name("a.txt")
+
+    assert name == tvdl.batch_store_name(str(tmp_path / "a.txt"))
+    assert name != tvdl.batch_store_name("b.txt")
+    assert name.startswith("batch-") and name.endswith(".sqlite3")
+
+
+def test_job_runs_never_ask(mocker, tmp_path):
+    """A retried job finds the files of its first attempt and verifies them instead of asking"""
+    mocker.patch.dict(tvdl.download_settings, {"existing_files": "ask"})
+    mocker.patch("builtins.input", side_effect=EOFError)
+    mocker.patch.object(
+        tvdl,
+        "resolve_tweet_media",
+        return_value=(["https://video.twimg.com/v.mp4"], False, []),
+    )
+    modes = []
+
+    def download_file(url, output_filename, progress=None, existing_files=None):
+        modes.append(existing_files)
+        return 304
+
+    mocker.patch.object(tvdl, "download_file", side_effect=download_file)
+    (tmp_path / "clip.mp4").write_bytes(b"first attempt")
+    job = Job("https://x.com/a/status/1", "clip", str(tmp_path))
+    job.attempts, job.started_at = 2, time.time()
+
+    tvdl.run_download_job(job)
+
+    assert modes == ["verify"]
+
+
+def test_get_follows_jobs_not_running_here(store):
+    """A job queued in the store is re-read on every get until it has finished"""
+    job_queue = JobQueue(lambda job: None, store=store)
+    store.enqueue("a", "https://x.com/a/status/1")
+    assert job_queue.get("a").status == "queued"
+
+    # Another process runs it
+    store.lease(60)
+    assert job_queue.get("a").status == "running"
+    store.complete("a", 1)
+    assert job_queue.get("a").finished
+
+
+def test_store_is_created_on_first_use(tmp_path):
+    """Opening a store does not create the database file"""
+    path = tmp_path / "cache" / "jobs.sqlite3"
+    store = JobStore(str(path))
+    assert not path.exists()
+    assert store.counts() == {}
+    assert path.exists()
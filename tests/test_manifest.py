@@ -0,0 +1,125 @@
+"""Test for skipping unchanged files with conditional requests (offline)"""
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import src.twitter_video_dl.twitter_video_dl as tvdl
+from src.twitter_video_dl.manifest import read_entry
+from src.twitter_video_dl.media_store import MediaStore, hash_file
+
+PAYLOAD = bytes(range(256)) * 64
+
+
+class ConditionalHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    etag = '"v1"'
+    requests = []
+
+    def send_head(self):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(PAYLOAD)))
+        self.send_header("ETag", self.etag)
+        self.end_headers()
+
+    def do_HEAD(self):
+        self.requests.append(("HEAD", self.headers.get("If-None-Match")))
+        if self.headers.get("If-None-Match") == self.etag:
+            self.send_response(304)
+            self.send_header("ETag", self.etag)
+            self.end_headers()
+            return
+        self.send_head()
+
+    def do_GET(self):
+        self.requests.append(("GET", None))
+        self.send_head()
+        self.wfile.write(PAYLOAD)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server(mocker, tmp_path):
+    ConditionalHandler.etag = '"v1"'
+    ConditionalHandler.requests = []
+    mocker.patch.dict(tvdl.download_settings, {"existing_files": "verify"})
+    mocker.patch.object(tvdl, "manifest_locks", str(tmp_path / "cache" / "locks"))
+    # Every download has to reach the server
+    mocker.patch.object(
+        tvdl, "media_store", MediaStore(str(tmp_path / "store"), 0, enabled=False)
+    )
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), ConditionalHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_download_is_recorded(server, tmp_path):
+    """Test the manifest holds the size, validator and hash of a download"""
+    output = tmp_path / "video.mp4"
+
+    assert tvdl.download_file(f"{server}/video.mp4", str(output)) == 200
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        ".twitter-video-dl.json",
+        "cache",
+        "video.mp4",
+    ]
+    entry = read_entry(str(output))
+    assert entry["url"] == f"{server}/video.mp4"
+    assert entry["size"] == len(PAYLOAD)
+    assert entry["validator"] == '"v1"'
+    assert entry["sha256"] == hash_file(str(output))
+
+
+def test_unchanged_file_is_skipped(server, tmp_path):
+    """Test a re-run costs one conditional HEAD and no body"""
+    output = tmp_path / "video.mp4"
+    tvdl.download_file(f"{server}/video.mp4", str(output))
+    ConditionalHandler.requests.clear()
+
+    assert tvdl.download_file(f"{server}/video.mp4", str(output)) == 304
+
+    assert ConditionalHandler.requests == [("HEAD", '"v1"')]
+
+
+def test_changed_media_is_downloaded_again(server, tmp_path):
+    """Test a new ETag on the server means a new download"""
+    output = tmp_path / "video.mp4"
+    tvdl.download_file(f"{server}/video.mp4", str(output))
+
+    ConditionalHandler.etag = '"v2"'
+    assert tvdl.download_file(f"{server}/video.mp4", str(output)) == 200
+
+    assert ("GET", None) in ConditionalHandler.requests[-2:]
+    assert read_entry(str(output))["validator"] == '"v2"'
+
+
+def test_modified_local_file_is_downloaded_again(server, tmp_path):
+    """Test a local file that no longer matches its entry is replaced without asking"""
+    output = tmp_path / "video.mp4"
+    tvdl.download_file(f"{server}/video.mp4", str(output))
+    output.write_bytes(b"truncated")
+    ConditionalHandler.requests.clear()
+
+    assert tvdl.confirm_overwrite(str(output))
+    assert tvdl.download_file(f"{server}/video.mp4", str(output)) == 200
+
+    assert output.read_bytes() == PAYLOAD
+    assert ("HEAD", '"v1"') not in ConditionalHandler.requests
+
+
+def test_download_is_not_recorded_without_verify(server, mocker, tmp_path):
+    """Test other modes leave nothing but the file in the output folder"""
+    mocker.patch.dict(tvdl.download_settings, {"existing_files": "ask"})
+    output = tmp_path / "out" / "video.mp4"
+    output.parent.mkdir()
+
+    assert tvdl.download_file(f"{server}/video.mp4", str(output)) == 200
+
+    assert [p.name for p in output.parent.iterdir()] == ["video.mp4"]
@@ -0,0 +1,121 @@
+"""Test for the content-addressed media store (offline)"""
+
+import os
+
+import pytest
+
+import src.twitter_video_dl.twitter_video_dl as tvdl
+from src.twitter_video_dl.media_store import MediaStore, clone_file, media_key
+
+VIDEO_URL = "https://video.twimg.com/ext_tw_video/1/pu/vid/avc1/1280x720/a.mp4?tag=12"
+
+
+@pytest.fixture
+def store(tmp_path):
+    return MediaStore(str(tmp_path / "store"), max_bytes=1000)
+
+
+def write(path, content):
+    path.write_bytes(content)
+    return str(path)
+
+
+def test_media_key_ignores_query():
+    """Test the same media requested with a different query has one key"""
+    assert media_key(VIDEO_URL) == media_key(VIDEO_URL.split("?")[0])
+    assert (
+        media_key(VIDEO_URL)
+        == "video.twimg.com/ext_tw_video/1/pu/vid/avc1/1280x720/a.mp4"
+    )
+
+
+@pytest.mark.parametrize("link_mode", ["auto", "hardlink", "copy"])
+def test_add_then_fetch(store, tmp_path, link_mode):
+    """Test stored media is materialized at a new path with the same content"""
+    store.link_mode = link_mode
+    store.add(VIDEO_URL, write(tmp_path / "first.mp4", b"video"))
+
+    method = store.fetch(VIDEO_URL, str(tmp_path / "second.mp4"))
+
+    assert method in ("reflink", "hardlink", "copy")
+    assert link_mode != "copy" or method == "copy"
+    assert (tmp_path / "second.mp4").read_bytes() == b"video"
+    assert store.fetch("https://video.twimg.com/other.mp4", str(tmp_path / "x")) is None
+
+
+def test_identical_content_is_stored_once(store, tmp_path):
+    """Test two URLs with the same content share one blob"""
+    store.add(VIDEO_URL, write(tmp_path / "a.mp4", b"same"))
+    store.add("https://video.twimg.com/b.mp4", write(tmp_path / "b.mp4", b"same"))
+
+    assert store.stats() == {"keys": 2, "blobs": 1, "bytes": 4}
+
+
+def test_least_recently_used_blobs_are_evicted(store, tmp_path):
+    """Test the store stays under max_bytes by dropping the oldest media"""
+    for name in ("a", "b", "c"):
+        store.add(
+            f"https://pbs.twimg.com/media/{name}.jpg",
+            write(tmp_path / f"{name}.jpg", name.encode() * 400),
+        )
+        # a is used again, so b is the least recently used one
+        store.fetch("https://pbs.twimg.com/media/a.jpg", str(tmp_path / "copy.jpg"))
+
+    assert store.stats() == {"keys": 2, "blobs": 2, "bytes": 800}
+    assert store.fetch("https://pbs.twimg.com/media/b.jpg", str(tmp_path / "x")) is None
+    assert store.fetch("https://pbs.twimg.com/media/c.jpg", str(tmp_path / "x"))
+
+
+def test_missing_blob_is_a_miss(store, tmp_path):
+    """Test a blob deleted behind the store's back is dropped from the index"""
+    digest = store.add(VIDEO_URL, write(tmp_path / "a.mp4", b"video"))
+    os.remove(store._blob_path(digest))
+
+    assert store.fetch(VIDEO_URL, str(tmp_path / "b.mp4")) is None
+    assert store.stats()["keys"] == 0
+
+
+def test_lookups_do_not_rewrite_the_index(store, tmp_path, mocker):
+    """Test misses and hits read the index; last use is written with the next change"""
+    store.add(VIDEO_URL, write(tmp_path / "a.mp4", b"video"))
+    write_index = mocker.spy(store, "_update_index")
+
+    for i in range(10):
+        store.fetch(f"https://video.twimg.com/{i}.mp4", str(tmp_path / "x"))
+        store.fetch(VIDEO_URL, str(tmp_path / f"{i}.mp4"))
+    assert write_index.call_count == 0
+
+    store.touch_interval = 0
+    store.fetch(VIDEO_URL, str(tmp_path / "last.mp4"))
+    assert write_index.call_count == 1
+
+
+def test_clone_file_replaces_destination(tmp_path):
+    """Test an existing destination is replaced"""
+    src = write(tmp_path / "src", b"new")
+    dst = write(tmp_path / "dst", b"old")
+
+    clone_file(src, dst)
+
+    assert (tmp_path / "dst").read_bytes() == b"new"
+
+
+def test_download_file_uses_store(mocker, store, tmp_path):
+    """Test the second download of the same media makes no request"""
+    store.max_bytes = 1024 * 1024
+    mocker.patch.object(tvdl, "media_store", store)
+
+    def fake_download_ranged(client, url, output_filename, **kwargs):
+        with open(output_filename, "wb") as f:
+            f.write(b"video")
+        return 200
+
+    download_ranged = mocker.patch.object(
+        tvdl, "download_ranged", side_effect=fake_download_ranged
+    )
+
+    assert tvdl.download_file(VIDEO_URL, str(tmp_path / "tweet1.mp4")) == 200
+    assert tvdl.download_file(VIDEO_URL, str(tmp_path / "tweet2.mp4")) == 200
+
+    assert download_ranged.call_count == 1
+    assert (tmp_path / "tweet2.mp4").read_bytes() == b"video"
@@ -0,0 +1,94 @@
+"""Test for the tweet metadata cache (offline)"""
+
+import gzip
+import json
+import os
+import time
+
+from src.twitter_video_dl.metadata_cache import NEGATIVE, MetadataCache
+from src.twitter_video_dl.twitter_video_dl import extract_media
+
+SYNDICATION_DATA = {"photos": [{"url": "https://pbs.twimg.com/media/abc.jpg"}]}
+
+
+def test_memory_lru_eviction(tmp_path):
+    """Test the least recently used entry is evicted from memory"""
+    cache = MetadataCache(str(tmp_path), memory_entries=2, disk=False)
+
+    cache.put("1", "syndication", {"n": 1})
+    cache.put("2", "syndication", {"n": 2})
+    assert cache.get("1") is not None, "Entry 1 should still be cached"
+
+    cache.put("3", "syndication", {"n": 3})
+    assert cache.get("2") is None, "Least recently used entry should be evicted"
+    assert cache.get("1") == {"source": "syndication", "data": {"n": 1}}
+    assert cache.get("3") == {"source": "syndication", "data": {"n": 3}}
+
+
+def test_disk_round_trip(tmp_path):
+    """Test entries are written gzip-compressed and read back by a new instance"""
+    cache = MetadataCache(str(tmp_path))
+    cache.put("123", "syndication", SYNDICATION_DATA)
+
+    path = tmp_path / "123.json.gz"
+    assert path.exists(), "Entry should be written to disk"
+    record = json.loads(gzip.decompress(path.read_bytes()))
+    assert record["entry"]["data"] == SYNDICATION_DATA
+
+    other = MetadataCache(str(tmp_path))
+    cached = other.get("123")
+    assert cached == {"source": "syndication", "data": SYNDICATION_DATA}
+
+    _, _, img_urls = extract_media(cached["source"], cached["data"])
+    assert img_urls == ["https://pbs.twimg.com/media/abc.jpg"]
+
+
+def test_expired_entries_are_ignored(tmp_path):
+    """Test entries older than their TTL are not returned"""
+    cache = MetadataCache(str(tmp_path), ttl=0)
+    cache.put("123", "syndication", SYNDICATION_DATA)
+
+    assert cache.get("123") is None
+    assert MetadataCache(str(tmp_path), ttl=0).get("123") is None
+    assert not (tmp_path / "123.json.gz").exists(), "Expired file should be deleted"
+
+
+def test_negative_entries(tmp_path):
+    """Test negative entries are cached with their own TTL"""
+    cache = MetadataCache(str(tmp_path), ttl=60, negative_ttl=60)
+    cache.put_negative("404")
+
+    assert cache.get("404") == NEGATIVE
+    assert MetadataCache(str(tmp_path), negative_ttl=60).get("404") == NEGATIVE
+    assert MetadataCache(str(tmp_path), negative_ttl=0).get("404") is None
+
+
+def test_invalidate(tmp_path):
+    """Test invalidate removes the entry from memory and disk"""
+    cache = MetadataCache(str(tmp_path))
+    cache.put("123", "syndication", SYNDICATION_DATA)
+
+    cache.invalidate("123")
+    assert cache.get("123") is None
+    assert not (tmp_path / "123.json.gz").exists()
+
+
+def test_sweep_deletes_old_and_least_recently_used_files(tmp_path):
+    """Test the sweep deletes expired files, then the least recently used above the cap"""
+    cache = MetadataCache(str(tmp_path), ttl=60, negative_ttl=10, sweep_interval=0)
+    for tweet_id in ("1", "2", "3", "4"):
+        cache.put(tweet_id, "syndication", SYNDICATION_DATA)
+    now = time.time()
+    # 1 is older than both TTLs; 2 was used before 3, and 4 is the newest
+    for tweet_id, age in (("1", 120), ("2", 30), ("3", 20), ("4", 0)):
+        os.utime(tmp_path / f"{tweet_id}.json.gz", (now - age, now - age))
+    (tmp_path / "5.json.gz.tmp").touch()
+    # Room for two files (their sizes differ by a byte or so)
+    cache.max_disk_bytes = sum(
+        (tmp_path / f"{tweet_id}.json.gz").stat().st_size for tweet_id in ("2", "4")
+    )
+
+    assert MetadataCache(str(tmp_path), memory_entries=0).get("2") is not None
+    cache.sweep()
+
+    assert sorted(os.listdir(tmp_path)) == ["2.json.gz", "4.json.gz", "5.json.gz.tmp"]
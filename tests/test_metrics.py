@@ -0,0 +1,123 @@
+"""Test for the Prometheus metrics (offline)"""
+
+import src.twitter_video_dl.twitter_video_dl as tvdl
+from src.twitter_video_dl.bandwidth import BandwidthLimiter
+from src.twitter_video_dl.http_client import HttpClient
+from src.twitter_video_dl.metrics import Metrics
+
+
+def test_render_counter_and_gauge():
+    """Test counters and gauges are rendered with HELP, TYPE and escaped labels"""
+    metrics = Metrics()
+    counter = metrics.counter("requests_total", "Requests", ("endpoint",))
+    counter.inc(endpoint='a"b')
+    counter.inc(2, endpoint='a"b')
+    metrics.gauge("depth", "Queue depth", lambda: 3)
+
+    text = metrics.render()
+
+    assert "# HELP requests_total Requests\n# TYPE requests_total counter\n" in text
+    assert 'requests_total{endpoint="a\\"b"} 3\n' in text
+    assert "# TYPE depth gauge\ndepth 3\n" in text
+
+
+def test_render_histogram():
+    """Test histogram buckets are cumulative and end with +Inf, _sum and _count"""
+    metrics = Metrics()
+    histogram = metrics.histogram("stage_seconds", "Stages", ("stage",), (1, 5))
+    for value in (0.5, 1, 3, 10):
+        histogram.observe(value, stage="download")
+
+    lines = metrics.render().splitlines()
+
+    assert lines[2:] == [
+        'stage_seconds_bucket{stage="download",le="1"} 2',
+        'stage_seconds_bucket{stage="download",le="5"} 3',
+        'stage_seconds_bucket{stage="download",le="+Inf"} 4',
+        'stage_seconds_sum{stage="download"} 14.5',
+        'stage_seconds_count{stage="download"} 4',
+    ]
+
+
+def test_histogram_time_observes_failures():
+    """Test a timed block that raises is still observed"""
+    histogram = Metrics().histogram("t", "T", ("stage",))
+    try:
+        with histogram.time(stage="resolve"):
+            raise ValueError
+    except ValueError:
+        pass
+    assert histogram.count(stage="resolve") == 1
+
+
+def test_endpoint_name():
+    """Test endpoints are labelled by host and first path segment or GraphQL operation"""
+    assert (
+        tvdl.endpoint_name("https://cdn.syndication.twimg.com/tweet-result?id=1")
+        == "cdn.syndication.twimg.com/tweet-result"
+    )
+    assert (
+        tvdl.endpoint_name(
+            "https://twitter.com/i/api/graphql/abc/TweetResultByRestId?variables=x"
+        )
+        == "twitter.com/graphql/TweetResultByRestId"
+    )
+    assert (
+        tvdl.endpoint_name("https://video.twimg.com/ext_tw_video/1/pu/vid/a.mp4")
+        == "video.twimg.com/ext_tw_video"
+    )
+
+
+def test_http_client_observes_requests(mocker):
+    """Test every request reports its status and duration, also when it raises"""
+    observed = []
+    client = HttpClient(observe=lambda *args: observed.append(args))
+    session = mocker.MagicMock()
+    session.request.side_effect = [mocker.Mock(status_code=404), OSError("reset")]
+    client._local.session = session
+
+    assert client.get("https://x.com/a").status_code == 404
+    try:
+        client.get("https://x.com/b")
+    except OSError:
+        pass
+
+    assert [args[:3] for args in observed] == [
+        ("GET", "https://x.com/a", 404),
+        ("GET", "https://x.com/b", "error"),
+    ]
+
+
+def test_media_throttle_counts_bytes():
+    """Test media downloads count their bytes per host"""
+    before = tvdl.downloaded_bytes.value(host="video.twimg.com")
+
+    hook = tvdl.media_throttle("https://video.twimg.com/ext_tw_video/1/a.mp4")
+    hook(1000)
+    hook(24)
+
+    assert tvdl.downloaded_bytes.value(host="video.twimg.com") - before == 1024
+
+
+def test_lookup_counts_the_answering_api(mocker):
+    """Test tweet lookups are timed and counted by the API that answered"""
+    mocker.patch.object(tvdl, "fetch_tweet_data", return_value=("graphql", {}))
+    before = tvdl.tweet_lookups.value(source="graphql")
+    timed = tvdl.stage_seconds.count(stage="resolve")
+
+    tvdl.lookup_tweet_data("https://x.com/a/status/1", "1")
+
+    assert tvdl.tweet_lookups.value(source="graphql") - before == 1
+    assert tvdl.stage_seconds.count(stage="resolve") - timed == 1
+
+
+def test_bandwidth_utilization_gauge(mocker):
+    """Test the utilization of every bandwidth bucket is exported by host"""
+    limiter = BandwidthLimiter(rate=1000, host_limits={"video.twimg.com": (500, 0)})
+    mocker.patch.object(tvdl, "bandwidth_limiter", limiter)
+    limiter.reserve("https://video.twimg.com/a.mp4", 1000)
+
+    text = tvdl.metrics.render()
+
+    assert 'tvdl_bandwidth_utilization{host="global"} 0.5\n' in text
+    assert 'tvdl_bandwidth_utilization{host="video.twimg.com"} 1\n' in text
@@ -0,0 +1,93 @@
+"""Test for the learned GraphQL features/variables schema (offline)"""
+
+import json
+import threading
+
+from src.twitter_video_dl.request_schema import RequestSchema
+
+ERROR_JSON = {
+    "errors": [
+        {
+            "message": "The following features cannot be null: new_feature_a, new_feature_b"
+        },
+        {
+            "message": "Variable 'withNewVariable' of required type Boolean! was not provided."
+        },
+    ]
+}
+
+
+def write_details(path, features=None, variables=None):
+    path.write_text(
+        json.dumps({"features": features or {}, "variables": variables or {}})
+    )
+
+
+def test_learn_applies_all_flags_from_one_response(tmp_path):
+    """Test every missing flag in one error response is learned at once"""
+    path = tmp_path / "RequestDetails.json"
+    write_details(path, features={"old_feature": False})
+    schema = RequestSchema(str(path))
+
+    assert schema.learn(ERROR_JSON) is True
+    features, variables = schema.snapshot()
+
+    assert features == {
+        "old_feature": False,
+        "new_feature_a": True,
+        "new_feature_b": True,
+    }
+    assert variables == {"withNewVariable": True}
+
+    # Learning the same response again changes nothing
+    assert schema.learn(ERROR_JSON) is False
+
+
+def test_snapshot_is_a_copy(tmp_path):
+    """Test callers cannot mutate the shared schema through a snapshot"""
+    path = tmp_path / "RequestDetails.json"
+    write_details(path, features={"a": True})
+    schema = RequestSchema(str(path))
+
+    features, _ = schema.snapshot()
+    features["b"] = True
+
+    assert schema.snapshot()[0] == {"a": True}
+
+
+def test_save_merges_flags_from_other_processes(tmp_path):
+    """Test save keeps flags another process persisted in the meantime"""
+    path = tmp_path / "RequestDetails.json"
+    write_details(path)
+    schema = RequestSchema(str(path))
+    other = RequestSchema(str(path))
+
+    other.learn({"errors": [{"message": "Variable 'fromOther' missing"}]})
+    other.save()
+    schema.learn(ERROR_JSON)
+    schema.save()
+
+    saved = json.loads(path.read_text())
+    assert saved["variables"] == {"fromOther": True, "withNewVariable": True}
+    assert saved["features"] == {"new_feature_a": True, "new_feature_b": True}
+    assert list(tmp_path.glob("*.tmp")) == [], "No temp files should be left behind"
+
+
+def test_concurrent_learn_and_save(tmp_path):
+    """Test concurrent workers learn and save without corrupting the file"""
+    path = tmp_path / "RequestDetails.json"
+    write_details(path)
+    schema = RequestSchema(str(path))
+
+    def worker(i):
+        schema.learn({"errors": [{"message": f"Variable 'var{i}' missing"}]})
+        schema.save()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    saved = json.loads(path.read_text())
+    assert saved["variables"] == {f"var{i}": True for i in range(20)}
@@ -0,0 +1,179 @@
+"""Test for the local server and its download job queue (offline)"""
+
+import importlib.util
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from src.twitter_video_dl.jobs import JobQueue
+
+SERVER_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "twitter-video-dl-server.py"
+)
+
+
+def load_server_module():
+    spec = importlib.util.spec_from_file_location("tvdl_server", SERVER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "Timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def release():
+    return threading.Event()
+
+
+@pytest.fixture
+def server(monkeypatch, release):
+    module = load_server_module()
+    handled = []
+
+    def handler(job):
+        handled.append((job.url, job.file_name))
+        job.progress.set_stage("download")
+        job.progress.add_total(100)
+        job.progress.advance(40)
+        assert release.wait(5), "Not released"
+        job.progress.advance(60)
+        if "fail" in job.url:
+            raise ValueError("No media")
+
+    job_queue = JobQueue(handler, workers=2)
+    monkeypatch.setattr(module, "job_queue", job_queue)
+    monkeypatch.setitem(module.tvdl.server_settings, "events_interval_seconds", 0.05)
+    job_queue.start()
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), module.RequestHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}", job_queue, handled
+    release.set()
+    job_queue.stop()
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def get(url):
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def read_events(url):
+    events = []
+    with urllib.request.urlopen(url, timeout=5) as response:
+        assert response.headers["Content-type"] == "text/event-stream"
+        for block in response.read().decode().split("\n\n"):
+            if block:
+                event, data = block.split("\n")
+                events.append(
+                    (event[len("event: ") :], json.loads(data[len("data: ") :]))
+                )
+    return events
+
+
+def test_requests_are_answered_before_the_download(server, release):
+    """Test a burst of clicks gets 202 with job IDs while downloads are running"""
+    base, job_queue, handled = server
+
+    answers = [
+        get(f"{base}/?url=https://x.com/a/status/{i}&fileName=a%20b") for i in range(3)
+    ]
+
+    assert [status for status, _ in answers] == [202] * 3
+    assert all(body["status"] == "queued" for _, body in answers)
+    # Two workers are busy, the third job waits
+    wait_for(lambda: len(handled) == 2)
+    assert job_queue.depth() == 1
+    assert handled[0][1] == "a_b"
+
+    release.set()
+    wait_for(
+        lambda: all(
+            job_queue.get(body["job_id"]).status == "done" for _, body in answers
+        )
+    )
+
+
+def test_failed_job_records_the_error(server, release):
+    """Test an exception in the download marks the job failed"""
+    base, job_queue, _ = server
+    release.set()
+
+    _, body = get(f"{base}/?url=https://x.com/a/status/fail")
+
+    wait_for(lambda: job_queue.get(body["job_id"]).status == "failed")
+    assert job_queue.get(body["job_id"]).error == "No media"
+
+
+def test_finished_jobs_are_bounded():
+    """Test only the last max_finished finished jobs are kept"""
+    job_queue = JobQueue(lambda job: None, workers=1, max_finished=2)
+    job_queue.start()
+    jobs = [job_queue.submit(f"https://x.com/a/status/{i}") for i in range(4)]
+    job_queue.stop()
+
+    assert [job_queue.get(job.id) for job in jobs[:2]] == [None, None]
+    assert job_queue.get(jobs[3].id).status == "done"
+
+
+def test_job_status(server, release):
+    """Test /jobs/<id> reports the stage and the bytes done"""
+    base, job_queue, _ = server
+    _, body = get(f"{base}/?url=https://x.com/a/status/1")
+    wait_for(lambda: job_queue.get(body["job_id"]).status == "running")
+
+    status, job = get(f"{base}/jobs/{body['job_id']}")
+
+    assert status == 200
+    assert job["status"] == "running"
+    assert job["progress"]["stage"] == "download"
+    assert job["progress"]["bytes_done"] == 40
+    assert job["progress"]["bytes_total"] == 100
+    assert job["progress"]["throughput"] > 0
+    assert get(f"{base}/jobs/unknown")[0] == 404
+
+
+def test_job_events(server, release):
+    """Test /jobs/<id>/events streams progress until the job has finished"""
+    base, _, _ = server
+    _, body = get(f"{base}/?url=https://x.com/a/status/1")
+    threading.Timer(0.2, release.set).start()
+
+    events = read_events(f"{base}/jobs/{body['job_id']}/events")
+
+    assert events[0][0] == "progress"
+    assert events[-1][0] == "end"
+    assert events[-1][1]["status"] == "done"
+    assert events[-1][1]["progress"]["bytes_done"] == 100
+    assert len(events) > 2
+
+
+def test_metrics(server, release):
+    """Test /metrics serves the Prometheus text with the job gauges"""
+    base, _, handled = server
+    get(f"{base}/?url=https://x.com/a/status/1")
+    wait_for(lambda: handled)
+
+    with urllib.request.urlopen(f"{base}/metrics", timeout=5) as response:
+        assert response.headers["Content-type"].startswith("text/plain")
+        text = response.read().decode()
+
+    assert "# TYPE tvdl_stage_seconds histogram" in text
+    assert "tvdl_jobs_in_flight 1\n" in text
+    assert "tvdl_job_queue_depth 0\n" in text
@@ -0,0 +1,141 @@
+"""Test for coalescing concurrent requests for the same tweet or media (offline)"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import src.twitter_video_dl.twitter_video_dl as tvdl
+from src.twitter_video_dl.jobs import JobQueue
+from src.twitter_video_dl.media_store import MediaStore
+from src.twitter_video_dl.singleflight import SingleFlight
+
+TWEET_URL = "https://x.com/user/status/1234567890"
+VIDEO_URL = "https://video.twimg.com/ext_tw_video/1/pu/vid/avc1/1280x720/a.mp4"
+
+
+def slow_counter(calls, result, delay=0.2):
+    lock = threading.Lock()
+
+    def fn(*args, **kwargs):
+        with lock:
+            calls.append(args)
+        time.sleep(delay)
+        return result(*args) if callable(result) else result
+
+    return fn
+
+
+def test_concurrent_calls_share_one_result():
+    """Test only the first of several concurrent callers runs the function"""
+    flights = SingleFlight()
+    calls = []
+    fn = slow_counter(calls, "result")
+
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        results = list(executor.map(lambda _: flights.do("key", fn), range(5)))
+
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False] + [True] * 4
+    assert all(result == "result" for result, _ in results)
+    assert flights.in_flight() == 0
+
+
+def test_errors_are_shared():
+    """Test callers waiting on a failing call get its exception"""
+    flights = SingleFlight()
+    started = threading.Event()
+
+    def fail():
+        started.set()
+        time.sleep(0.1)
+        raise ValueError("boom")
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(flights.do, "key", fail)
+        started.wait()
+        follower = executor.submit(flights.do, "key", fail)
+        for future in (leader, follower):
+            with pytest.raises(ValueError):
+                future.result()
+
+
+def test_parse_tweet_status_id():
+    """Test status IDs are parsed from x.com / twitter.com URLs with queries"""
+    assert tvdl.parse_tweet_status_id(f"{TWEET_URL}?s=20") == "1234567890"
+    assert (
+        tvdl.parse_tweet_status_id("https://twitter.com/user/status/1234567890/")
+        == "1234567890"
+    )
+    assert tvdl.parse_tweet_status_id("https://x.com/user") is None
+
+
+def test_resolve_tweet_media_is_coalesced(mocker):
+    """Test concurrent lookups of one tweet make one API lookup"""
+    calls = []
+    data = {"video": {"variants": []}, "mediaDetails": []}
+    mocker.patch.object(
+        tvdl, "fetch_tweet_data", slow_counter(calls, ("syndication", data))
+    )
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        results = list(
+            executor.map(
+                lambda url: tvdl.resolve_tweet_media(url, use_cache=False),
+                [TWEET_URL, f"{TWEET_URL}?s=20", TWEET_URL],
+            )
+        )
+
+    assert len(calls) == 1
+    assert results[0] == results[1] == results[2]
+
+
+def test_same_media_under_different_names_is_downloaded_once(mocker, tmp_path):
+    """Test concurrent downloads of one media file share the download"""
+    calls = []
+
+    def write_file(client, url, output_filename, **kwargs):
+        with open(output_filename, "wb") as f:
+            f.write(b"video")
+        return 200
+
+    mocker.patch.object(tvdl, "download_ranged", slow_counter(calls, write_file))
+    mocker.patch.object(
+        tvdl, "media_store", MediaStore(str(tmp_path / "store"), 0, enabled=False)
+    )
+    names = [str(tmp_path / f"{name}.mp4") for name in ("a", "b", "c")]
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        status_codes = list(
+            executor.map(lambda name: tvdl.download_file(VIDEO_URL, name), names)
+        )
+
+    assert status_codes == [200] * 3
+    assert len(calls) == 1
+    for name in names:
+        assert open(name, "rb").read() == b"video"
+
+
+def test_duplicate_jobs_join_the_job_in_flight():
+    """Test the same tweet under the same name is queued once while in flight"""
+    release = threading.Event()
+    handled = []
+
+    def handler(job):
+        handled.append(job.id)
+        release.wait(5)
+
+    job_queue = JobQueue(handler, workers=2, key=tvdl.parse_tweet_status_id)
+    job_queue.start()
+    first = job_queue.submit(TWEET_URL, "name")
+    duplicate = job_queue.submit(f"{TWEET_URL}?s=20", "name")
+    other_name = job_queue.submit(TWEET_URL, "other")
+    release.set()
+    job_queue.stop()
+
+    assert duplicate is first
+    assert other_name is not first
+    assert sorted(handled) == sorted([first.id, other_name.id])
+    # Finished jobs no longer absorb new requests
+    assert job_queue.submit(TWEET_URL, "name") is not first
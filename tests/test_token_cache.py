@@ -0,0 +1,127 @@
+"""Test for the token cache (offline)"""
+
+import json
+import time
+
+from src.twitter_video_dl.token_cache import (
+    GuestTokenPool,
+    MainJsCache,
+    TokenCache,
+)
+from src.twitter_video_dl.twitter_video_dl import parse_mainjs
+
+MAINJS_URL = "https://abs.twimg.com/responsive-web/client-web/main.1a2b3c4d.js"
+
+
+def test_token_cache_round_trip(tmp_path):
+    """Test tokens are kept in memory and shared through the cache file"""
+    path = tmp_path / "tokens.json"
+    cache = TokenCache(str(path), ttl=60)
+
+    assert cache.get() is None, "Empty cache should return None"
+
+    cache.put("AAAA-bearer", "12345", "query-id")
+    assert cache.get() == ("AAAA-bearer", "12345", "query-id")
+
+    # A second instance (e.g. another process) reads the same file
+    other = TokenCache(str(path), ttl=60)
+    assert other.get() == ("AAAA-bearer", "12345", "query-id")
+
+
+def test_token_cache_expiry(tmp_path):
+    """Test expired entries are not returned"""
+    path = tmp_path / "tokens.json"
+    path.write_text(
+        json.dumps(
+            {
+                "bearer_token": "AAAA-bearer",
+                "guest_token": "12345",
+                "query_id": "query-id",
+                "created_at": 0,
+            }
+        )
+    )
+    cache = TokenCache(str(path), ttl=60)
+
+    assert cache.get() is None, "Expired entry should not be returned"
+
+
+def test_token_cache_invalidate_only_matching_guest_token(tmp_path):
+    """Test invalidate keeps tokens that were refreshed by someone else"""
+    path = tmp_path / "tokens.json"
+    cache = TokenCache(str(path), ttl=60)
+    cache.put("AAAA-bearer", "new-token", "query-id")
+
+    cache.invalidate("old-token")
+    assert cache.get() == ("AAAA-bearer", "new-token", "query-id")
+
+    cache.invalidate("new-token")
+    assert cache.get() is None
+    assert TokenCache(str(path), ttl=60).get() is None
+
+
+def test_parse_mainjs_extracts_all_query_ids():
+    """Test bearer token and every queryId are extracted from main.js in one pass"""
+    mainjs_text = (
+        'a="AAAAAAAAAAAAAAAAAAAAAbearer%3Dtoken";'
+        '{queryId:"abc-1",operationName:"TweetResultByRestId",operationType:"query"}'
+        '{queryId:"def_2",operationName:"TweetResultsByRestIds",operationType:"query"}'
+    )
+
+    bearer_token, query_ids = parse_mainjs(mainjs_text)
+
+    assert bearer_token == "AAAAAAAAAAAAAAAAAAAAAbearer%3Dtoken"
+    assert query_ids == {
+        "TweetResultByRestId": "abc-1",
+        "TweetResultsByRestIds": "def_2",
+    }
+
+
+def test_mainjs_cache_keyed_by_hash(tmp_path):
+    """Test main.js details are cached by the hash in the main.js filename"""
+    path = tmp_path / "mainjs.json"
+    cache = MainJsCache(str(path), max_entries=2)
+
+    assert cache.get(MAINJS_URL) is None
+    cache.put(MAINJS_URL, "AAAA-bearer", {"TweetResultByRestId": "abc"})
+
+    legacy_url = MAINJS_URL.replace("client-web", "client-web-legacy")
+    other = MainJsCache(str(path))
+    assert other.get(legacy_url) == ("AAAA-bearer", {"TweetResultByRestId": "abc"})
+
+    # Oldest hashes are evicted beyond max_entries
+    cache.put(MAINJS_URL.replace("1a2b3c4d", "hash2"), "b2", {})
+    cache.put(MAINJS_URL.replace("1a2b3c4d", "hash3"), "b3", {})
+    assert cache.get(MAINJS_URL) is None
+
+
+def test_guest_token_pool_least_used_and_retire():
+    """Test guest tokens are handed out least-used first and retired tokens are not reused"""
+    activated = iter(f"guest-{i}" for i in range(100))
+    pool = GuestTokenPool(lambda bearer_token: next(activated), size=1)
+
+    pool.add("bearer", "seed")
+    assert pool.acquire("bearer") == "seed"
+
+    pool.add("bearer", "other")
+    assert pool.acquire("bearer") == "other", "Least-used token should be chosen"
+
+    pool.retire("seed")
+    pool.retire("other")
+    pool.add("bearer", "seed")
+    token = pool.acquire("bearer")
+    assert token not in ("seed", "other"), "Retired tokens should not be handed out"
+
+
+def test_guest_token_pool_refills_in_background():
+    """Test the pool activates tokens in the background up to its size"""
+    activated = iter(f"guest-{i}" for i in range(100))
+    pool = GuestTokenPool(lambda bearer_token: next(activated), size=3)
+
+    pool.acquire("bearer")
+    for _ in range(100):
+        if len(pool) >= 3:
+            break
+        time.sleep(0.01)
+
+    assert len(pool) == 3
@@ -0,0 +1,225 @@
+"""Test for converting GIF videos with ffmpeg, using a stand-in ffmpeg (offline)"""
+
+import os
+import stat
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import src.twitter_video_dl.twitter_video_dl as tvdl
+from src.twitter_video_dl.http_client import HttpClient
+from src.twitter_video_dl.media_store import MediaStore
+from src.twitter_video_dl.progress import Progress
+from src.twitter_video_dl.transcode import TranscodeQueue, stream_to_gif
+
+PAYLOAD = b"mp4 with the index first" * 1000
+# ffmpeg cannot read this one from a pipe, only from a file
+MOOV_LAST = b"mp4 with the index last" * 1000
+
+# Copies its input to the output; fails on MOOV_LAST read from a pipe
+FAKE_FFMPEG = f"""#!{sys.executable}
+import os
+import sys
+import time
+args = sys.argv[1:]
+started = time.monotonic()
+time.sleep(float(os.environ.get("FAKE_FFMPEG_SLEEP", "0")))
+if os.environ.get("FAKE_FFMPEG_LOG"):
+    # The niceness is raised right after the start, so read it afterwards
+    with open(os.environ["FAKE_FFMPEG_LOG"], "a") as f:
+        f.write(f"{{started}} {{os.nice(0)}} {{sys.stdin.read()!r}}\\n")
+source = args[args.index("-i") + 1]
+if source == "pipe:0":
+    data = sys.stdin.buffer.read()
+    if data.startswith(b"mp4 with the index last"):
+        sys.exit(1)
+else:
+    with open(source, "rb") as f:
+        data = f.read()
+with open(args[-1], "wb") as f:
+    f.write(b"GIF" + data)
+"""
+
+
+class VideoHandler(BaseHTTPRequestHandler):
+    etag = '"v1"'
+    gets = []
+
+    def send_head(self):
+        body = {"/video.mp4": PAYLOAD, "/moov_last.mp4": MOOV_LAST}.get(self.path)
+        if body is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif self.headers.get("If-None-Match") == self.etag:
+            self.send_response(304)
+            self.end_headers()
+        else:
+            # No Range support: downloads are a single stream
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", self.etag)
+            self.end_headers()
+        return body
+
+    def do_GET(self):
+        self.gets.append(self.path)
+        body = self.send_head()
+        if body is not None:
+            self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.send_head()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server(mocker, monkeypatch, tmp_path):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    ffmpeg = bin_dir / "ffmpeg"
+    ffmpeg.write_text(FAKE_FFMPEG)
+    ffmpeg.chmod(ffmpeg.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+
+    mocker.patch.object(tvdl, "convert_gif_flag", True)
+    mocker.patch.object(tvdl, "gif_pipe", True)
+    mocker.patch.object(
+        tvdl, "media_store", MediaStore(str(tmp_path / "store"), 0, enabled=False)
+    )
+
+    VideoHandler.etag = '"v1"'
+    VideoHandler.gets = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), VideoHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_stream_to_gif_writes_only_the_gif(server, tmp_path):
+    """Test the body is piped into ffmpeg and only the final GIF is written"""
+    gif = tmp_path / "out" / "video.gif"
+    gif.parent.mkdir()
+    progress = Progress()
+
+    status_code = stream_to_gif(
+        HttpClient(), f"{server}/video.mp4", str(gif), progress=progress
+    )
+
+    assert status_code == 200
+    assert gif.read_bytes() == b"GIF" + PAYLOAD
+    assert os.listdir(gif.parent) == ["video.gif"]
+    assert progress.bytes_total == progress.bytes_done == len(PAYLOAD)
+
+
+def test_stream_to_gif_reports_http_errors(server, tmp_path):
+    """Test a failed request returns its status code without a file"""
+    gif = tmp_path / "video.gif"
+
+    assert stream_to_gif(HttpClient(), f"{server}/missing.mp4", str(gif)) == 404
+    assert not gif.exists()
+
+
+def test_download_video_file_pipe_mode(server, tmp_path):
+    """Test a GIF video is converted without an mp4 on disk"""
+    filename = tmp_path / "tweet"
+
+    tvdl.download_video_file(f"{server}/video.mp4", str(filename), True)
+
+    assert (tmp_path / "tweet.gif").read_bytes() == b"GIF" + PAYLOAD
+    assert not (tmp_path / "tweet.mp4").exists()
+
+
+def test_download_video_file_falls_back_to_file(server, tmp_path):
+    """Test an mp4 ffmpeg cannot read from a pipe is converted from a file"""
+    filename = tmp_path / "tweet"
+
+    future = tvdl.download_video_file(f"{server}/moov_last.mp4", str(filename), True)
+    assert future.result() is True
+
+    assert (tmp_path / "tweet.gif").read_bytes() == b"GIF" + MOOV_LAST
+    assert not (tmp_path / "tweet.mp4").exists()
+    assert not (tmp_path / "tweet.gif.part").exists()
+
+
+def test_download_video_file_queues_conversion(server, mocker, tmp_path):
+    """Test the file conversion runs on the transcode queue, not in the download"""
+    mocker.patch.object(tvdl, "gif_pipe", False)
+    filename = tmp_path / "tweet"
+
+    future = tvdl.download_video_file(f"{server}/video.mp4", str(filename), True)
+
+    assert isinstance(future, Future)
+    assert future.result() is True
+    assert (tmp_path / "tweet.gif").read_bytes() == b"GIF" + PAYLOAD
+    assert not (tmp_path / "tweet.mp4").exists()
+
+
+@pytest.mark.parametrize("pipe", [True, False])
+def test_verify_skips_unchanged_gif(server, mocker, tmp_path, pipe):
+    """Test a converted GIF is recorded under its mp4 and skipped until the mp4 changes"""
+    mocker.patch.object(tvdl, "gif_pipe", pipe)
+    mocker.patch.dict(tvdl.download_settings, {"existing_files": "verify"})
+    mocker.patch.object(tvdl, "manifest_locks", str(tmp_path / "locks"))
+    filename = tmp_path / "out" / "tweet"
+    filename.parent.mkdir()
+    url = f"{server}/video.mp4"
+
+    future = tvdl.download_video_file(url, str(filename), True)
+    if future is not None:
+        future.result()
+    assert tvdl.download_video_file(url, str(filename), True) is None
+    assert VideoHandler.gets == ["/video.mp4"]
+    assert sorted(os.listdir(filename.parent)) == [
+        ".twitter-video-dl.json",
+        "tweet.gif",
+    ]
+
+    VideoHandler.etag = '"v2"'
+    future = tvdl.download_video_file(url, str(filename), True)
+    if future is not None:
+        future.result()
+    assert VideoHandler.gets == ["/video.mp4"] * 2
+
+
+def test_transcode_queue_limits_concurrency(server, monkeypatch, tmp_path):
+    """Test at most max_workers ffmpeg processes run, niced, with callbacks"""
+    log = tmp_path / "ffmpeg.log"
+    monkeypatch.setenv("FAKE_FFMPEG_LOG", str(log))
+    monkeypatch.setenv("FAKE_FFMPEG_SLEEP", "0.3")
+    queue = TranscodeQueue(max_workers=2, nice=5)
+    done = []
+
+    start = time.perf_counter()
+    futures = []
+    for i in range(4):
+        mp4 = tmp_path / f"{i}.mp4"
+        mp4.write_bytes(PAYLOAD)
+        futures.append(queue.submit(str(mp4), str(tmp_path / f"{i}.gif"), done.append))
+    assert all(future.result() for future in futures)
+    elapsed = time.perf_counter() - start
+    queue.shutdown()
+
+    assert done == [True] * 4
+    assert elapsed >= 0.6, "Only two conversions may run at a time"
+    lines = [line.split() for line in log.read_text().splitlines()]
+    assert all(int(nice) >= 5 for _, nice, _ in lines)
+    # No terminal input reaches ffmpeg
+    assert all(stdin == "''" for _, _, stdin in lines)
+
+
+def test_run_media_jobs_hands_conversions_to_the_caller():
+    """Test queued conversions are collected instead of awaited"""
+    conversion = Future()
+    conversions = []
+
+    tvdl.run_media_jobs([lambda: conversion, lambda: None], conversions)
+
+    assert conversions == [conversion]
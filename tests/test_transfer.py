@@ -0,0 +1,413 @@
+"""Test for the segment downloader against a local HTTP server (offline)"""
+
+import io
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.twitter_video_dl.http_client import HttpClient
+from src.twitter_video_dl.progress import Progress
+from src.twitter_video_dl.transfer import (
+    copy_body,
+    download_ranged,
+    download_segments,
+    split_ranges,
+)
+
+SEGMENTS = [bytes([i]) * (1000 + i) for i in range(20)]
+PAYLOAD = bytes(range(256)) * 4096
+
+
+class SegmentHandler(BaseHTTPRequestHandler):
+    failed_once = set()
+    lock = threading.Lock()
+
+    def do_GET(self):
+        index = int(self.path.rsplit("/", 1)[1].split(".")[0])
+
+        # /flaky/<n>.m4s fails on the first request
+        if self.path.startswith("/flaky/"):
+            with self.lock:
+                first = index not in self.failed_once
+                self.failed_once.add(index)
+            if first:
+                self.send_response(503)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+        if self.path.startswith("/missing/"):
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        # Finish out of order
+        time.sleep(random.uniform(0, 0.02))
+        body = SEGMENTS[index]
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    # /plain/... does not advertise Range support, /broken/... fails every range
+    protocol_version = "HTTP/1.1"
+    range_requests = []
+    etag = '"v1"'
+    # Send only half of each range, then drop the connection
+    truncate = False
+
+    def send_head(self):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(PAYLOAD)))
+        self.send_header("ETag", self.etag)
+        if not self.path.startswith("/plain/"):
+            self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+
+    def do_HEAD(self):
+        self.send_head()
+
+    def do_GET(self):
+        range_header = self.headers.get("Range")
+        if range_header is None:
+            self.send_head()
+            self.wfile.write(PAYLOAD)
+            return
+
+        self.range_requests.append(range_header)
+        if self.path.startswith("/broken/"):
+            self.send_response(500)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        start, end = (int(x) for x in range_header[len("bytes=") :].split("-"))
+        body = PAYLOAD[start : end + 1]
+        self.send_response(206)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Content-Range", f"bytes {start}-{end}/{len(PAYLOAD)}")
+        self.end_headers()
+        if self.truncate:
+            self.wfile.write(body[: len(body) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(handler):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def segment_server():
+    yield from serve(SegmentHandler)
+
+
+@pytest.fixture
+def range_server():
+    RangeHandler.range_requests.clear()
+    RangeHandler.etag = '"v1"'
+    RangeHandler.truncate = False
+    yield from serve(RangeHandler)
+
+
+def test_segments_written_in_order(segment_server, tmp_path):
+    """Test segments fetched concurrently are written in playlist order"""
+    urls = [f"{segment_server}/seg/{i}.m4s" for i in range(len(SEGMENTS))]
+    output = tmp_path / "video.mp4"
+
+    progress = Progress()
+
+    # A tiny buffer cap still has to make progress
+    stats = download_segments(
+        HttpClient(),
+        urls,
+        str(output),
+        concurrency=4,
+        max_buffer_bytes=1,
+        progress=progress,
+    )
+
+    assert output.read_bytes() == b"".join(SEGMENTS)
+    assert progress.bytes_total == progress.bytes_done == output.stat().st_size
+    assert [stat["bytes"] for stat in stats] == [len(s) for s in SEGMENTS]
+    assert all(stat["attempts"] == 1 for stat in stats)
+
+
+def test_failed_segment_is_retried(segment_server, tmp_path):
+    """Test a segment failing once is retried and counted"""
+    urls = [f"{segment_server}/flaky/{i}.m4s" for i in range(3)]
+    output = tmp_path / "video.mp4"
+
+    stats = download_segments(HttpClient(), urls, str(output), retries=1)
+
+    assert output.read_bytes() == b"".join(SEGMENTS[:3])
+    assert all(stat["attempts"] == 2 for stat in stats)
+
+
+def test_missing_segment_removes_partial_file(segment_server, tmp_path):
+    """Test a segment failing every attempt aborts without a partial file"""
+    urls = [f"{segment_server}/seg/0.m4s", f"{segment_server}/missing/1.m4s"]
+    output = tmp_path / "video.mp4"
+
+    with pytest.raises(AssertionError):
+        download_segments(HttpClient(), urls, str(output), retries=0)
+
+    assert not output.exists()
+
+
+def test_split_ranges_covers_every_byte():
+    """Test ranges are contiguous, inclusive and cover the whole file"""
+    assert split_ranges(10, 3) == [(0, 3), (4, 7), (8, 9)]
+    assert split_ranges(8, 2) == [(0, 3), (4, 7)]
+
+
+def test_ranged_download(range_server, tmp_path):
+    """Test a file is fetched over parallel ranges and reassembled"""
+    output = tmp_path / "video.mp4"
+
+    status_code = download_ranged(
+        HttpClient(),
+        f"{range_server}/video.mp4",
+        str(output),
+        connections=4,
+        min_part_bytes=64 * 1024,
+    )
+
+    assert status_code == 200
+    assert output.read_bytes() == PAYLOAD
+    assert len(RangeHandler.range_requests) == 4
+
+
+def test_ranged_downloads_reuse_sessions(range_server, tmp_path):
+    """Test later downloads run on the threads (and sessions) of earlier ones"""
+    sessions = []
+
+    class CountingClient(HttpClient):
+        def new_session(self):
+            sessions.append(threading.current_thread().name)
+            return super().new_session()
+
+    client = CountingClient()
+    for i in range(3):
+        download_ranged(
+            client,
+            f"{range_server}/video.mp4",
+            str(tmp_path / f"video{i}.mp4"),
+            connections=4,
+            min_part_bytes=64 * 1024,
+        )
+
+    # One for the HEAD requests, at most one per range thread
+    assert len(sessions) <= 5
+
+
+@pytest.mark.parametrize("path", ["video.mp4", "plain/video.mp4"])
+def test_download_reports_progress(range_server, tmp_path, path):
+    """Test ranged and single-stream downloads report their size and bytes"""
+    progress = Progress()
+
+    download_ranged(
+        HttpClient(),
+        f"{range_server}/{path}",
+        str(tmp_path / "video.mp4"),
+        min_part_bytes=64 * 1024,
+        progress=progress,
+    )
+
+    snapshot = progress.snapshot()
+    assert snapshot["bytes_total"] == snapshot["bytes_done"] == len(PAYLOAD)
+    assert snapshot["throughput"] > 0
+
+
+def test_ranged_download_falls_back_to_single_stream(range_server, tmp_path):
+    """Test servers without Range support get one plain GET"""
+    output = tmp_path / "video.mp4"
+
+    status_code = download_ranged(
+        HttpClient(), f"{range_server}/plain/video.mp4", str(output)
+    )
+
+    assert status_code == 200
+    assert output.read_bytes() == PAYLOAD
+    assert RangeHandler.range_requests == []
+
+
+def test_small_file_is_downloaded_over_a_single_stream(range_server, tmp_path):
+    """Test a file smaller than two parts gets one plain GET and no sidecar"""
+    output = tmp_path / "image.jpg"
+
+    status_code = download_ranged(
+        HttpClient(),
+        f"{range_server}/image.jpg",
+        str(output),
+        min_part_bytes=len(PAYLOAD),
+    )
+
+    assert status_code == 200
+    assert output.read_bytes() == PAYLOAD
+    assert RangeHandler.range_requests == []
+    assert os.listdir(tmp_path) == ["image.jpg"]
+
+
+def test_failed_range_keeps_part_file(range_server, tmp_path):
+    """Test a range failing every attempt leaves only the .part file and sidecar"""
+    output = tmp_path / "video.mp4"
+
+    with pytest.raises(AssertionError):
+        download_ranged(
+            HttpClient(),
+            f"{range_server}/broken/video.mp4",
+            str(output),
+            min_part_bytes=64 * 1024,
+            retries=0,
+        )
+
+    assert not output.exists()
+    assert (tmp_path / "video.mp4.part").exists()
+    state = json.loads((tmp_path / "video.mp4.part.json").read_text())
+    assert state["validator"] == '"v1"'
+
+
+def interrupted_download(range_server, output):
+    RangeHandler.truncate = True
+    with pytest.raises(Exception):
+        download_ranged(
+            HttpClient(),
+            f"{range_server}/video.mp4",
+            str(output),
+            connections=2,
+            min_part_bytes=64 * 1024,
+            retries=0,
+        )
+    RangeHandler.truncate = False
+    RangeHandler.range_requests.clear()
+
+
+def test_interrupted_download_is_resumed(range_server, tmp_path):
+    """Test a later run continues each range from the bytes already written"""
+    output = tmp_path / "video.mp4"
+    interrupted_download(range_server, output)
+
+    state = json.loads((tmp_path / "video.mp4.part.json").read_text())
+    done = [span[2] for span in state["ranges"]]
+    assert done != [span[0] for span in state["ranges"]], "Progress should be saved"
+
+    status_code = download_ranged(
+        HttpClient(), f"{range_server}/video.mp4", str(output)
+    )
+
+    assert status_code == 200
+    assert output.read_bytes() == PAYLOAD
+    assert sorted(RangeHandler.range_requests) == sorted(
+        f"bytes={span[2]}-{span[1]}" for span in state["ranges"]
+    )
+    assert not (tmp_path / "video.mp4.part").exists()
+    assert not (tmp_path / "video.mp4.part.json").exists()
+
+
+def test_changed_file_is_downloaded_from_scratch(range_server, tmp_path):
+    """Test a partial download is discarded when the ETag changed"""
+    output = tmp_path / "video.mp4"
+    interrupted_download(range_server, output)
+
+    RangeHandler.etag = '"v2"'
+    status_code = download_ranged(
+        HttpClient(),
+        f"{range_server}/video.mp4",
+        str(output),
+        min_part_bytes=64 * 1024,
+    )
+
+    assert status_code == 200
+    assert output.read_bytes() == PAYLOAD
+    # The parts are requested concurrently, in no particular order
+    assert any(r.startswith("bytes=0-") for r in RangeHandler.range_requests)
+
+
+def test_changed_small_file_drops_the_sidecar(range_server, tmp_path):
+    """Test a small file whose partial download is outdated starts over as a stream"""
+    output = tmp_path / "video.mp4"
+    interrupted_download(range_server, output)
+
+    RangeHandler.etag = '"v2"'
+    RangeHandler.range_requests.clear()
+    status_code = download_ranged(
+        HttpClient(), f"{range_server}/video.mp4", str(output)
+    )
+
+    assert status_code == 200
+    assert output.read_bytes() == PAYLOAD
+    assert RangeHandler.range_requests == []
+    assert os.listdir(tmp_path) == ["video.mp4"]
+
+
+class FakeResponse:
+    def __init__(self, body, chunk_size=None):
+        self.headers = {}
+        self.body = body
+        if chunk_size is None:
+            self.raw = io.BytesIO(body)
+        self.chunk_size = chunk_size
+
+    def iter_content(self, chunk_size=None):
+        for start in range(0, len(self.body), self.chunk_size):
+            yield self.body[start : start + self.chunk_size]
+
+
+@pytest.mark.parametrize("chunk_size", [None, 1000, 16 * 1024])
+def test_copy_body(tmp_path, chunk_size):
+    """Test bodies read with readinto or coalesced from chunks are written intact"""
+    path = tmp_path / "out.bin"
+    writes = []
+
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT)
+    try:
+        total = copy_body(
+            FakeResponse(PAYLOAD, chunk_size),
+            fd,
+            on_write=writes.append,
+            min_chunk=4096,
+            max_chunk=64 * 1024,
+        )
+    finally:
+        os.close(fd)
+
+    assert total == len(PAYLOAD)
+    assert path.read_bytes() == PAYLOAD
+    # Few large writes: the buffer grows to max_chunk
+    assert max(writes) == 64 * 1024
+    assert len(writes) < len(PAYLOAD) // (16 * 1024)
+
+
+def test_copy_body_at_offset(tmp_path):
+    """Test writes at an offset leave the rest of the file untouched"""
+    path = tmp_path / "out.bin"
+    path.write_bytes(b"x" * 10)
+
+    fd = os.open(path, os.O_WRONLY)
+    try:
+        copy_body(FakeResponse(b"abc", chunk_size=1), fd, offset=4)
+    finally:
+        os.close(fd)
+
+    assert path.read_bytes() == b"xxxxabcxxx"
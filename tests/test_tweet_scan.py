@@ -0,0 +1,104 @@
+"""Test for the single-pass GraphQL response scan (offline)"""
+
+import json
+
+from src.twitter_video_dl.tweet_scan import scan_tweet_json
+from src.twitter_video_dl.twitter_video_dl import (
+    extract_mp4s,
+    get_associated_media_id,
+    repost_check,
+)
+
+TWEET_URL = "https://x.com/user/status/100"
+VIDEO = "https://video.twimg.com/ext_tw_video/200/pu"
+
+
+def make_media(status_id, media_id, source_status_id=None):
+    media = {
+        "expanded_url": f"https://x.com/user/status/{status_id}/video/1",
+        "id_str": media_id,
+        "type": "video",
+        "video_info": {
+            "variants": [
+                {"url": f"{VIDEO}/pl/{media_id}.m3u8?tag=12&container=fmp4"},
+                {"url": f"{VIDEO}/vid/480x270/{media_id}.mp4?tag=12"},
+                {"url": f"{VIDEO}/vid/1280x720/{media_id}.mp4?tag=12"},
+            ]
+        },
+    }
+    if source_status_id:
+        media["source_status_id_str"] = source_status_id
+    return media
+
+
+def make_response(main_media, reply_media):
+    return {
+        "entries": [
+            {"entryId": "tweet-100", "media": main_media},
+            {"entryId": "conversationthread-101", "media": reply_media},
+        ]
+    }
+
+
+def test_extract_mp4s_highest_resolution_per_media():
+    """Test the highest resolution mp4 is kept and matched by the media id"""
+    response = make_response([make_media("100", "200")], [])
+
+    assert get_associated_media_id(response, TWEET_URL) == "200"
+    assert extract_mp4s(response, TWEET_URL) == [
+        f"{VIDEO}/vid/1280x720/200.mp4?tag=12",
+        f"{VIDEO}/pl/200.m3u8?tag=12&container=fmp4",
+    ]
+
+
+def test_text_and_parsed_input_give_the_same_result():
+    """Test raw text (with any whitespace) and parsed JSON are scanned alike"""
+    response = make_response([make_media("100", "200")], [])
+    text = json.dumps(response, indent=2)
+
+    assert extract_mp4s(text, TWEET_URL, True) == extract_mp4s(
+        response, TWEET_URL, True
+    )
+
+
+def test_text_scan_matches_the_walk():
+    """Test the text scan finds the same urls, reposts and reply cutoff as the walk"""
+    reply_repost = make_media("301", "201", source_status_id="301")
+    response = make_response([make_media("100", "200")], [reply_repost])
+    # Escaped slashes are valid JSON too
+    text = json.dumps(response).replace("/", "\\/")
+
+    from_text = scan_tweet_json(text)
+    from_json = scan_tweet_json(response)
+    for name in ("mp4_matches", "container_urls", "media_links", "expanded_urls"):
+        assert getattr(from_text, name) == getattr(from_json, name)
+    assert from_text.source_status_ids == [("301", True)]
+    assert from_json.source_status_ids == [("301", True)]
+
+
+def test_tweet_video_fallback():
+    """Test GIF urls (tweet_video) are returned when there is no other mp4"""
+    url = "https://video.twimg.com/tweet_video/Fvh6brqWAAQhU9p.mp4"
+    response = {"media": [{"video_info": {"variants": [{"url": url}]}}]}
+
+    assert extract_mp4s(response, TWEET_URL) == [url]
+
+
+def test_repost_check_ignores_replies():
+    """Test reposts in replies are ignored unless replies are included"""
+    reply_repost = make_media("301", "201", source_status_id="301")
+    response = make_response([make_media("100", "200")], [reply_repost])
+    scan = scan_tweet_json(response)
+
+    assert repost_check(scan) is None
+    assert repost_check(scan, exclude_replies=False) == [
+        "https://x.com/user/status/301/video/1"
+    ]
+
+
+def test_repost_check_finds_original_tweet():
+    """Test the original tweet url of a reposted video is returned"""
+    repost = make_media("300", "200", source_status_id="300")
+    response = make_response([repost], [])
+
+    assert repost_check(response) == "https://x.com/user/status/300/video/1"
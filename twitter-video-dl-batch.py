@@ -0,0 +1,60 @@
+import argparse
+
+import src.twitter_video_dl.twitter_video_dl as tvdl
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Download videos from a list of twitter urls and save them as local mp4 files."
+    )
+
+    parser.add_argument(
+        "url_list",
+        type=str,
+        help="Text file with one twitter URL per line, optionally followed by a file name.  e.g. https://x.com/tw_7rikazhexde/status/1710868951109124552 test",
+    )
+
+    parser.add_argument(
+        "--output",
+        type=str,
+        default="./output",
+        help="Folder to save the videos to.  Defaults to ./output",
+    )
+
+    parser.add_argument(
+        "--existing",
+        choices=["ask", "verify", "overwrite"],
+        default=None,
+        help='What to do with files that already exist.  "verify" re-downloads only media that changed on the server.  Defaults to "existing_files" in settings.json',
+    )
+
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help='Record the list as jobs in the cache directory (one batch-<hash>.sqlite3 per list file): failed entries are retried, and running the same list again after an interruption only downloads what is not done yet.  Jobs never ask about existing files: they are verified unless --existing is "overwrite"',
+    )
+
+    args = parser.parse_args()
+
+    if args.resume and args.existing == "ask":
+        parser.error(
+            "--resume cannot ask about existing files; use --existing verify or overwrite"
+        )
+
+    if args.existing is not None:
+        tvdl.download_settings["existing_files"] = args.existing
+
+    entries = []
+    with open(args.url_list, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            tweet_url, _, file_name = line.partition(" ")
+            entries.append((tweet_url, file_name.strip()))
+
+    job_store = (
+        tvdl.open_job_store(tvdl.batch_store_name(args.url_list))
+        if args.resume
+        else None
+    )
+    tvdl.download_video_for_sc_batch(entries, args.output, job_store=job_store)
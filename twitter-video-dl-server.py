@@ -1,24 +1,105 @@
-from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from urllib.parse import parse_qs, urlparse
 
 import src.twitter_video_dl.twitter_video_dl as tvdl
+from src.twitter_video_dl.jobs import JobQueue
+from src.twitter_video_dl.metrics import CONTENT_TYPE
 
 DCEBUG_MODE = False
 
 
+# Downloads run here, so a request is answered as soon as it is queued.
+# The same tweet sent again under the same name while in flight joins the running job.
+# With the job store the queue survives restarts and failed downloads are retried.
+job_queue = JobQueue(
+    tvdl.run_download_job,
+    workers=tvdl.server_settings["workers"],
+    key=tvdl.parse_tweet_status_id,
+    store=(
+        tvdl.open_job_store("jobs.sqlite3")
+        if tvdl.job_store_settings["enabled"]
+        else None
+    ),
+    lease_seconds=tvdl.job_store_settings["lease_seconds"],
+)
+
+# Read when /metrics is requested
+tvdl.metrics.gauge(
+    "tvdl_jobs_in_flight", "Jobs a worker is working on", lambda: job_queue.running()
+)
+tvdl.metrics.gauge(
+    "tvdl_job_queue_depth", "Jobs waiting for a worker", lambda: job_queue.depth()
+)
+
+
 class RequestHandler(BaseHTTPRequestHandler):
+    def send_json(self, status, obj):
+        body = json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header("Content-type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_events(self, job):
+        """Stream the job state as server-sent events until the job has finished."""
+        self.send_response(200)
+        self.send_header("Content-type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        try:
+            while not job.finished:
+                self.write_event("progress", job.to_dict())
+                time.sleep(tvdl.server_settings["events_interval_seconds"])
+                # Queued jobs are re-read from the job store
+                job = job_queue.get(job.id) or job
+            self.write_event("end", job.to_dict())
+        except (BrokenPipeError, ConnectionResetError):
+            # The client went away
+            pass
+
+    def write_event(self, event, obj):
+        self.wfile.write(f"event: {event}\ndata: {json.dumps(obj)}\n\n".encode())
+        self.wfile.flush()
+
+    def send_job(self, path):
+        # /jobs/<id> and /jobs/<id>/events
+        parts = path.strip("/").split("/")
+        job = job_queue.get(parts[1]) if len(parts) in (2, 3) else None
+        if job is None or (len(parts) == 3 and parts[2] != "events"):
+            self.send_json(404, {"error": "Unknown job"})
+        elif len(parts) == 2:
+            self.send_json(200, job.to_dict())
+        else:
+            self.send_events(job)
+
+    def send_metrics(self):
+        body = tvdl.metrics.render().encode()
+        self.send_response(200)
+        self.send_header("Content-type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
     def do_GET(self):
-        query = urlparse(self.path).query
+        parsed = urlparse(self.path)
+        if parsed.path == "/metrics":
+            self.send_metrics()
+            return
+        if parsed.path.startswith("/jobs/"):
+            self.send_job(parsed.path)
+            return
+
+        query = parsed.query
         params = parse_qs(query)
         url = params.get("url", [""])[0]
         fileName = params.get("fileName", [""])[0]
         if url:
             fileName = fileName.replace(" ", "_").replace("　", "_").replace("/", "-")
-            tvdl.download_video_for_sc(url, fileName)
-            self.send_response(200)
-            self.send_header("Content-type", "text/html")
-            self.end_headers()
-            self.wfile.write(b"URL received")
+            job = job_queue.submit(url, fileName)
+            self.send_json(202, {"job_id": job.id, "status": job.status})
         else:
             self.send_response(200)
             self.send_header("Content-type", "text/html")
@@ -31,10 +112,11 @@ class RequestHandler(BaseHTTPRequestHandler):
             super().log_message(format, *args)
 
 
-def run(server_class=HTTPServer, handler_class=RequestHandler, port=3000):
+def run(server_class=ThreadingHTTPServer, handler_class=RequestHandler, port=3000):
     server_address = ("", port)
     httpd = server_class(server_address, handler_class)
-    print(f"Starting server on port {port}")
+    job_queue.start()
+    print(f"Starting server on port {port} ({job_queue.workers} download workers)")
     httpd.serve_forever()
 
 